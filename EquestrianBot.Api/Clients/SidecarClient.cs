@@ -1,4 +1,6 @@
 using System.Net.Http.Json;
+using System.Runtime.CompilerServices;
+using System.Text.Json;
 using EquestrianBot.Api.Models;
 
 namespace EquestrianBot.Api.Clients;
@@ -24,17 +26,104 @@ public sealed class SidecarClient
             Answer = dto.answer ?? "I don’t know.",
             StrategyUsed = dto.strategy ?? "rag",
             LatencyMs = dto.latency_ms,
-            Sources = dto.context?.Select(c => new BotResponse.SourceCitation
+            Sources = ToSources(dto.context)
+        };
+    }
+
+    /// <summary>
+    /// Streams /query/stream: one Context event once retrieval finishes, Token events as
+    /// the answer is generated, then a Done event carrying the full BotResponse.
+    /// </summary>
+    public async IAsyncEnumerable<BotStreamEvent> QueryRagStreamAsync(string tenantId, string query, int topK = 4,
+        [EnumeratorCancellation] CancellationToken ct = default)
+    {
+        var payload = new { tenant_id = tenantId, query = query, top_k = topK };
+
+        using var req = new HttpRequestMessage(HttpMethod.Post, "/query/stream") { Content = JsonContent.Create(payload) };
+        using var resp = await _http.SendAsync(req, HttpCompletionOption.ResponseHeadersRead, ct);
+        resp.EnsureSuccessStatusCode();
+
+        await using var body = await resp.Content.ReadAsStreamAsync(ct);
+        using var reader = new StreamReader(body);
+
+        List<BotResponse.SourceCitation> sources = new();
+        string? line;
+        while ((line = await reader.ReadLineAsync(ct)) is not null)
+        {
+            if (string.IsNullOrWhiteSpace(line)) continue;
+            var ev = JsonSerializer.Deserialize<SidecarStreamEvent>(line);
+            if (ev is null) continue;
+
+            switch (ev.type)
             {
-                Id = c.id,
-                Title = c.title,
-                Url = c.url,
-                Score = c.score,
-                Attributes = c.attributes
-            }).ToList() ?? new()
+                case "context":
+                    sources = ToSources(ev.context);
+                    yield return new BotStreamEvent { Kind = BotStreamEvent.EventKind.Context, Sources = sources };
+                    break;
+                case "token":
+                    yield return new BotStreamEvent { Kind = BotStreamEvent.EventKind.Token, Text = ev.text ?? "" };
+                    break;
+                case "done":
+                    yield return new BotStreamEvent
+                    {
+                        Kind = BotStreamEvent.EventKind.Done,
+                        Response = new BotResponse
+                        {
+                            Answer = ev.answer ?? "I don’t know.",
+                            StrategyUsed = ev.strategy ?? "rag",
+                            LatencyMs = ev.latency_ms,
+                            TtftMs = ev.ttft_ms,
+                            Sources = sources
+                        }
+                    };
+                    yield break;
+                case "error":
+                    throw new InvalidOperationException($"Sidecar stream failed: {ev.error}\n{ev.detail}");
+            }
+        }
+
+        throw new InvalidOperationException("Sidecar stream ended without a result");
+    }
+
+    /// <summary>
+    /// Answers many queries with one /query/batch call. Results come back in request order;
+    /// a failed item has <see cref="BotResponse.Error"/> set instead of failing the batch.
+    /// </summary>
+    public async Task<List<BotResponse>> QueryRagBatchAsync(IReadOnlyList<BotRequest> items, int topK = 4,
+        bool useCache = true, CancellationToken ct = default)
+    {
+        var payload = new
+        {
+            items = items.Select(i => new { tenant_id = i.TenantId, query = i.Query, top_k = topK, filters = i.Filters }),
+            use_cache = useCache
         };
+
+        using var resp = await _http.PostAsJsonAsync("/query/batch", payload, ct);
+        resp.EnsureSuccessStatusCode();
+
+        var dto = await resp.Content.ReadFromJsonAsync<SidecarBatchResponse>(cancellationToken: ct)
+                  ?? throw new InvalidOperationException("Sidecar returned empty body");
+
+        return dto.results?.Select(r => new BotResponse
+        {
+            Answer = r.answer ?? "",
+            StrategyUsed = r.strategy ?? "rag",
+            LatencyMs = dto.latency_ms,
+            Error = r.error,
+            Sources = ToSources(r.context)
+        }).ToList() ?? new();
     }
 
+    private static List<BotResponse.SourceCitation> ToSources(List<SidecarQueryResponse.ContextDoc>? context)
+        => context?.Select(c => new BotResponse.SourceCitation
+        {
+            Id = c.id,
+            Title = c.title,
+            Url = c.url,
+            Score = c.score,
+            Attributes = c.attributes
+        }).ToList() ?? new();
+
     public async Task<IngestResponse> IngestAsync(IngestRequest req, CancellationToken ct = default)
     {
         var payload = new
@@ -78,6 +167,34 @@ public sealed class SidecarClient
             public Dictionary<string, object>? attributes { get; init; }
         }
     }
+
+    private sealed class SidecarBatchResponse
+    {
+        public List<SidecarBatchItem>? results { get; init; }
+        public long latency_ms { get; init; }
+    }
+
+    private sealed class SidecarBatchItem
+    {
+        public string? answer { get; init; }
+        public string? strategy { get; init; }
+        public string? error { get; init; }
+        public List<SidecarQueryResponse.ContextDoc>? context { get; init; }
+    }
+
+    private sealed class SidecarStreamEvent
+    {
+        public string? type { get; init; }
+        public string? text { get; init; }
+        public string? answer { get; init; }
+        public string? strategy { get; init; }
+        public long latency_ms { get; init; }
+        public long? ttft_ms { get; init; }
+        public List<SidecarQueryResponse.ContextDoc>? context { get; init; }
+        public string? error { get; init; }
+        public string? detail { get; init; }
+    }
+
     public async Task DeleteTenantAsync(string tenantId, CancellationToken ct = default)
     {
         using var resp = await _http.DeleteAsync($"/delete/{tenantId}", ct);
@@ -1,4 +1,6 @@
-﻿using Microsoft.AspNetCore.Mvc;
+﻿using EquestrianBot.Api.Clients;
+using EquestrianBot.Api.Models;
+using Microsoft.AspNetCore.Mvc;
 using System.Net.Http.Json;
 
 namespace EquestrianBot.Api.Controllers;
@@ -21,7 +23,7 @@ public class BotController : ControllerBase
             return BadRequest("Missing tenantId or query.");
 
         var sidecar = _httpClientFactory.CreateClient("Sidecar");
-        var payload = new { tenant_id = req.tenantId, query = req.query, top_k = 3 };
+        var payload = new { tenant_id = req.tenantId, query = req.query, top_k = 3, filters = req.filters };
         var resp = await sidecar.PostAsJsonAsync("/query", payload, ct);
         if (!resp.IsSuccessStatusCode)
         {
@@ -32,7 +34,34 @@ public class BotController : ControllerBase
         return Ok(new BotResp { answer = dto.answer ?? "I don’t know." });
     }
 
-    public class BotReq { public string tenantId { get; set; } = ""; public string query { get; set; } = ""; }
+    // many queries in one round trip: the sidecar embeds, searches and generates them together
+    [HttpPost("batch")]
+    public async Task<ActionResult<List<BotResponse>>> PostBatch([FromBody] BotBatchReq req, CancellationToken ct)
+    {
+        if (req.items is null || req.items.Count == 0)
+            return BadRequest("Missing items.");
+
+        // a whole batch is generated before the sidecar replies, so use the long-timeout client
+        var sidecar = new SidecarClient(_httpClientFactory.CreateClient("SidecarBulk"));
+        var items = req.items.Select(i => new BotRequest { TenantId = i.tenantId, Query = i.query, Filters = i.filters }).ToList();
+        try
+        {
+            return Ok(await sidecar.QueryRagBatchAsync(items, topK: 3, useCache: req.useCache, ct: ct));
+        }
+        catch (HttpRequestException e) when (e.StatusCode is not null)
+        {
+            return StatusCode((int)e.StatusCode, new { error = "sidecar_query_failed" });
+        }
+    }
+
+    public class BotReq
+    {
+        public string tenantId { get; set; } = "";
+        public string query { get; set; } = "";
+        // optional metadata filters, passed through to the sidecar as-is (see "Metadata filters" in the README)
+        public System.Text.Json.JsonElement? filters { get; set; }
+    }
     public class BotResp { public string answer { get; set; } = ""; }
     private class SideResp { public string? answer { get; set; } }
+    public class BotBatchReq { public List<BotReq> items { get; set; } = new(); public bool useCache { get; set; } = true; }
 }
@@ -1,4 +1,5 @@
 using Microsoft.AspNetCore.Mvc;
+using System.Net.Http.Headers;
 using System.Net.Http.Json;
 
 namespace EquestrianBot.Api.Controllers;
@@ -51,6 +52,53 @@ public class IngestController : ControllerBase
         return Ok(new { status = "deleted" });
     }
 
+    // stream a large NDJSON/CSV file straight through to the sidecar, which ingests it as a background job
+    [HttpPost("bulk/{tenantId}")]
+    [DisableRequestSizeLimit]
+    public async Task<IActionResult> Bulk(string tenantId, [FromQuery] string datasetType = "faq", [FromQuery] string? format = null, CancellationToken ct = default)
+    {
+        var sidecar = _httpClientFactory.CreateClient("SidecarBulk");
+        var url = $"/ingest/bulk?tenant_id={Uri.EscapeDataString(tenantId)}&dataset_type={Uri.EscapeDataString(datasetType)}";
+        if (!string.IsNullOrEmpty(format)) url += $"&format={Uri.EscapeDataString(format)}";
+
+        using var content = new StreamContent(Request.Body);
+        content.Headers.ContentType = MediaTypeHeaderValue.Parse(Request.ContentType ?? "application/x-ndjson");
+        using var resp = await sidecar.PostAsync(url, content, ct);
+        return await Relay(resp, ct);
+    }
+
+    [HttpGet("jobs/{jobId}")]
+    public async Task<IActionResult> GetJob(string jobId, CancellationToken ct)
+    {
+        var sidecar = _httpClientFactory.CreateClient("Sidecar");
+        using var resp = await sidecar.GetAsync($"/ingest/jobs/{Uri.EscapeDataString(jobId)}", ct);
+        return await Relay(resp, ct);
+    }
+
+    [HttpDelete("jobs/{jobId}")]
+    public async Task<IActionResult> CancelJob(string jobId, CancellationToken ct)
+    {
+        var sidecar = _httpClientFactory.CreateClient("Sidecar");
+        using var resp = await sidecar.DeleteAsync($"/ingest/jobs/{Uri.EscapeDataString(jobId)}", ct);
+        return await Relay(resp, ct);
+    }
+
+    // continue a cancelled, failed or interrupted job from its last checkpoint
+    [HttpPost("jobs/{jobId}/resume")]
+    public async Task<IActionResult> ResumeJob(string jobId, CancellationToken ct)
+    {
+        var sidecar = _httpClientFactory.CreateClient("Sidecar");
+        using var resp = await sidecar.PostAsync($"/ingest/jobs/{Uri.EscapeDataString(jobId)}/resume", null, ct);
+        return await Relay(resp, ct);
+    }
+
+    private static async Task<IActionResult> Relay(HttpResponseMessage resp, CancellationToken ct) => new ContentResult
+    {
+        StatusCode = (int)resp.StatusCode,
+        Content = await resp.Content.ReadAsStringAsync(ct),
+        ContentType = "application/json"
+    };
+
     public class IngestReq { public string tenantId { get; set; } = ""; public string datasetType { get; set; } = "faq"; public List<Dictionary<string, object>> documents { get; set; } = new(); }
     public class IngestResp { public string status { get; set; } = ""; public int count { get; set; } }
 }
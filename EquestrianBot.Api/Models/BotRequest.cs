@@ -7,4 +7,6 @@ public sealed class BotRequest
 {
     public string TenantId { get; set; } = string.Empty;
     public string Query { get; set; } = string.Empty;
+    // optional metadata filters, passed through to the sidecar as-is (see "Metadata filters" in the README)
+    public System.Text.Json.JsonElement? Filters { get; set; }
 }
@@ -9,6 +9,10 @@ public sealed class BotResponse
     public string Answer { get; set; } = string.Empty;
     public string StrategyUsed { get; set; } = "rag";
     public long LatencyMs { get; set; }
+    /// <summary>Time to first streamed token; only set for streamed answers.</summary>
+    public long? TtftMs { get; set; }
+    /// <summary>Set when this item of a batch failed; the other fields are then empty.</summary>
+    public string? Error { get; set; }
 
     public List<SourceCitation> Sources { get; set; } = new();
 
@@ -0,0 +1,15 @@
+namespace EquestrianBot.Api.Models;
+
+/// <summary>
+/// One event of a streamed RAG answer.
+/// Context arrives first, then Token chunks, then Done with the complete response.
+/// </summary>
+public sealed class BotStreamEvent
+{
+    public enum EventKind { Context, Token, Done }
+
+    public EventKind Kind { get; init; }
+    public string Text { get; init; } = string.Empty;
+    public List<BotResponse.SourceCitation> Sources { get; init; } = new();
+    public BotResponse? Response { get; init; }
+}
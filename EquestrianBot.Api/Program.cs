@@ -23,6 +23,13 @@ builder.Services.AddHttpClient("Sidecar", client =>
     client.Timeout = TimeSpan.FromSeconds(60);
 });
 
+// Bulk uploads stream the whole file through before the sidecar answers
+builder.Services.AddHttpClient("SidecarBulk", client =>
+{
+    client.BaseAddress = new Uri("http://localhost:8000");
+    client.Timeout = TimeSpan.FromMinutes(30);
+});
+
 var app = builder.Build();
 
 if (app.Environment.IsDevelopment())
@@ -5,6 +5,7 @@ namespace EquestrianBot.Api.Services.Rag;
 public interface IPhi3Service
 {
     Task<BotResponse> AskAsync(string tenantId, string query, CancellationToken ct = default);
+    IAsyncEnumerable<BotStreamEvent> AskStreamAsync(string tenantId, string query, CancellationToken ct = default);
     Task<IngestResponse> IngestAsync(IngestRequest request, CancellationToken ct = default);
     Task<List<Dictionary<string, object>>> ListDocsAsync(string tenantId, CancellationToken ct = default);
 
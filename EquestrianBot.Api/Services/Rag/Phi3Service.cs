@@ -12,6 +12,9 @@ public sealed class Phi3Service : IPhi3Service
     public Task<BotResponse> AskAsync(string tenantId, string query, CancellationToken ct = default)
         => _sidecar.QueryRagAsync(tenantId, query, 4, ct);
 
+    public IAsyncEnumerable<BotStreamEvent> AskStreamAsync(string tenantId, string query, CancellationToken ct = default)
+        => _sidecar.QueryRagStreamAsync(tenantId, query, 4, ct);
+
     public Task<IngestResponse> IngestAsync(IngestRequest request, CancellationToken ct = default)
         => _sidecar.IngestAsync(request, ct);
 
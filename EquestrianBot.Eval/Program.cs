@@ -1,8 +1,11 @@
 ﻿using System.Net.Http.Json;
 using CsvHelper;
 using System.Globalization;
+using System.Text.Json;
 
-// Define test queries
+// Usage: dotnet run [queries.jsonl] [tenantId]
+// Without arguments the built-in smoke queries run. With a JSONL file (e.g. ml/data/test.jsonl)
+// every line's "instruction" is asked of tenantId (default tenantA).
 var testQueries = new List<(string TenantId, string Query)>
 {
     ("tenantA", "How do I reset my password?"),
@@ -10,50 +13,73 @@ var testQueries = new List<(string TenantId, string Query)>
     ("tenantB", "Tell me about riding helmets"),
     ("tenantB", "How to reset password?"), // should fail in tenantB
 };
+if (args.Length > 0)
+{
+    var fileTenant = args.Length > 1 ? args[1] : "tenantA";
+    testQueries = File.ReadLines(args[0])
+        .Where(l => !string.IsNullOrWhiteSpace(l))
+        .Select(l => (fileTenant, JsonDocument.Parse(l).RootElement.GetProperty("instruction").GetString() ?? ""))
+        .ToList();
+}
 
-// HttpClient
-using var http = new HttpClient { BaseAddress = new Uri("http://localhost:5140") };
+// HttpClient (a batch generates all its answers before replying)
+using var http = new HttpClient { BaseAddress = new Uri("http://localhost:5140"), Timeout = TimeSpan.FromMinutes(10) };
 
 // Results container
 var results = new List<ResultRow>();
 
-foreach (var (tenantId, query) in testQueries)
+// Queries go out in batches: the sidecar embeds, searches and generates each batch together
+const int BatchSize = 32;
+foreach (var chunk in testQueries.Chunk(BatchSize))
 {
-    var payload = new { tenantId, query };
+    var payload = new { items = chunk.Select(q => new { tenantId = q.TenantId, query = q.Query }), useCache = false };
 
     try
     {
-        var resp = await http.PostAsJsonAsync("/api/bot", payload);
+        var resp = await http.PostAsJsonAsync("/api/bot/batch", payload);
         resp.EnsureSuccessStatusCode();
 
-        var dto = await resp.Content.ReadFromJsonAsync<BotResponse>();
+        var dtos = await resp.Content.ReadFromJsonAsync<List<BotResponse>>() ?? new();
 
-        results.Add(new ResultRow
+        for (var i = 0; i < chunk.Length; i++)
         {
-            TenantId = tenantId,
-            Query = query,
-            Answer = dto?.Answer ?? "N/A",
-            Strategy = dto?.StrategyUsed ?? "unknown",
-            LatencyMs = dto?.LatencyMs ?? -1,
-            Sources = dto?.Sources != null
-                ? string.Join(";", dto.Sources.Select(s => $"{s.Id}:{s.Url}({s.Score:F2})"))
-                : ""
-        });
+            var (tenantId, query) = chunk[i];
+            var dto = i < dtos.Count ? dtos[i] : null;
+            if (dto is null || dto.Error is not null)
+            {
+                results.Add(ErrorRow(tenantId, query, dto?.Error ?? "missing result"));
+                continue;
+            }
+
+            results.Add(new ResultRow
+            {
+                TenantId = tenantId,
+                Query = query,
+                Answer = dto.Answer,
+                Strategy = dto.StrategyUsed,
+                LatencyMs = dto.LatencyMs,
+                Sources = dto.Sources != null
+                    ? string.Join(";", dto.Sources.Select(s => $"{s.Id}:{s.Url}({s.Score:F2})"))
+                    : ""
+            });
+        }
     }
     catch (Exception ex)
     {
-        results.Add(new ResultRow
-        {
-            TenantId = tenantId,
-            Query = query,
-            Answer = $"ERROR: {ex.Message}",
-            Strategy = "error",
-            LatencyMs = -1,
-            Sources = ""
-        });
+        results.AddRange(chunk.Select(q => ErrorRow(q.TenantId, q.Query, ex.Message)));
     }
 }
 
+static ResultRow ErrorRow(string tenantId, string query, string error) => new()
+{
+    TenantId = tenantId,
+    Query = query,
+    Answer = $"ERROR: {error}",
+    Strategy = "error",
+    LatencyMs = -1,
+    Sources = ""
+};
+
 // Write CSV
 using (var writer = new StreamWriter("results.csv"))
 using (var csv = new CsvWriter(writer, CultureInfo.InvariantCulture))
@@ -70,6 +96,7 @@ public class BotResponse
     public string StrategyUsed { get; set; } = "";
     public long LatencyMs { get; set; }
     public List<SourceCitation>? Sources { get; set; }
+    public string? Error { get; set; }
 }
 
 public class SourceCitation
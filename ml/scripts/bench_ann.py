@@ -0,0 +1,102 @@
+import argparse, os, sys, time
+import numpy as np
+
+# Benchmark the sidecar's ANN index specs against the exact flat baseline.
+#   python ml/scripts/bench_ann.py --rows 200000
+#   python ml/scripts/bench_ann.py --tenant tenantA      (use a real store's vectors)
+#   python ml/scripts/bench_ann.py --specs 'SQfp16;SQ8;IVF256,SQ8;HNSW32,SQ8'
+# Reports recall@k (overlap with IndexFlatIP top-k), per-query latency and
+# approximate index bytes per vector (see INDEX_CODEC in ann.py).
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar"))
+import faiss
+import ann
+
+
+def synthetic(rows: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, rows // 500), dim)).astype("float32")
+    x = centers[rng.integers(0, len(centers), rows)] + 0.35 * rng.standard_normal((rows, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def tenant_vectors(tenant_id: str) -> np.ndarray:
+    import stores
+    st = stores.load(tenant_id)
+    return st.vectors_of(st.live_rows())
+
+
+def run(index, queries: np.ndarray, k: int):
+    lat = []
+    found = []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, rows = index.search(q[None, :], k)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found.append(rows[0])
+    return np.array(found), np.array(lat)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--tenant", help="benchmark a tenant's stored vectors instead of synthetic data")
+    ap.add_argument("--specs", default="", help="semicolon-separated; default the flat codecs, IVF, IVF+PQ and HNSW")
+    ap.add_argument("--nprobe", default="4,8,16,32,64")
+    ap.add_argument("--ef", default="16,32,64,128")
+    args = ap.parse_args()
+
+    xb = tenant_vectors(args.tenant) if args.tenant else synthetic(args.rows, args.dim)
+    n, dim = xb.shape
+    rng = np.random.default_rng(1)
+    # queries: perturbed corpus vectors, like paraphrased questions
+    xq = xb[rng.integers(0, n, args.queries)] + 0.1 * rng.standard_normal((args.queries, dim)).astype("float32")
+    xq = (xq / np.linalg.norm(xq, axis=1, keepdims=True)).astype("float32")
+    labels = np.arange(n, dtype="int64")
+
+    flat = ann.build(ann.FLAT, dim, xb, labels)
+    truth, lat = run(flat, xq, args.k)
+    print(f"rows={n} dim={dim} queries={len(xq)} k={args.k}")
+    print(f"{'spec':<22}{'param':<14}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'B/vec':>8}")
+    print(f"{ann.FLAT:<22}{'-':<14}{1.0:>10.3f}{np.percentile(lat, 50):>10.3f}{np.percentile(lat, 95):>10.3f}{'-':>10}"
+          f"{ann.bytes_per_vector(ann.FLAT, dim):>8}")
+
+    if args.specs:
+        specs = args.specs.split(";")
+    else:
+        nlist = ann.ivf_nlist(n)
+        specs = ["SQfp16", "SQ8", f"IVF{nlist},Flat", f"IVF{nlist},SQ8", f"HNSW{ann.HNSW_M}", f"HNSW{ann.HNSW_M},SQ8"]
+        if dim % 48 == 0:
+            specs.insert(4, f"IVF{nlist},PQ48")
+
+    for spec in specs:
+        t0 = time.perf_counter()
+        index = ann.build(spec, dim, xb, labels)
+        build_s = time.perf_counter() - t0
+        if spec.startswith("IVF"):
+            sweep = [("nprobe", int(v)) for v in args.nprobe.split(",")]
+        elif spec.startswith("HNSW"):
+            sweep = [("efSearch", int(v)) for v in args.ef.split(",")]
+        else:
+            sweep = [("-", 0)]
+        for name, value in sweep:
+            if value:
+                faiss.ParameterSpace().set_index_parameter(index, name, value)
+            found, lat = run(index, xq, args.k)
+            param = f"{name}={value}" if value else "-"
+            print(f"{spec:<22}{param:<14}{recall(found, truth):>10.3f}"
+                  f"{np.percentile(lat, 50):>10.3f}{np.percentile(lat, 95):>10.3f}{build_s:>10.1f}"
+                  f"{ann.bytes_per_vector(spec, dim):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse, json, os, subprocess, sys, time
+
+# Decode throughput and memory of the generator per serving mode.
+#   python ml/scripts/bench_generation.py
+#   python ml/scripts/bench_generation.py --modes cpu-fp32,cpu-int8 --tokens 64
+#   python ml/scripts/bench_generation.py --modes cpu-bf16 --assist none,prompt_lookup,draft
+# Each mode runs in its own process (GEN_DEVICE / GEN_DTYPE / GEN_QUANT set
+# accordingly) so load time and peak RSS are not polluted by other modes.
+
+MODES = {
+    "cuda-fp16": {"GEN_DEVICE": "cuda", "GEN_DTYPE": "fp16", "GEN_QUANT": "none"},
+    "cuda-int8": {"GEN_DEVICE": "cuda", "GEN_DTYPE": "fp16", "GEN_QUANT": "int8"},
+    "cuda-int4": {"GEN_DEVICE": "cuda", "GEN_DTYPE": "fp16", "GEN_QUANT": "int4"},
+    "cpu-fp32": {"GEN_DEVICE": "cpu", "GEN_DTYPE": "fp32", "GEN_QUANT": "none"},
+    "cpu-bf16": {"GEN_DEVICE": "cpu", "GEN_DTYPE": "bf16", "GEN_QUANT": "none"},
+    "cpu-int8": {"GEN_DEVICE": "cpu", "GEN_DTYPE": "fp32", "GEN_QUANT": "int8"},
+    "cpu-int4": {"GEN_DEVICE": "cpu", "GEN_DTYPE": "bf16", "GEN_QUANT": "int4"},
+}
+
+CTX = [
+    {"id": "1", "title": "Helmet sizing", "question": "How do I choose the right riding helmet size?",
+     "answer": "Measure the circumference of your head just above the eyebrows, then compare to our size chart."},
+    {"id": "2", "title": "Boot sizing", "question": "What size tall boots should I get?",
+     "answer": "Measure calf at the widest point and height from floor to back of knee while seated."},
+]
+
+
+def peak_rss_mb() -> float:
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+
+
+def child(tokens: int, runs: int) -> None:
+    t0 = time.perf_counter()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar"))
+    import generation
+    generation.load_model()
+    load_s = time.perf_counter() - t0
+
+    generation.generate_from_context("warm up", CTX, temperature=0.0, max_new_tokens=4, min_new_tokens=4)
+    rates = []
+    generated = accepted = 0
+    for i in range(runs):
+        t0 = time.perf_counter()
+        _, meta = generation.generate_from_context(
+            f"Which helmet size fits a 57 cm head? ({i})", CTX,
+            temperature=0.0, max_new_tokens=tokens, min_new_tokens=tokens,
+        )
+        rates.append(meta["gen_len"] / (time.perf_counter() - t0))
+        generated += meta["gen_len"]
+        accepted += meta.get("assist_accepted", 0)
+    print(json.dumps({**generation.model_info(), "load_s": load_s,
+                      "tok_s": sorted(rates)[len(rates) // 2], "rss_mb": peak_rss_mb(),
+                      "acceptance": accepted / generated if generated and "assist_accepted" in meta else None}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", default="cpu-fp32,cpu-bf16,cpu-int8" + (",cuda-fp16" if _has_cuda() else ""))
+    ap.add_argument("--tokens", type=int, default=128, help="new tokens per request")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--assist", default="none",
+                    help="comma-separated GEN_ASSIST values to run each mode with (draft needs GEN_DRAFT_MODEL_DIR)")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.tokens, args.runs)
+        return
+
+    print(f"{'mode':<12}{'assist':<15}{'dtype':<10}{'threads':>8}{'load s':>9}{'tok/s':>9}{'accept':>8}{'peak RSS MB':>13}")
+    for mode in args.modes.split(","):
+        for assist in args.assist.split(","):
+            env = {**os.environ, **MODES[mode], "GEN_MAX_BATCH": "1", "GEN_PREFIX_CACHE_MB": "0", "GEN_ASSIST": assist}
+            proc = subprocess.run([sys.executable, __file__, "--child", "--tokens", str(args.tokens), "--runs", str(args.runs)],
+                                  env=env, capture_output=True, text=True)
+            lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+            if proc.returncode or not lines:
+                err = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+                print(f"{mode:<12}{assist:<15}{err}")
+                continue
+            r = json.loads(lines[-1])
+            accept = f"{r['acceptance']:.2f}" if r["acceptance"] is not None else "-"
+            print(f"{mode:<12}{assist:<15}{r['dtype']:<10}{str(r['threads'] or '-'):>8}{r['load_s']:>9.1f}"
+                  f"{r['tok_s']:>9.1f}{accept:>8}{r['rss_mb']:>13.0f}")
+
+
+def _has_cuda() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse, csv, os, random, sys
+import numpy as np
+
+# Prefill latency with and without the prompt-prefix KV cache.
+#   python ml/scripts/bench_prefill.py --prompts 200
+# Builds /query-style prompts from the FAQ knowledge base (a Zipf-skewed mix of
+# docs, like real retrieval) and runs each with a single generated token, so
+# the measured time is almost entirely prefill.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar"))
+os.environ.setdefault("GEN_MAX_BATCH", "1")
+import generation
+
+CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "faq_knowledgebase.csv")
+
+
+def load_docs():
+    with open(CSV, encoding="utf-8-sig") as f:
+        return [{"id": r["id"], "title": r["intent"], "question": r["question"], "answer": r["answer"]}
+                for r in csv.DictReader(f)]
+
+
+def workload(docs, n: int, top_k: int, seed: int = 0):
+    rng = random.Random(seed)
+    weights = [1.0 / (i + 1) for i in range(len(docs))]
+    out = []
+    for _ in range(n):
+        q = rng.choice(docs)["question"]
+        ctx = rng.choices(docs, weights=weights, k=top_k)
+        out.append((q, ctx))
+    return out
+
+
+def run(prompts):
+    ms, cached = [], []
+    for q, ctx in prompts:
+        _, meta = generation.generate_from_context(q, ctx, max_new_tokens=1, min_new_tokens=0)
+        ms.append(meta.get("prefill_ms", meta.get("gen_ms", 0)))
+        cached.append(meta.get("cached_tokens", 0) / max(meta["prompt_len"], 1))
+    return np.array(ms), np.array(cached)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prompts", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=4)
+    args = ap.parse_args()
+
+    prompts = workload(load_docs(), args.prompts, args.top_k)
+    run(prompts[:5])                                  # warm up kernels
+
+    print(f"{'mode':<14}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'cached':>10}")
+    for mode in ("no-cache", "prefix-cache"):
+        generation._prefix_cache.clear()
+        generation._prefix_cache.enabled = mode == "prefix-cache"
+        generation._warm_prefix()
+        ms, cached = run(prompts)
+        print(f"{mode:<14}{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 95):>10.1f}"
+              f"{ms.mean():>10.1f}{cached.mean():>10.1%}")
+    print(generation.prefix_cache_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import argparse, asyncio, csv, json, os, random, re, sys, tempfile, time, types, zlib
+import numpy as np
+
+# Load and micro benchmarks for the sidecar.
+#   python ml/scripts/bench_sidecar.py load --concurrency 16 --requests 2000
+#   python ml/scripts/bench_sidecar.py load --url http://localhost:8000      (a running sidecar, real models)
+#   python ml/scripts/bench_sidecar.py micro --sizes 1000,10000,100000,1000000
+# `load` replays the questions of test.jsonl and faq_knowledgebase.csv against
+# /query and batches of documents against /ingest, and reports p50/p95/p99
+# latency, throughput and the answer-cache hit rate. In-process runs (no --url)
+# swap Phi-3 for a stub generator (a fixed number of tokens at a fixed delay
+# each) and MiniLM for a hashed bag-of-words embedder, so they need neither
+# model weights nor a GPU. Stores, policies and job files go to a temp dir.
+# `micro` times retrieval.search, cache.get and upsert_documents directly on
+# synthetic corpora of growing size.
+
+SIDECAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar")
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+TENANT = "bench"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# -------- Stubs --------
+class TinyEmbedder:
+    """Hashed bag-of-words encoder with the SentenceTransformer surface embedder.py uses."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 64, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for tok in _WORD.findall(text.lower()):
+                h = zlib.crc32(tok.encode("utf-8"))     # stable across processes, unlike hash()
+                out[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return out
+
+
+def _stub_generation(tokens: int, token_ms: float) -> types.ModuleType:
+    """Stand-in for generation.py. Each request sleeps tokens * token_ms, as if it
+    were decoded in a shared batch; GENERATION stage workers bound the concurrency."""
+    g = types.ModuleType("generation")
+
+    def answer(user_query, ctx, max_new_tokens):
+        n = min(tokens, max_new_tokens)
+        sources = ", ".join(str(c.get("title") or c.get("id")) for c in ctx[:2]) or "none"
+        words = [f"w{i}" for i in range(n)]
+        meta = {"gen_len": n, "prompt_len": 0, "gen_ms": int(n * token_ms)}
+        return words, f"{' '.join(words)}\nSources: {sources}", meta
+
+    def generate_from_context(user_query, ctx, *, max_new_tokens=220, **params):
+        words, text, meta = answer(user_query, ctx, max_new_tokens)
+        time.sleep(len(words) * token_ms / 1000)
+        return text, meta
+
+    def generate_many(items, max_new_tokens=220, **params):
+        out = [answer(q, ctx, max_new_tokens) for q, ctx in items]
+        time.sleep(max((len(w) for w, _, _ in out), default=0) * token_ms / 1000)
+        return [(text, meta) for _, text, meta in out]
+
+    def stream_from_context(user_query, ctx, *, max_new_tokens=220, **params):
+        words, text, meta = answer(user_query, ctx, max_new_tokens)
+        for w in words:
+            time.sleep(token_ms / 1000)
+            yield "token", w + " "
+        yield "done", (text, meta)
+
+    g.generate_from_context = generate_from_context
+    g.generate_many = generate_many
+    g.stream_from_context = stream_from_context
+    g.prefix_cache_stats = lambda: {}
+    g.load_tokenizer = lambda: (lambda text: None)
+    g.load_model = lambda: None
+    g.model_info = lambda: {"device": "stub", "dtype": None, "quant": None, "threads": None}
+    return g
+
+
+def import_sidecar(args):
+    """Import the sidecar in-process with the stub models and a throwaway data dir."""
+    work = tempfile.mkdtemp(prefix="bench-sidecar-")
+    os.environ.setdefault("BULK_JOB_DIR", os.path.join(work, "ingest_jobs"))
+    os.environ.setdefault("TENANT_POLICY_FILE", os.path.join(work, "tenant_policies.json"))
+    os.environ.setdefault("EMBEDDING_MODEL", f"bench-tiny-{args.dim}")
+    st = types.ModuleType("sentence_transformers")
+    st.SentenceTransformer = lambda name: TinyEmbedder(args.dim)
+    sys.modules["sentence_transformers"] = st
+    sys.modules["generation"] = _stub_generation(args.gen_tokens, args.token_ms)
+    sys.path.insert(0, SIDECAR)
+    import stores
+    stores.VEC_DIR = os.path.join(work, "vectorstores")
+    print(f"in-process sidecar: tiny embedder dim={args.dim}, stub generator "
+          f"{args.gen_tokens} tokens x {args.token_ms} ms, data in {work}")
+
+
+# -------- Workload --------
+def questions():
+    out = []
+    with open(os.path.join(DATA, "test.jsonl"), encoding="utf-8") as f:
+        out += [json.loads(line)["instruction"] for line in f if line.strip()]
+    with open(os.path.join(DATA, "faq_knowledgebase.csv"), encoding="utf-8") as f:
+        out += [row["question"] for row in csv.DictReader(f)]
+    return out
+
+
+def documents():
+    """The FAQ and product datasets in the /ingest document shape."""
+    faq, products = [], []
+    with open(os.path.join(DATA, "faq_knowledgebase.csv"), encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            faq.append({
+                "id": f"faq-{row['id']}", "question": row["question"], "answer": row["answer"],
+                "tags": [t for t in row["tags"].split(";") if t] or None,
+                "metadata": {"intent": row["intent"], "product_skus": row["product_skus"]},
+            })
+    with open(os.path.join(DATA, "products.csv"), encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            products.append({
+                "id": f"product-{row['ProductID']}", "title": row["Name"],
+                "attributes": {"description": row["Description"], "price": row["Price"], "category": row["Category"]},
+            })
+    return faq, products
+
+
+def percentiles(lat_ms):
+    if not lat_ms:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    a = np.asarray(lat_ms)
+    return {"p50": float(np.percentile(a, 50)), "p95": float(np.percentile(a, 95)),
+            "p99": float(np.percentile(a, 99)), "mean": float(a.mean())}
+
+
+# -------- Load mode --------
+async def replay(client, jobs, concurrency):
+    """POST every (path, body) with at most `concurrency` in flight; returns per-request records and wall time."""
+    sem = asyncio.Semaphore(concurrency)
+    records = []
+
+    async def one(path, body):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, json=body)
+                status = r.status_code
+                payload = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+            except Exception as e:
+                status, payload = 0, {"error": type(e).__name__}
+            records.append({"ms": (time.perf_counter() - t0) * 1000, "status": status,
+                            "strategy": payload.get("strategy") if status == 200 else None})
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(path, body) for path, body in jobs))
+    return records, time.perf_counter() - t0
+
+
+def summarize(name, records, wall_s):
+    ok = [r for r in records if r["status"] == 200]
+    strategies = {}
+    for r in ok:
+        if r["strategy"]:
+            strategies[r["strategy"]] = strategies.get(r["strategy"], 0) + 1
+    cached = strategies.get("cache_exact", 0) + strategies.get("cache_semantic", 0)
+    out = {
+        "phase": name,
+        "requests": len(records),
+        "ok": len(ok),
+        "overloaded": sum(r["status"] == 429 for r in records),
+        "errors": sum(r["status"] not in (200, 429) for r in records),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else None,
+        **{k: (round(v, 2) if v is not None else None) for k, v in percentiles([r["ms"] for r in ok]).items()},
+        "strategies": strategies,
+    }
+    if strategies:
+        out["cache_hit_rate"] = round(cached / len(ok), 4)
+    return out
+
+
+def print_summary(s):
+    def ms(v):
+        return f"{v:.1f}" if v is not None else "-"
+    print(f"\n[{s['phase']}] {s['ok']}/{s['requests']} ok, {s['overloaded']} overloaded (429), {s['errors']} errors"
+          f" in {s['wall_s']:.2f}s -> {s['throughput_rps']} req/s")
+    print(f"  latency ms  p50 {ms(s['p50'])}  p95 {ms(s['p95'])}  p99 {ms(s['p99'])}  mean {ms(s['mean'])}")
+    if "cache_hit_rate" in s:
+        print(f"  cache hit rate {s['cache_hit_rate']:.1%}  strategies {s['strategies']}")
+
+
+async def run_load(args):
+    import httpx
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        import_sidecar(args)
+        import server, startup
+        startup.start()
+        while not startup.is_ready():
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://sidecar",
+                                   timeout=args.timeout)
+
+    rng = random.Random(args.seed)
+    faq, products = documents()
+    results = []
+    async with client:
+        r = await client.post("/ingest", json={"tenant_id": args.tenant, "dataset_type": "faq", "documents": faq})
+        r.raise_for_status()
+        r = await client.post("/ingest", json={"tenant_id": args.tenant, "dataset_type": "products", "documents": products})
+        r.raise_for_status()
+        if args.no_direct:
+            (await client.put(f"/policy/{args.tenant}", json={"direct_answer": False})).raise_for_status()
+        before = (await client.get("/cache/stats")).json()
+
+        # /query: the question set is replayed in shuffled passes, so later passes can hit the answer cache
+        qs = questions()
+        order = []
+        while len(order) < args.requests:
+            batch = list(qs)
+            rng.shuffle(batch)
+            order += batch
+        jobs = [("/query", {"tenant_id": args.tenant, "query": q, "top_k": args.top_k}) for q in order[:args.requests]]
+        records, wall = await replay(client, jobs, args.concurrency)
+        s = summarize("query", records, wall)
+        after = (await client.get("/cache/stats")).json()
+        s["server_cache"] = {k: after[k] - before.get(k, 0) for k in after if isinstance(after[k], int)}
+        results.append(s)
+
+        # /ingest: fresh ids each request, so every batch is embedded and committed
+        pool = faq + products
+        jobs = []
+        for i in range(args.ingest_requests):
+            docs = [dict(rng.choice(pool)) for _ in range(args.ingest_batch)]
+            for j, d in enumerate(docs):
+                d["id"] = f"{d['id']}-{i}-{j}"
+            jobs.append(("/ingest", {"tenant_id": f"{args.tenant}-ingest", "dataset_type": "faq", "documents": docs}))
+        records, wall = await replay(client, jobs, args.concurrency)
+        results.append(summarize("ingest", records, wall))
+
+        for tenant in (args.tenant, f"{args.tenant}-ingest"):
+            await client.delete(f"/delete/{tenant}")
+
+    print(f"\nconcurrency={args.concurrency} top_k={args.top_k} target={args.url or 'in-process'}")
+    for s in results:
+        print_summary(s)
+    return results
+
+
+# -------- Micro mode --------
+_NOUNS = ("helmet", "saddle", "bridle", "girth", "boots", "breeches", "blanket", "halter", "pad", "stirrup",
+          "reins", "bit", "crop", "gloves", "vest", "fly sheet", "lead rope", "hoof pick", "brush", "bucket")
+_VERBS = ("size", "clean", "fit", "return", "store", "adjust", "wash", "measure", "order", "replace")
+_ADJ = ("leather", "synthetic", "youth", "pony", "dressage", "jumping", "winter", "waterproof", "mesh", "padded")
+
+
+def synthetic_docs(start: int, n: int, rng: random.Random):
+    docs = []
+    for i in range(start, start + n):
+        noun, verb, adj = rng.choice(_NOUNS), rng.choice(_VERBS), rng.choice(_ADJ)
+        sku = f"{noun[:4].upper()}-{rng.randrange(10000):04d}"
+        docs.append({
+            "id": f"doc-{i}",
+            "title": f"{adj.title()} {noun} {sku}",
+            "question": f"How do I {verb} a {adj} {noun}?",
+            "answer": f"To {verb} the {adj} {noun} ({sku}), follow the care card; model {rng.randrange(100)} "
+                      f"fits {rng.choice(_ADJ)} riders.",
+            "tags": [noun, verb],
+        })
+    return docs
+
+
+def timings(fn, items):
+    lat = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return percentiles(lat)
+
+
+def run_micro(args):
+    import_sidecar(args)
+    import cache, embedder, ingestion, retrieval, stores
+
+    rng = random.Random(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    cache.MAX_ENTRIES = max(cache.MAX_ENTRIES, max(sizes))     # let the semantic cache scale with the corpus
+    results = []
+    print(f"{'docs':>9}{'build s':>10}{'search p50':>12}{'p95':>8}{'cache.get p50':>15}{'p95':>8}"
+          f"{'upsert p50':>12}{'p95':>8}   (ms)")
+    for size in sizes:
+        tenant = f"micro-{size}"
+        t0 = time.perf_counter()
+        chunk = 10000
+        ingestion.upsert_batches(
+            tenant, (synthetic_docs(i, min(chunk, size - i), rng) for i in range(0, size, chunk)), checkpoint_docs=size)
+        build_s = time.perf_counter() - t0
+
+        probes = synthetic_docs(size, args.queries, rng)
+        texts = [f"{d['question']} {d['title'].split()[-1]}" for d in probes]
+        qvs = embedder.encode(texts)
+        search = timings(lambda i: retrieval.search(tenant, texts[i], args.top_k, qv=qvs[i]), range(len(texts)))
+
+        # one cache entry per corpus doc; half the probes repeat a cached query, half are new
+        st = stores.get(tenant)
+        vecs = st.vectors_of(st.live_rows())
+        for row, v in enumerate(vecs):
+            cache.put(tenant, f"q{row}", "a", qv=v)
+        picks = rng.sample(range(len(vecs)), min(len(vecs), args.queries // 2))
+        probe_vs = [vecs[p] for p in picks] + list(qvs[:args.queries - len(picks)])
+        cache_get = timings(lambda v: cache.get(tenant, "", qv=v), probe_vs)
+
+        batches = [synthetic_docs(size + args.queries + i * args.upsert_batch, args.upsert_batch, rng)
+                   for i in range(args.upserts)]
+        upsert = timings(lambda docs: ingestion.upsert_documents(tenant, "faq", docs), batches)
+
+        results.append({"docs": size, "build_s": round(build_s, 2), "search": search, "cache_get": cache_get,
+                        "upsert": upsert, "upsert_batch": args.upsert_batch})
+        print(f"{size:>9}{build_s:>10.1f}{search['p50']:>12.3f}{search['p95']:>8.3f}{cache_get['p50']:>15.3f}"
+              f"{cache_get['p95']:>8.3f}{upsert['p50']:>12.1f}{upsert['p95']:>8.1f}")
+        cache.clear(tenant)
+        stores.delete(tenant)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="mode", required=True)
+    load = sub.add_parser("load", help="replay questions and ingests against the HTTP API")
+    load.add_argument("--url", help="benchmark a running sidecar instead of an in-process one with stub models")
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--requests", type=int, default=500, help="/query requests")
+    load.add_argument("--ingest-requests", type=int, default=20)
+    load.add_argument("--ingest-batch", type=int, default=32, help="documents per /ingest request")
+    load.add_argument("--tenant", default=TENANT)
+    load.add_argument("--no-direct", action="store_true", help="turn off direct FAQ answers so queries reach generation")
+    load.add_argument("--timeout", type=float, default=120.0)
+    micro = sub.add_parser("micro", help="time retrieval.search, cache.get and upsert_documents in-process")
+    micro.add_argument("--sizes", default="1000,10000,100000,1000000")
+    micro.add_argument("--queries", type=int, default=200)
+    micro.add_argument("--upserts", type=int, default=10)
+    micro.add_argument("--upsert-batch", type=int, default=100)
+    for p in (load, micro):
+        p.add_argument("--top-k", type=int, default=4)
+        p.add_argument("--dim", type=int, default=64, help="tiny embedder dimension")
+        p.add_argument("--gen-tokens", type=int, default=64, help="stub generator tokens per answer")
+        p.add_argument("--token-ms", type=float, default=2.0, help="stub generator delay per token")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args()
+
+    results = asyncio.run(run_load(args)) if args.mode == "load" else run_micro(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse, json, os, sys, time
+import numpy as np
+
+# Parity and speed of an embedder backend against the PyTorch reference.
+#   python ml/scripts/check_embedder_parity.py --backend onnx-int8
+#   python ml/scripts/check_embedder_parity.py --backend onnx --min-cosine 0.999
+# Encodes the FAQ and product docs (as ingestion formats them) and the test
+# questions with both backends and reports the per-text cosine between the two
+# vectors, how often each question's top-k docs agree, and encode speed.
+# Exits 1 when the backend falls below --min-cosine or --min-recall: vectors
+# already stored by one backend are searched with queries from the other, so
+# only switch EMBED_BACKEND on a node after this passes.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar"))
+import embedder
+from ingestion import _make_text_for_embedding
+from bench_sidecar import documents, questions
+
+
+def timed_encode(model, texts, batch_size: int):
+    t0 = time.perf_counter()
+    v = model.encode(texts, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+    return v / (np.linalg.norm(v, axis=1, keepdims=True) + 1e-12), time.perf_counter() - t0
+
+
+def query_latency_ms(model, texts, runs: int) -> float:
+    lat = []
+    for text in texts[:runs]:
+        t0 = time.perf_counter()
+        model.encode([text], convert_to_numpy=True)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(lat, 50))
+
+
+def top_k(qv: np.ndarray, dv: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(qv @ dv.T), axis=1, kind="stable")[:, :k]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", default="onnx-int8", choices=sorted(embedder.ONNX_FILES))
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--batch-size", type=int, default=embedder.MAX_BATCH)
+    ap.add_argument("--runs", type=int, default=200, help="single-query encodes timed per backend")
+    ap.add_argument("--min-cosine", type=float, default=0.98, help="lowest acceptable 1st-percentile cosine")
+    ap.add_argument("--min-recall", type=float, default=0.90, help="lowest acceptable top-k agreement")
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args()
+
+    faq, products = documents()
+    docs = [_make_text_for_embedding(d) for d in faq + products]
+    qs = questions()
+    print(f"model={embedder.EMB_MODEL} docs={len(docs)} questions={len(qs)} k={args.k}")
+
+    results = {}
+    vectors = {}
+    for backend in ("torch", args.backend):
+        t0 = time.perf_counter()
+        model = embedder.load_backend(backend)
+        load_s = time.perf_counter() - t0
+        model.encode(["warm up"], convert_to_numpy=True)
+        dv, docs_s = timed_encode(model, docs, args.batch_size)
+        qv, _ = timed_encode(model, qs, args.batch_size)
+        vectors[backend] = (dv, qv)
+        results[backend] = {"load_s": load_s, "docs_per_s": len(docs) / docs_s,
+                            "query_p50_ms": query_latency_ms(model, qs, args.runs)}
+        del model
+
+    (ref_d, ref_q), (cand_d, cand_q) = vectors["torch"], vectors[args.backend]
+    cos = np.concatenate([(ref_d * cand_d).sum(axis=1), (ref_q * cand_q).sum(axis=1)])
+    truth, found = top_k(ref_q, ref_d, args.k), top_k(cand_q, cand_d, args.k)
+    # cross: candidate queries against torch-encoded stores, the mixed state after a switch
+    cross = top_k(cand_q, ref_d, args.k)
+    parity = {
+        "cosine_mean": float(cos.mean()),
+        "cosine_p1": float(np.percentile(cos, 1)),
+        "cosine_min": float(cos.min()),
+        "recall_at_k": float(np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])),
+        "recall_at_k_mixed": float(np.mean([len(set(c) & set(t)) / args.k for c, t in zip(cross, truth)])),
+        "top1_agreement": float(np.mean(found[:, 0] == truth[:, 0])),
+    }
+
+    print(f"{'backend':<12}{'load s':>8}{'docs/s':>10}{'query p50 ms':>14}")
+    for backend, r in results.items():
+        print(f"{backend:<12}{r['load_s']:>8.1f}{r['docs_per_s']:>10.0f}{r['query_p50_ms']:>14.2f}")
+    for key, value in parity.items():
+        print(f"{key:<20}{value:.4f}")
+
+    ok = parity["cosine_p1"] >= args.min_cosine and \
+        min(parity["recall_at_k"], parity["recall_at_k_mixed"]) >= args.min_recall
+    print("PASS" if ok else "FAIL")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "speed": results, "parity": parity, "pass": ok}, f, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os, math
+from typing import Optional, Tuple
+import numpy as np
+import faiss
+
+# -------- Index type policy --------
+# Store segments (see stores.py) up to INDEX_FLAT_MAX live docs use an exact
+# IndexFlatIP. Larger ones get an ANN index, trained on the stored vectors when
+# the segment is written, so merges retrain it as a store grows.
+INDEX_FLAT_MAX = int(os.environ.get("INDEX_FLAT_MAX", "20000"))
+INDEX_ANN_KIND = os.environ.get("INDEX_ANN_KIND", "ivf").lower()     # "ivf" | "hnsw"
+INDEX_PQ_M = int(os.environ.get("INDEX_PQ_M", "0"))                  # IVF only; overrides INDEX_CODEC
+# How every index type stores vectors: float32, float16 (half the memory) or
+# 8-bit scalar quantized (a quarter, with per-dimension ranges trained like IVF
+# centroids). Segments below INDEX_CODEC_MIN_ROWS stay float32.
+INDEX_CODEC = os.environ.get("INDEX_CODEC", "flat").lower()          # flat | fp16 | sq8
+INDEX_CODEC_MIN_ROWS = int(os.environ.get("INDEX_CODEC_MIN_ROWS", "1000"))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "16"))
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "64"))
+TRAIN_MAX_ROWS = int(os.environ.get("INDEX_TRAIN_MAX_ROWS", "200000"))
+
+FLAT = "Flat"
+CODECS = {"flat": FLAT, "fp16": "SQfp16", "sq8": "SQ8"}
+
+
+def ivf_nlist(n_live: int) -> int:
+    # ~4*sqrt(N) inverted lists, rounded to a power of two
+    return max(1, 1 << int(round(math.log2(4 * math.sqrt(max(n_live, 1))))))
+
+
+def spec_for(n_live: int, dim: int) -> str:
+    """faiss index_factory string for a segment with n_live documents."""
+    codec = CODECS[INDEX_CODEC] if n_live >= INDEX_CODEC_MIN_ROWS else FLAT
+    if n_live <= INDEX_FLAT_MAX:
+        return codec                                # "Flat", "SQfp16" or "SQ8"
+    if INDEX_ANN_KIND == "hnsw":
+        return f"HNSW{HNSW_M}" if codec == FLAT else f"HNSW{HNSW_M},{codec}"
+    if INDEX_PQ_M and dim % INDEX_PQ_M == 0:
+        codec = f"PQ{INDEX_PQ_M}"
+    return f"IVF{ivf_nlist(n_live)},{codec}"
+
+
+def _layout(spec: str) -> Tuple[str, str]:
+    """(structure, codec) of a spec, e.g. ("Flat", "SQ8") for "SQ8", ("IVF", "PQ48") for "IVF256,PQ48"."""
+    head, _, codec = spec.partition(",")
+    if head == FLAT or head.startswith("SQ"):
+        return FLAT, head
+    return head.rstrip("0123456789"), codec or FLAT
+
+
+def bytes_per_vector(spec: str, dim: int) -> int:
+    """Approximate resident bytes per vector of an IndexIDMap2 over `spec`."""
+    structure, codec = _layout(spec)
+    if codec.startswith("PQ"):
+        size = int(codec[2:])
+    else:
+        size = {FLAT: 4, "SQfp16": 2, "SQ8": 1}.get(codec, 4) * dim
+    size += 16                                      # id map, both directions
+    if structure == "IVF":
+        size += 8                                   # inverted list ids
+    elif structure == "HNSW":
+        size += 2 * HNSW_M * 4                      # level-0 neighbour lists
+    return size
+
+
+def build(spec: str, dim: int, vectors: np.ndarray, labels: np.ndarray):
+    """Create, train (if needed) and fill an IndexIDMap2 of the given spec."""
+    inner = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+    if not inner.is_trained:
+        train = vectors
+        if len(vectors) > TRAIN_MAX_ROWS:
+            pick = np.random.default_rng(0).choice(len(vectors), TRAIN_MAX_ROWS, replace=False)
+            train = vectors[pick]
+        inner.train(np.ascontiguousarray(train, dtype="float32"))
+    index = faiss.IndexIDMap2(inner)
+    if len(labels):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), labels.astype("int64"))
+    tune(index, spec)
+    return index
+
+
+def tune(index, spec: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply search-time knobs (nprobe / efSearch) to a loaded index."""
+    ps = faiss.ParameterSpace()
+    if spec.startswith("IVF"):
+        ps.set_index_parameter(index, "nprobe", nprobe or IVF_NPROBE)
+    elif spec.startswith("HNSW"):
+        ps.set_index_parameter(index, "efSearch", ef_search or HNSW_EF_SEARCH)
+
+
+def search_params(spec: str, sel):
+    """faiss SearchParameters restricting a search to the ids `sel` selects, with the tuned knobs."""
+    if spec.startswith("IVF"):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=IVF_NPROBE)
+    if spec.startswith("HNSW"):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=HNSW_EF_SEARCH)
+    return faiss.SearchParameters(sel=sel)
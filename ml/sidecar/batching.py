@@ -0,0 +1,368 @@
+import queue, threading, time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
+import torch
+
+# Iteration-level ("continuous") batching for a causal LM.
+#
+# One worker thread owns the model. Every decode step it admits queued
+# prompts into the running batch (prefilled in length-bucketed groups, then
+# left-padded into the shared KV cache), samples one token per row with that
+# row's own parameters, retires finished rows and runs a single forward pass
+# for everything still generating. Works on CPU and CUDA alike.
+
+
+def _to_legacy(past):
+    """Per-layer (key, value) tensors from whatever cache object the model returned."""
+    if hasattr(past, "layers"):                 # transformers >= 4.56
+        return [(layer.keys, layer.values) for layer in past.layers]
+    if hasattr(past, "key_cache"):
+        return list(zip(past.key_cache, past.value_cache))
+    return list(past)
+
+
+def _from_legacy(layers):
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    cache = DynamicCache()
+    for i, (k, v) in enumerate(layers):
+        cache.update(k, v, i)
+    return cache
+
+
+def _left_pad(t: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - t.shape[dim]
+    if missing <= 0:
+        return t
+    shape = list(t.shape)
+    shape[dim] = missing
+    return torch.cat([t.new_zeros(shape), t], dim=dim)
+
+
+class _Seq:
+    """One request's decoding state."""
+
+    def __init__(self, prompt_ids: List[int], params: Dict[str, Any], fut: Future):
+        self.prompt_ids = prompt_ids
+        self.generated: List[int] = []
+        self.tokens = list(prompt_ids)      # prompt + generated
+        self.fut = fut
+        self.temperature = float(params.get("temperature", 1.0))
+        self.top_p = float(params.get("top_p", 1.0))
+        self.max_new_tokens = int(params.get("max_new_tokens", 128))
+        self.min_new_tokens = int(params.get("min_new_tokens", 0))
+        self.max_time = float(params.get("max_time", 0) or 0)
+        self.repetition_penalty = float(params.get("repetition_penalty", 1.0))
+        self.no_repeat_ngram_size = int(params.get("no_repeat_ngram_size", 0))
+        self.on_token = params.get("on_token")     # called with each new token id (worker thread)
+        self.segments = list(params.get("segments") or [])  # prompt offsets where reusable prefixes end
+        self.cached_len = 0                 # prompt tokens served from the prefix cache
+        self.cached_kv = None
+        self.cached_depth = 0
+        self.prefill_ms = 0
+        self.queued_at = time.monotonic()
+        self.started_at = 0.0
+        self.max_batch_seen = 0
+        # repetition-penalty support: token ids seen so far (prompt + generated)
+        self.seen = set(prompt_ids)
+        self.seen_t: Optional[torch.Tensor] = None
+        # no-repeat-ngram support: (n-1)-gram -> tokens that followed it
+        self.ngrams: Dict[Tuple[int, ...], set] = {}
+        for i in range(len(prompt_ids)):
+            self._note_ngram(i)
+
+    def _note_ngram(self, end: int) -> None:
+        n = self.no_repeat_ngram_size
+        if n <= 0 or end + 1 < n:
+            return
+        key = tuple(self.tokens[end - n + 1:end])
+        self.ngrams.setdefault(key, set()).add(self.tokens[end])
+
+    def banned(self) -> List[int]:
+        n = self.no_repeat_ngram_size
+        if n <= 0 or len(self.tokens) < n - 1:
+            return []
+        key = tuple(self.tokens[len(self.tokens) - n + 1:]) if n > 1 else ()
+        return list(self.ngrams.get(key, ()))
+
+    def append(self, token: int) -> None:
+        self.generated.append(token)
+        self.tokens.append(token)
+        if token not in self.seen:
+            self.seen.add(token)
+            self.seen_t = None
+        self._note_ngram(len(self.tokens) - 1)
+
+
+class Scheduler:
+    """Queue prompts and decode them together as a dynamic batch."""
+
+    def __init__(self, model, pad_token_id: int, eos_token_ids: List[int], *,
+                 max_batch: int = 8, wait_ms: float = 10.0, bucket_ratio: float = 1.5,
+                 prefix_cache=None):
+        self.model = model
+        self.prefix_cache = prefix_cache     # optional prefix_cache.PrefixCache
+        self.pad_token_id = pad_token_id
+        self.eos_token_ids = list(eos_token_ids)
+        self.max_batch = max_batch
+        self.wait_ms = wait_ms
+        self.bucket_ratio = bucket_ratio     # max longest/shortest prompt length within one prefill
+        self._queue: "queue.Queue[_Seq]" = queue.Queue()
+        self._active: List[_Seq] = []
+        self._past = None                    # legacy cache: per layer (k, v), [B, heads, T, dim]
+        self._mask: Optional[torch.Tensor] = None       # [B, T]
+        self._logits: Optional[torch.Tensor] = None     # [B, vocab], next-token logits per row
+        self._thread = threading.Thread(target=self._run, name="gen-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def device(self):
+        return next(self.model.parameters()).device
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def active(self) -> int:
+        return len(self._active)
+
+    def submit(self, prompt_ids: List[int], **params) -> Future:
+        """Queue a tokenized prompt. The future resolves to (generated_ids, meta).
+
+        Pass on_token=callable to be told about every token as it is sampled, and
+        segments=[offsets] to let the prefix cache reuse KV up to those offsets.
+        """
+        fut: Future = Future()
+        self._queue.put(_Seq(list(prompt_ids), params, fut))
+        return fut
+
+    # -------- worker --------
+    def _run(self):
+        while True:
+            try:
+                pending = self._take()
+                if pending:
+                    self._admit(pending)
+                if self._active:
+                    self._step()
+            except Exception as e:   # keep the worker alive; fail only the affected requests
+                for s in self._active:
+                    if not s.fut.done():
+                        s.fut.set_exception(e)
+                self._active, self._past, self._mask, self._logits = [], None, None, None
+
+    def _take(self) -> List[_Seq]:
+        free = self.max_batch - len(self._active)
+        if free <= 0:
+            return []
+        pending: List[_Seq] = []
+        if not self._active:
+            # idle: block for the first request, then gather a batch for wait_ms
+            pending.append(self._queue.get())
+            deadline = time.monotonic() + self.wait_ms / 1000.0
+            while len(pending) < free:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            # busy: join whatever is already waiting between decode steps
+            while len(pending) < free:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return pending
+
+    def _groups(self, seqs: List[_Seq]) -> List[List[_Seq]]:
+        """Bucket prompts that share a cached prefix and have similar uncached lengths,
+        so prefill wastes little compute on padding."""
+        def key(s: _Seq):
+            return hash(tuple(s.prompt_ids[:s.cached_len])), len(s.prompt_ids) - s.cached_len
+
+        seqs = sorted(seqs, key=key)
+        groups: List[List[_Seq]] = []
+        for s in seqs:
+            if groups and key(s)[0] == key(groups[-1][0])[0] and \
+                    key(s)[1] <= self.bucket_ratio * key(groups[-1][0])[1]:
+                groups[-1].append(s)
+            else:
+                groups.append([s])
+        return groups
+
+    def _prefill(self, group: List[_Seq]):
+        """Run the prompts of one group; returns (legacy past, mask, last logits).
+
+        Rows share the group's cached prefix; their uncached suffixes are
+        left-padded after it, so the mask may have a hole between the two.
+        """
+        n = group[0].cached_len
+        suffixes = [s.prompt_ids[n:] for s in group]
+        length = max(len(t) for t in suffixes)
+        ids = torch.full((len(group), length), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(group), n + length), dtype=torch.long)
+        mask[:, :n] = 1
+        for i, t in enumerate(suffixes):
+            ids[i, length - len(t):] = torch.tensor(t, dtype=torch.long)
+            mask[i, n + length - len(t):] = 1
+        ids, mask = ids.to(self.device), mask.to(self.device)
+        pos = (mask.cumsum(-1) - 1).clamp(min=0)[:, n:]
+        past = None
+        if n:
+            b = len(group)
+            past = _from_legacy([(k.expand(b, -1, -1, -1), v.expand(b, -1, -1, -1))
+                                 for k, v in group[0].cached_kv])
+        out = self.model(input_ids=ids, attention_mask=mask, position_ids=pos,
+                         past_key_values=past, use_cache=True)
+        return _to_legacy(out.past_key_values), mask, out.logits[:, -1, :].float()
+
+    def _remember(self, group: List[_Seq], past, mask: torch.Tensor) -> None:
+        """Offer each row's freshly computed prefix segments to the prefix cache."""
+        for i, s in enumerate(group):
+            s.cached_kv = None
+            if not s.segments:
+                continue
+            cols = mask[i].nonzero().squeeze(-1)     # cache columns holding this row's tokens
+
+            def kv_of(a: int, b: int, i=i, cols=cols):
+                c = cols[a:b]
+                return [(k[i:i + 1].index_select(2, c), v[i:i + 1].index_select(2, c)) for k, v in past]
+
+            self.prefix_cache.observe(s.prompt_ids, s.segments, s.cached_depth, kv_of)
+
+    def _merge(self, past, mask: torch.Tensor, logits: torch.Tensor) -> None:
+        """Append prefilled rows to the running batch, left-padding caches to a common length."""
+        if self._past is None:
+            self._past, self._mask, self._logits = list(past), mask, logits
+            return
+        length = max(self._mask.shape[1], mask.shape[1])
+        self._past = [
+            (torch.cat([_left_pad(k0, length, 2), _left_pad(k1, length, 2)], dim=0),
+             torch.cat([_left_pad(v0, length, 2), _left_pad(v1, length, 2)], dim=0))
+            for (k0, v0), (k1, v1) in zip(self._past, past)
+        ]
+        self._mask = torch.cat([_left_pad(self._mask, length, 1), _left_pad(mask, length, 1)], dim=0)
+        self._logits = torch.cat([self._logits, logits], dim=0)
+
+    def _admit(self, seqs: List[_Seq]) -> None:
+        if self.prefix_cache is not None:
+            for s in seqs:
+                if s.segments:
+                    s.cached_len, s.cached_kv, s.cached_depth = self.prefix_cache.match(s.prompt_ids, s.segments)
+        with torch.inference_mode():
+            for group in self._groups(seqs):
+                now = time.monotonic()
+                for s in group:
+                    s.started_at = now
+                try:
+                    past, mask, logits = self._prefill(group)
+                    if mask.is_cuda:
+                        torch.cuda.synchronize(mask.device)
+                    prefill_ms = int((time.monotonic() - now) * 1000)
+                    if self.prefix_cache is not None:
+                        self._remember(group, past, mask)
+                except Exception as e:
+                    for s in group:
+                        s.fut.set_exception(e)
+                    continue
+                for s in group:
+                    s.prefill_ms = prefill_ms
+                self._merge(past, mask, logits)
+                self._active.extend(group)
+
+    def _sample(self) -> List[int]:
+        logits = self._logits
+        dev = logits.device
+        for i, s in enumerate(self._active):
+            row = logits[i]
+            if s.repetition_penalty != 1.0:
+                if s.seen_t is None:
+                    s.seen_t = torch.tensor(sorted(s.seen), dtype=torch.long, device=dev)
+                picked = row[s.seen_t]
+                row[s.seen_t] = torch.where(picked < 0, picked * s.repetition_penalty, picked / s.repetition_penalty)
+            banned = s.banned()
+            if banned:
+                row[banned] = -float("inf")
+            if len(s.generated) < s.min_new_tokens:
+                row[self.eos_token_ids] = -float("inf")
+
+        greedy = torch.tensor([s.temperature <= 0 for s in self._active], device=dev)
+        temps = torch.tensor([max(s.temperature, 1e-5) for s in self._active], device=dev)
+        top_p = torch.tensor([s.top_p for s in self._active], device=dev)
+
+        probs = torch.softmax(logits / temps[:, None], dim=-1)
+        sorted_p, order = probs.sort(dim=-1, descending=True)
+        cum = sorted_p.cumsum(-1)
+        sorted_p[(cum - sorted_p) > top_p[:, None]] = 0.0   # nucleus; the top token always survives
+        pick = torch.multinomial(sorted_p / sorted_p.sum(-1, keepdim=True), 1).squeeze(-1)
+        sampled = order.gather(-1, pick[:, None]).squeeze(-1)
+        tokens = torch.where(greedy, logits.argmax(-1), sampled)
+        return tokens.tolist()
+
+    def _finish(self, s: _Seq, reason: str) -> None:
+        now = time.monotonic()
+        s.fut.set_result((s.generated, {
+            "prompt_len": len(s.prompt_ids),
+            "cached_tokens": s.cached_len,
+            "prefill_ms": s.prefill_ms,
+            "gen_len": len(s.generated),
+            "finish_reason": reason,
+            "queue_ms": int((s.started_at - s.queued_at) * 1000),
+            "gen_ms": int((now - s.started_at) * 1000),
+            "max_batch": s.max_batch_seen,
+        }))
+
+    def _step(self) -> None:
+        with torch.inference_mode():
+            tokens = self._sample()
+            now = time.monotonic()
+            keep: List[int] = []
+            for i, (s, tok) in enumerate(zip(self._active, tokens)):
+                s.max_batch_seen = max(s.max_batch_seen, len(self._active))
+                if tok in self.eos_token_ids:
+                    self._finish(s, "eos")
+                    continue
+                s.append(tok)
+                if s.on_token is not None:
+                    try:
+                        s.on_token(tok)
+                    except Exception:
+                        s.on_token = None   # a broken consumer must not stall the batch
+                if len(s.generated) >= s.max_new_tokens:
+                    self._finish(s, "length")
+                elif s.max_time and now - s.started_at >= s.max_time:
+                    self._finish(s, "time")
+                else:
+                    keep.append(i)
+
+            if len(keep) < len(self._active):
+                self._retain(keep)
+            if not self._active:
+                return
+
+            dev = self._mask.device
+            ids = torch.tensor([[s.generated[-1]] for s in self._active], dtype=torch.long, device=dev)
+            self._mask = torch.cat([self._mask, self._mask.new_ones((len(self._active), 1))], dim=1)
+            pos = self._mask.sum(-1, keepdim=True) - 1
+            out = self.model(input_ids=ids, attention_mask=self._mask, position_ids=pos,
+                             past_key_values=_from_legacy(self._past), use_cache=True)
+            self._past = _to_legacy(out.past_key_values)
+            self._logits = out.logits[:, -1, :].float()
+
+    def _retain(self, keep: List[int]) -> None:
+        self._active = [self._active[i] for i in keep]
+        if not keep:
+            self._past, self._mask, self._logits = None, None, None
+            return
+        idx = torch.tensor(keep, dtype=torch.long, device=self._mask.device)
+        mask = self._mask.index_select(0, idx)
+        # drop leading columns that are padding for every remaining row
+        lead = int((mask.sum(0) == 0).long().cumprod(0).sum())
+        self._mask = mask[:, lead:]
+        self._past = [(k.index_select(0, idx)[:, :, lead:], v.index_select(0, idx)[:, :, lead:])
+                      for k, v in self._past]
+        self._logits = self._logits.index_select(0, idx)
@@ -0,0 +1,290 @@
+import os, csv, json, threading, time, traceback, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import ingestion
+import metrics
+
+# -------- Config --------
+JOB_DIR = os.environ.get("BULK_JOB_DIR", os.path.join(os.path.dirname(__file__), "ingest_jobs"))
+BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "256"))              # docs embedded per batch
+CHECKPOINT_DOCS = int(os.environ.get("BULK_CHECKPOINT_DOCS", "5000"))   # docs between index commits
+MAX_RUNNING = int(os.environ.get("BULK_MAX_RUNNING", "1"))              # jobs processed concurrently
+MAX_UPLOAD_BYTES = int(float(os.environ.get("BULK_MAX_UPLOAD_MB", "2048")) * 1024 * 1024)
+MAX_ERROR_SAMPLES = 20
+
+# Background bulk ingestion. An upload (NDJSON or CSV) is spooled to disk,
+# then parsed as a stream, embedded BATCH_SIZE docs at a time and appended to
+# the tenant's store, which is committed every CHECKPOINT_DOCS docs. Job state
+# is persisted next to the spool file, so a job interrupted by a restart can
+# be resumed from its last checkpoint.
+
+FORMATS = ("ndjson", "csv")
+_KNOWN = ("id", "title", "question", "answer", "url")
+_FIELDS = _KNOWN + ("metadata", "tags", "attributes")      # the /ingest Document schema
+_FINISHED = ("done", "failed", "cancelled", "interrupted")
+
+
+class Job:
+    def __init__(self, job_id: str, tenant_id: str, dataset_type: str, fmt: str):
+        self.id = job_id
+        self.tenant_id = tenant_id
+        self.dataset_type = dataset_type
+        self.format = fmt
+        self.state = "receiving"        # receiving | queued | running | done | failed | cancelled | interrupted
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.bytes_total = 0
+        self.bytes_read = 0
+        self.records_read = 0
+        self.records_committed = 0      # records (valid or not) covered by the last checkpoint
+        self.committed = 0              # documents published to the index
+        self.reused = 0
+        self.computed = 0
+        self.checkpoints = 0
+        self.errors = 0
+        self.error_samples: List[str] = []
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {"job_id": self.id}
+        d.update((k, v) for k, v in self.__dict__.items() if k not in ("id", "cancel_requested"))
+        d["progress"] = round(self.bytes_read / self.bytes_total, 4) if self.bytes_total else None
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Job":
+        job = cls(d["job_id"], d["tenant_id"], d["dataset_type"], d["format"])
+        for k, v in d.items():
+            if k in job.__dict__:
+                setattr(job, k, v)
+        return job
+
+
+_jobs: Dict[str, Job] = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=max(1, MAX_RUNNING), thread_name_prefix="bulk-ingest")
+
+
+def spool_path(job_id: str) -> str:
+    return os.path.join(JOB_DIR, f"{job_id}.src")
+
+def _state_path(job_id: str) -> str:
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+def _save(job: Job) -> None:
+    tmp = _state_path(job.id) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job.to_dict(), f)
+    os.replace(tmp, _state_path(job.id))
+
+
+# -------- Parsing --------
+def _parse_value(v: str):
+    v = v.strip()
+    if v[:1] in ("{", "["):
+        try:
+            return json.loads(v)
+        except ValueError:
+            pass
+    return v
+
+def _row_to_doc(row: Dict[str, Optional[str]], dataset_type: str) -> Dict[str, Any]:
+    """Map a CSV row onto the /ingest document shape; unknown columns become attributes/metadata."""
+    doc: Dict[str, Any] = {k: (row.get(k) or "").strip() or None for k in _KNOWN}
+    tags = (row.get("tags") or "").replace("|", ";")
+    doc["tags"] = [t.strip() for t in tags.split(";") if t.strip()] or None
+    extra = {k: _parse_value(v) for k, v in row.items()
+             if k and k not in _KNOWN and k != "tags" and v not in (None, "")}
+    doc["attributes" if dataset_type == "products" else "metadata"] = extra or None
+    return doc
+
+def _records(job: Job) -> Iterator[Any]:
+    """Yield each raw record of the spooled upload, counting bytes as they are read."""
+    def lines():
+        with open(spool_path(job.id), "rb") as f:
+            for raw in f:
+                job.bytes_read += len(raw)
+                yield raw.decode("utf-8-sig")
+
+    if job.format == "csv":
+        yield from csv.DictReader(lines())
+        return
+    for line in lines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+def _to_doc(job: Job, record: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(record, Exception):
+        problem = f"invalid JSON: {record}"
+    elif not isinstance(record, dict):
+        problem = "not an object"
+    else:
+        if job.format == "csv":
+            doc = _row_to_doc(record, job.dataset_type)
+        else:
+            doc = {k: record.get(k) for k in _FIELDS}
+        if doc.get("id") not in (None, ""):
+            doc["id"] = str(doc["id"])
+            return doc
+        problem = "missing id"
+    job.errors += 1
+    if len(job.error_samples) < MAX_ERROR_SAMPLES:
+        job.error_samples.append(f"record {job.records_read}: {problem}")
+    return None
+
+def _batches(job: Job, skip: int, consumed: List[int]) -> Iterator[List[Dict[str, Any]]]:
+    """Fixed-size document batches; consumed[0] counts the records behind every batch handed out."""
+    batch: List[Dict[str, Any]] = []
+    n = 0
+    for record in _records(job):
+        n += 1
+        if n <= skip:
+            continue                    # already committed by an earlier run
+        job.records_read = n
+        doc = _to_doc(job, record)
+        if doc is not None:
+            batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            consumed[0] = n
+            yield batch
+            batch = []
+    job.records_read = n
+    consumed[0] = n
+    if batch:
+        yield batch
+
+
+# -------- Running --------
+def _run(job: Job) -> None:
+    if job.cancel_requested:
+        _finish(job, "cancelled")
+        return
+    job.state, job.started_at, job.bytes_read = "running", time.time(), 0
+    _save(job)
+    base = {"count": job.committed, "reused": job.reused, "computed": job.computed, "checkpoints": job.checkpoints}
+    consumed = [job.records_committed]
+
+    def on_checkpoint(totals: Dict[str, int]) -> None:
+        job.records_committed = consumed[0]
+        job.committed = base["count"] + totals["count"]
+        job.reused = base["reused"] + totals["reused"]
+        job.computed = base["computed"] + totals["computed"]
+        job.checkpoints = base["checkpoints"] + totals["checkpoints"]
+        _save(job)
+
+    try:
+        with metrics.timed("ingest.bulk"):
+            ingestion.upsert_batches(
+                job.tenant_id,
+                _batches(job, job.records_committed, consumed),
+                CHECKPOINT_DOCS,
+                on_checkpoint=on_checkpoint,
+                should_stop=lambda: job.cancel_requested,
+            )
+        _finish(job, "cancelled" if job.cancel_requested else "done")
+    except Exception as e:
+        job.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        _finish(job, "failed")
+
+def _finish(job: Job, state: str) -> None:
+    job.state, job.finished_at = state, time.time()
+    if state == "done":
+        job.bytes_read = job.bytes_total
+        try:
+            os.remove(spool_path(job.id))
+        except OSError:
+            pass
+    _save(job)
+    metrics.REQUESTS.inc(route="/ingest/bulk", outcome=state)
+
+
+# -------- Public API --------
+def create(tenant_id: str, dataset_type: str, fmt: str) -> Job:
+    """Register a job in the 'receiving' state; the caller writes the upload to spool_path(job.id)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    os.makedirs(JOB_DIR, exist_ok=True)
+    job = Job(uuid.uuid4().hex, tenant_id, dataset_type, fmt)
+    with _lock:
+        _jobs[job.id] = job
+    _save(job)
+    return job
+
+def submit(job: Job) -> None:
+    """Queue a received (or resumable) job for processing."""
+    job.bytes_total = os.path.getsize(spool_path(job.id))
+    job.state, job.cancel_requested, job.error = "queued", False, None
+    _save(job)
+    _executor.submit(_run, job)
+
+def abandon(job: Job, reason: str) -> None:
+    """Drop a job whose upload never completed."""
+    job.error = reason
+    _finish(job, "failed")
+    try:
+        os.remove(spool_path(job.id))
+    except OSError:
+        pass
+
+def get(job_id: str) -> Optional[Job]:
+    with _lock:
+        return _jobs.get(job_id)
+
+def list_jobs(tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    with _lock:
+        jobs = list(_jobs.values())
+    return [j.to_dict() for j in sorted(jobs, key=lambda j: j.created_at, reverse=True)
+            if tenant_id is None or j.tenant_id == tenant_id]
+
+def cancel(job_id: str) -> Optional[Job]:
+    """Stop a queued or running job; work since its last checkpoint is discarded."""
+    job = get(job_id)
+    if job is not None and job.state not in _FINISHED:
+        job.cancel_requested = True
+    return job
+
+def resume(job_id: str) -> Optional[Job]:
+    """Restart a stopped job from its last checkpoint. Returns None if it cannot be resumed."""
+    job = get(job_id)
+    if job is None or job.state not in ("failed", "cancelled", "interrupted") or not os.path.exists(spool_path(job.id)):
+        return None
+    submit(job)
+    return job
+
+
+def _load() -> None:
+    """Pick up jobs from a previous run; anything that was in flight is marked interrupted."""
+    if not os.path.isdir(JOB_DIR):
+        return
+    for name in os.listdir(JOB_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(JOB_DIR, name), encoding="utf-8") as f:
+                job = Job.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            continue
+        if job.state == "receiving":
+            job.state, job.error = "failed", "upload did not complete"
+        elif job.state not in _FINISHED:
+            job.state = "interrupted"
+        _jobs[job.id] = job
+
+
+def _collect():
+    with _lock:
+        states = [j.state for j in _jobs.values()]
+    return [("sidecar_bulk_jobs", "gauge", "Bulk ingestion jobs by state.",
+             [({"state": s}, states.count(s)) for s in sorted(set(states))])]
+
+
+_load()
+metrics.register_collector(_collect)
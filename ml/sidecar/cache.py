@@ -1,52 +1,211 @@
-import time
-from typing import Dict, Tuple, Optional
+import os, re, time, threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-# -------- Config --------
-_EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-_embedder = SentenceTransformer(_EMB_MODEL)
+import embedder
+import metrics
 
-# Cache: {(tenant_id, query): (answer, embedding, timestamp)}
-_cache: Dict[Tuple[str, str], Tuple[str, np.ndarray, float]] = {}
+# TTL, similarity threshold and per-tenant capacity
+TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "1800"))       # expire after 30 minutes
+SIM_THRESHOLD = float(os.environ.get("CACHE_SIM_THRESHOLD", "0.92"))   # cosine similarity threshold for hit
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2048"))         # LRU cap per tenant
 
-# TTL and similarity threshold
-TTL_SECONDS = 1800        # expire after 30 minutes
-SIM_THRESHOLD = 0.92      # cosine similarity threshold for hit
 
+_PUNCT_TAIL = re.compile(r"[\s?!.]+$")
 
-def _embed(text: str) -> np.ndarray:
-    """Embed and normalize a single text string."""
-    v = _embedder.encode([text], convert_to_numpy=True).astype("float32")
-    v = v / (np.linalg.norm(v, axis=1, keepdims=True) + 1e-12)
-    return v[0]
 
+def normalize_query(query: str) -> str:
+    """Key for exact matching: case-folded, whitespace-collapsed, trailing punctuation dropped."""
+    return _PUNCT_TAIL.sub("", " ".join(query.casefold().split()))
 
-def get(tenant_id: str, query: str) -> Optional[str]:
-    """Check cache for a semantically close query. Return answer if hit."""
-    now = time.time()
-    qv = _embed(query)
 
-    best_sim, best_ans = -1.0, None
-    for (tid, q), (ans, emb, ts) in list(_cache.items()):
-        if tid != tenant_id:
-            continue
-        # expire old entries
-        if now - ts > TTL_SECONDS:
-            del _cache[(tid, q)]
-            continue
-        sim = float(np.dot(qv, emb))
-        if sim > best_sim:
-            best_sim, best_ans = sim, ans
+class _TenantCache:
+    """One tenant's entries, with embeddings packed into a float32 matrix.
 
-    if best_sim >= SIM_THRESHOLD:
-        return best_ans
-    return None
+    Rows are slots; freed slots are zeroed and reused. `_lru` maps normalized
+    queries to slots, doubling as the exact-match table, and orders them by
+    last use (for the size cap); `_expiry` orders them by write time, so both
+    eviction paths pop from the front in O(1).
+    """
 
+    def __init__(self, dim: int):
+        self.lock = threading.Lock()
+        self._vecs = np.zeros((16, dim), dtype="float32")
+        self._answers: List[Optional[str]] = [None] * 16
+        self._queries: List[Optional[str]] = [None] * 16
+        self._written = np.zeros(16, dtype="float64")
+        self._used = 0                      # high-water mark of slots ever used
+        self._free: List[int] = []
+        self._lru: "OrderedDict[str, int]" = OrderedDict()   # query -> slot
+        self._expiry: deque = deque()       # (written_at, query, slot), oldest first
 
-def put(tenant_id: str, query: str, answer: str) -> None:
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _release(self, query: str) -> None:
+        slot = self._lru.pop(query)
+        self._vecs[slot] = 0.0
+        self._answers[slot] = None
+        self._queries[slot] = None
+        self._free.append(slot)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - TTL_SECONDS
+        while self._expiry and self._expiry[0][0] <= cutoff:
+            ts, query, slot = self._expiry.popleft()
+            # skip stale records left behind by a re-put or an LRU eviction
+            if self._lru.get(query) == slot and self._written[slot] == ts:
+                self._release(query)
+
+    def _grow(self) -> None:
+        cap = self._vecs.shape[0] * 2
+        vecs = np.zeros((cap, self._vecs.shape[1]), dtype="float32")
+        vecs[:self._used] = self._vecs[:self._used]
+        written = np.zeros(cap, dtype="float64")
+        written[:self._used] = self._written[:self._used]
+        self._vecs, self._written = vecs, written
+        pad = [None] * (cap - len(self._answers))
+        self._answers += pad
+        self._queries += list(pad)
+
+    def lookup_exact(self, key: str, now: float) -> Optional[str]:
+        slot = self._lru.get(key)
+        if slot is None or now - self._written[slot] > TTL_SECONDS:
+            return None
+        self._lru.move_to_end(key)
+        return self._answers[slot]
+
+    def lookup(self, qv: np.ndarray, now: float) -> Optional[str]:
+        self._expire(now)
+        if not self._lru:
+            return None
+        sims = self._vecs[:self._used] @ qv
+        slot = int(np.argmax(sims))
+        answer = self._answers[slot]
+        if answer is None or sims[slot] < SIM_THRESHOLD:
+            return None
+        self._lru.move_to_end(self._queries[slot])
+        return answer
+
+    def store(self, query: str, answer: str, qv: np.ndarray, now: float) -> None:
+        self._expire(now)
+        slot = self._lru.get(query)
+        if slot is None:
+            while len(self._lru) >= MAX_ENTRIES:
+                self._release(next(iter(self._lru)))
+            if self._free:
+                slot = self._free.pop()
+            else:
+                if self._used == self._vecs.shape[0]:
+                    self._grow()
+                slot = self._used
+                self._used += 1
+            self._lru[query] = slot
+        else:
+            self._lru.move_to_end(query)
+        self._vecs[slot] = qv
+        self._answers[slot] = answer
+        self._queries[slot] = query
+        self._written[slot] = now
+        self._expiry.append((now, query, slot))
+
+
+_tenants: Dict[str, _TenantCache] = {}
+_tenants_lock = threading.Lock()
+# bumped by clear(): answers computed before a tenant's docs changed must not be stored after it
+_epochs: Dict[str, int] = {}
+
+_counters = {"exact_hits": 0, "exact_misses": 0, "semantic_hits": 0, "semantic_misses": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def get_exact(tenant_id: str, query: str) -> Optional[str]:
+    """Return the answer cached for the same normalized query, without embedding."""
+    with metrics.timed("cache.exact"):
+        tc = _tenants.get(tenant_id)
+        answer = None
+        if tc is not None:
+            key = normalize_query(query)
+            with tc.lock:
+                answer = tc.lookup_exact(key, time.time())
+    _count("exact_hits" if answer is not None else "exact_misses")
+    return answer
+
+
+def get(tenant_id: str, query: str, qv: Optional[np.ndarray] = None) -> Optional[str]:
+    """Check cache for a semantically close query. Return answer if hit.
+
+    Pass the already-computed query vector as `qv` to avoid a second embedding.
+    """
+    with metrics.timed("cache.semantic"):
+        tc = _tenants.get(tenant_id)
+        answer = None
+        if tc is not None:
+            if qv is None:
+                qv = embedder.encode_query(query)
+            with tc.lock:
+                answer = tc.lookup(qv, time.time())
+    _count("semantic_hits" if answer is not None else "semantic_misses")
+    return answer
+
+
+def tenant_epoch(tenant_id: str) -> int:
+    """Take before retrieving; pass to put() so an answer outdated by a clear() is dropped."""
+    return _epochs.get(tenant_id, 0)
+
+
+def put(tenant_id: str, query: str, answer: str, qv: Optional[np.ndarray] = None,
+        epoch: Optional[int] = None) -> None:
     """Store query + answer in cache."""
     try:
-        _cache[(tenant_id, query)] = (answer, _embed(query), time.time())
+        with metrics.timed("cache.put"):
+            if qv is None:
+                qv = embedder.encode_query(query)
+            with _tenants_lock:
+                if epoch is not None and epoch != _epochs.get(tenant_id, 0):
+                    return              # the tenant's docs changed while this answer was being built
+                tc = _tenants.get(tenant_id)
+                if tc is None:
+                    tc = _tenants[tenant_id] = _TenantCache(qv.shape[0])
+            with tc.lock:
+                tc.store(normalize_query(query), answer, qv, time.time())
     except Exception:
         pass  # fail silently
+
+
+def clear(tenant_id: str) -> None:
+    """Drop every cached answer for a tenant."""
+    with _tenants_lock:
+        _tenants.pop(tenant_id, None)
+        _epochs[tenant_id] = _epochs.get(tenant_id, 0) + 1
+
+
+def stats() -> Dict[str, int]:
+    """Hit/miss counters for each cache layer plus the number of live entries."""
+    with _counters_lock:
+        out = dict(_counters)
+    out["entries"] = sum(len(tc) for tc in list(_tenants.values()))
+    return out
+
+
+def _collect():
+    s = stats()
+    lookups, ratios = [], []
+    for layer in ("exact", "semantic"):
+        hits, misses = s[f"{layer}_hits"], s[f"{layer}_misses"]
+        lookups += [({"layer": layer, "result": "hit"}, hits), ({"layer": layer, "result": "miss"}, misses)]
+        ratios.append(({"layer": layer}, hits / (hits + misses) if hits + misses else 0.0))
+    return [
+        ("sidecar_cache_lookups_total", "counter", "Answer-cache lookups by layer and result.", lookups),
+        ("sidecar_cache_hit_ratio", "gauge", "Answer-cache hit ratio since start, by layer.", ratios),
+        ("sidecar_cache_entries", "gauge", "Cached answers across tenants.", [({}, s["entries"])]),
+    ]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,138 @@
+import os, queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import metrics
+
+# -------- Config --------
+EMB_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", "5"))   # how long to gather concurrent queries
+MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "64"))
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch").lower()   # torch | onnx | onnx-int8
+EMBED_ONNX_FILE = os.environ.get("EMBED_ONNX_FILE", "")             # overrides the file picked for the backend
+
+# ONNX exports inside the model repo; the sentence-transformers hub models ship
+# both, the int8 one dynamically quantized for AVX2 CPUs. Check a backend
+# against torch with ml/scripts/check_embedder_parity.py before switching.
+# Stores are tagged with model_id(), so a switch re-embeds each store on its next write.
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+
+# -------- Load the encoder once for the whole sidecar, on first use or from the startup loader --------
+_model = None
+_load_lock = threading.Lock()
+
+
+def onnx_file(backend: str) -> str:
+    return EMBED_ONNX_FILE or ONNX_FILES[backend]
+
+
+def model_id() -> str:
+    """Tag for stored vectors: EMB_MODEL, plus the ONNX file for the onnx backends."""
+    if EMBED_BACKEND == "torch":
+        return EMB_MODEL            # what stores written before the ONNX backends carry
+    return f"{EMB_MODEL}#{EMBED_ONNX_FILE or ONNX_FILES.get(EMBED_BACKEND, EMBED_BACKEND)}"
+
+
+def load_backend(backend: str) -> SentenceTransformer:
+    """A fresh encoder for EMB_MODEL on the given backend."""
+    if backend == "torch":
+        return SentenceTransformer(EMB_MODEL)
+    if backend not in ONNX_FILES:
+        raise ValueError(f"Unknown EMBED_BACKEND '{backend}'")
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"EMBED_BACKEND={backend} needs the onnxruntime and optimum packages") from e
+    return SentenceTransformer(EMB_MODEL, backend="onnx", model_kwargs={"file_name": onnx_file(backend)})
+
+
+def load() -> SentenceTransformer:
+    """Load the encoder (idempotent; concurrent callers wait for the same load)."""
+    global _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                _model = load_backend(EMBED_BACKEND)
+    return _model
+
+
+def info() -> Dict[str, Any]:
+    return {
+        "model": EMB_MODEL,
+        "backend": EMBED_BACKEND,
+        "onnx_file": onnx_file(EMBED_BACKEND) if EMBED_BACKEND in ONNX_FILES else None,
+    }
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
+    return v / norms
+
+
+def encode(texts: List[str], batch_size: int = MAX_BATCH) -> np.ndarray:
+    """Encode texts directly (bulk callers such as ingestion). Returns normalized float32 rows."""
+    if not texts:
+        return np.zeros((0, dim()), dtype="float32")
+    v = load().encode(texts, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+    return _normalize(v)
+
+
+def dim() -> int:
+    return int(load().get_sentence_embedding_dimension())
+
+
+# -------- Micro-batching for query-time encodes --------
+_queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run_batches():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT_MS / 1000.0
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            vecs = encode([text for text, _ in batch])
+            for (_, fut), v in zip(batch, vecs):
+                fut.set_result(v)
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_batches, name="embed-batcher", daemon=True)
+            _worker.start()
+
+
+def encode_query(text: str) -> np.ndarray:
+    """Encode one query, sharing a forward pass with any concurrent callers."""
+    _ensure_worker()
+    fut: Future = Future()
+    _queue.put((text, fut))
+    return fut.result()
+
+
+metrics.register_collector(lambda: [
+    ("sidecar_embed_queue_depth", "gauge", "Query encodes waiting for the micro-batcher.", [({}, _queue.qsize())]),
+])
@@ -0,0 +1,268 @@
+import os, math, re
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# -------- Config --------
+MAX_VALUE_LEN = int(os.environ.get("FILTER_MAX_VALUE_LEN", "64"))    # longer strings are not keyword-indexed
+
+# Structured filters on a doc's tags, attributes and metadata, evaluated to a
+# row bitmap before the vector search. Two indexes per store segment back
+# them, both written at ingest (rows are numbered within the segment):
+#   keyword postings  "field=value" keys -> rows, sorted by key id like the BM25
+#                     postings; tags, short strings, booleans and numbers
+#   numeric columns   one float64 column per field that holds numbers (NaN where
+#                     absent), for ranges such as {"price": {"lt": 500}}
+# Fields are dotted paths ("attributes.category", "metadata.dims.width");
+# field names and string values compare case-insensitively.
+#
+# Filter spec, as sent with a query:
+#   {"tags": ["boots", "sizing"],                       every tag must be present
+#    "attributes": {"category": "Saddles",              equal
+#                   "color": ["black", "brown"],        any of
+#                   "price": {"gte": 100, "lt": 500},   range (gt, gte, lt, lte)
+#                   "stock": {"gt": 0}},
+#    "metadata": {"intent": {"in": ["returns", "refunds"]}}}
+
+SECTIONS = ("attributes", "metadata")
+RANGE_OPS = {
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+}
+_OPS = set(RANGE_OPS) | {"eq", "in"}
+_NUMBER = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)$")
+
+Condition = Tuple[str, str, Any]        # (field, op, operand)
+
+
+class FilterError(ValueError):
+    """A filter spec that can't be evaluated."""
+
+
+def _number(v: Any) -> Optional[float]:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v) if math.isfinite(v) else None
+    if isinstance(v, str):
+        s = v.strip().lstrip("$€£").replace(",", "")
+        if _NUMBER.match(s):
+            return float(s)
+    return None
+
+
+def _keyword(v: Any) -> Optional[str]:
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (int, float)):
+        n = _number(v)
+        if n is None:
+            return None
+        return str(int(n)) if n.is_integer() else repr(n)
+    if isinstance(v, str):
+        s = " ".join(v.casefold().split())
+        return s if 0 < len(s) <= MAX_VALUE_LEN else None
+    return None
+
+
+def _flatten(field: str, value: Any, out: List[Tuple[str, Any]]) -> None:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{field}.{str(k).casefold()}", v, out)
+    elif isinstance(value, list):
+        out.extend((field, v) for v in value if not isinstance(v, (dict, list)))
+    elif value is not None:
+        out.append((field, value))
+
+
+def extract(doc: Dict[str, Any]) -> Tuple[List[str], Dict[str, float]]:
+    """A doc's keyword keys and numeric values (first number per field)."""
+    pairs = [("tags", t) for t in doc.get("tags") or []]
+    for section in SECTIONS:
+        if isinstance(doc.get(section), dict):
+            _flatten(section, doc[section], pairs)
+    keys: List[str] = []
+    nums: Dict[str, float] = {}
+    for field, v in pairs:
+        kw = _keyword(v)
+        if kw is not None:
+            keys.append(f"{field}={kw}")
+        n = _number(v)
+        if n is not None and field != "tags":
+            nums.setdefault(field, n)
+    return list(dict.fromkeys(keys)), nums
+
+
+# -------- Parsing --------
+def _parse_fields(prefix: str, spec: Dict[str, Any], out: List[Condition]) -> None:
+    for k, v in spec.items():
+        field = f"{prefix}.{str(k).casefold()}"
+        if isinstance(v, dict) and v and set(v) <= _OPS:
+            for op, operand in v.items():
+                if op in RANGE_OPS:
+                    n = _number(operand)
+                    if n is None:
+                        raise FilterError(f"'{field}': '{op}' needs a number, got {operand!r}")
+                    out.append((field, op, n))
+                elif op == "in":
+                    if not isinstance(operand, list):
+                        raise FilterError(f"'{field}': 'in' needs a list")
+                    out.append((field, "in", operand))
+                else:
+                    out.append((field, "eq", operand))
+        elif isinstance(v, dict):
+            _parse_fields(field, v, out)          # nested object
+        elif isinstance(v, list):
+            out.append((field, "in", v))
+        else:
+            out.append((field, "eq", v))
+
+
+def parse(spec: Optional[Dict[str, Any]]) -> List[Condition]:
+    """Validate a filter spec and flatten it to conditions that must all hold. Raises FilterError."""
+    if not spec:
+        return []
+    if not isinstance(spec, dict):
+        raise FilterError("filters must be an object")
+    unknown = set(spec) - {"tags", *SECTIONS}
+    if unknown:
+        raise FilterError(f"unknown filter sections: {', '.join(sorted(unknown))}")
+    out: List[Condition] = []
+    tags = spec.get("tags") or []
+    for tag in [tags] if isinstance(tags, str) else tags:
+        out.append(("tags", "eq", tag))
+    for section in SECTIONS:
+        fields = spec.get(section) or {}
+        if not isinstance(fields, dict):
+            raise FilterError(f"'{section}' must be an object")
+        _parse_fields(section, fields, out)
+    return out
+
+
+# -------- Index --------
+class Index:
+    """Read-only filter index of one store segment."""
+
+    def __init__(self, keys: List[str], terms: np.ndarray, rows: np.ndarray,
+                 numeric_fields: List[str], numeric: np.ndarray, n_rows: int):
+        self.keys = keys
+        self.key_id: Dict[str, int] = {k: i for i, k in enumerate(keys)}
+        self.terms = terms              # int32 key ids, sorted
+        self.rows = rows                # int32
+        self.numeric_fields = numeric_fields
+        self.column: Dict[str, int] = {f: i for i, f in enumerate(numeric_fields)}
+        self.numeric = numeric          # float64, fields x rows
+        self.n_rows = n_rows
+        self.nbytes = terms.nbytes + rows.nbytes + numeric.nbytes
+
+    def _postings(self, key: str) -> np.ndarray:
+        kid = self.key_id.get(key)
+        if kid is None:
+            return self.rows[:0]
+        lo, hi = np.searchsorted(self.terms, [kid, kid + 1])
+        return self.rows[lo:hi]
+
+    def _equals(self, field: str, value: Any) -> np.ndarray:
+        n = _number(value)
+        if n is not None and field in self.column:
+            return self.numeric[self.column[field]] == n
+        m = np.zeros(self.n_rows, dtype=bool)
+        kw = _keyword(value)
+        if kw is not None:
+            m[self._postings(f"{field}={kw}")] = True
+        return m
+
+    def mask(self, conditions: List[Condition]) -> np.ndarray:
+        """Bitmap of the rows meeting every condition (dead rows never match)."""
+        m = np.ones(self.n_rows, dtype=bool)
+        for field, op, operand in conditions:
+            if op == "eq":
+                m &= self._equals(field, operand)
+            elif op == "in":
+                any_of = np.zeros(self.n_rows, dtype=bool)
+                for v in operand:
+                    any_of |= self._equals(field, v)
+                m &= any_of
+            elif field in self.column:
+                m &= RANGE_OPS[op](self.numeric[self.column[field]], operand)   # NaN never matches
+            else:
+                m[:] = False
+            if not m.any():
+                break
+        return m
+
+
+class Builder:
+    """Filter entries of the rows a Draft appends, numbered from 0."""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.key_id: Dict[str, int] = {}
+        self._new: Dict[int, Tuple[np.ndarray, Dict[str, float]]] = {}
+
+    def set(self, row: int, doc: Dict[str, Any]) -> None:
+        """(Re)index a row's doc."""
+        keys, nums = extract(doc)
+        ids = np.empty(len(keys), dtype="int32")
+        for i, key in enumerate(keys):
+            kid = self.key_id.get(key)
+            if kid is None:
+                kid = self.key_id[key] = len(self.keys)
+                self.keys.append(key)
+            ids[i] = kid
+        self._new[row] = (ids, nums)
+
+    def drop(self, row: int) -> None:
+        self._new.pop(row, None)
+
+    def index(self, n_rows: int) -> Index:
+        """The entries of rows [0, n_rows) as an Index."""
+        terms = np.zeros(0, dtype="int32")
+        rows = np.zeros(0, dtype="int32")
+        new = [(r, ids) for r, (ids, _) in self._new.items() if len(ids) and r < n_rows]
+        if new:
+            rows = np.concatenate([np.full(len(ids), r, dtype="int32") for r, ids in new])
+            terms = np.concatenate([ids for _, ids in new])
+            order = np.argsort(terms, kind="stable")
+            terms, rows = terms[order], rows[order]
+        fields: List[str] = []
+        for _, nums in self._new.values():
+            fields.extend(f for f in nums if f not in fields)
+        column = {f: i for i, f in enumerate(fields)}
+        numeric = np.full((len(fields), n_rows), np.nan, dtype="float64")
+        for r, (_, nums) in self._new.items():
+            if r < n_rows:
+                for f, v in nums.items():
+                    numeric[column[f], r] = v
+        return Index(self.keys, terms, rows, fields, numeric, n_rows)
+
+
+def merge(parts: List[Tuple[Index, np.ndarray]], n_rows: int) -> Index:
+    """Combine the filter indexes of several segments into one of n_rows rows.
+
+    Each part is (index, row_map): row_map[r] is where row r lands, or -1 to drop it.
+    """
+    key_id: Dict[str, int] = {}
+    fields: List[str] = []
+    for ix, _ in parts:
+        fields.extend(f for f in ix.numeric_fields if f not in fields)
+    column = {f: i for i, f in enumerate(fields)}
+    terms, rows = [], []
+    numeric = np.full((len(fields), n_rows), np.nan, dtype="float64")
+    for ix, row_map in parts:
+        remap = np.array([key_id.setdefault(k, len(key_id)) for k in ix.keys], dtype="int32")
+        mapped = row_map[ix.rows] if len(ix.rows) else np.zeros(0, dtype="int64")
+        keep = mapped >= 0
+        terms.append(remap[ix.terms[keep]])
+        rows.append(mapped[keep].astype("int32"))
+        kept = np.flatnonzero(row_map >= 0)
+        for f in ix.numeric_fields:
+            numeric[column[f], row_map[kept]] = ix.numeric[ix.column[f], kept]
+    keys = list(key_id)
+    terms = np.concatenate(terms) if terms else np.zeros(0, dtype="int32")
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype="int32")
+    used, terms = np.unique(terms, return_inverse=True)
+    order = np.argsort(terms, kind="stable")
+    return Index([keys[k] for k in used.tolist()], terms[order].astype("int32"), rows[order],
+                 fields, numeric, n_rows)
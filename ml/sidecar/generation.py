@@ -1,21 +1,197 @@
-import os, torch
-from typing import List, Dict, Any, Tuple
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import os, queue, threading, time, torch
+from typing import List, Dict, Any, Tuple, Iterator, Optional
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+
+import metrics
+import packing
+from batching import Scheduler, _from_legacy, _to_legacy
+from prefix_cache import PrefixCache
 
 # -------- Config --------
 MODEL_DIR = os.environ.get("PHI3_MODEL_DIR", r"D:\Models\phi3-equestrian-merged-fp16")
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+GEN_DEVICE = os.environ.get("GEN_DEVICE", "auto").lower()          # auto | cuda | cpu
+GEN_DTYPE = os.environ.get("GEN_DTYPE", "auto").lower()            # auto | fp16 | bf16 | fp32
+GEN_QUANT = os.environ.get("GEN_QUANT", "none").lower()            # none | int8 | int4
+GEN_NUM_THREADS = int(os.environ.get("GEN_NUM_THREADS", "0"))      # CPU intra-op threads; 0 = auto
+DEVICE = "cuda" if GEN_DEVICE == "cuda" or (GEN_DEVICE == "auto" and torch.cuda.is_available()) else "cpu"
+GEN_MAX_BATCH = int(os.environ.get("GEN_MAX_BATCH", "8"))          # 1 = one model.generate per request
+GEN_BATCH_WAIT_MS = float(os.environ.get("GEN_BATCH_WAIT_MS", "10"))
+# KV reuse for the system block and frequently retrieved docs; 0 disables
+GEN_PREFIX_CACHE_MB = int(os.environ.get("GEN_PREFIX_CACHE_MB", "512"))
+GEN_PREFIX_MIN_HITS = int(os.environ.get("GEN_PREFIX_MIN_HITS", "2"))  # sightings before a doc prefix is cached
+# Assisted decoding: a cheap proposer drafts tokens and Phi-3 verifies them in one forward pass.
+#   prompt_lookup  continuations of n-grams found in the prompt (answers mostly copy the retrieved FAQ text)
+#   draft          a small causal LM, GEN_DRAFT_MODEL_DIR (ideally sharing Phi-3's tokenizer)
+# It decodes one sequence at a time, so it replaces the batch scheduler: lower latency
+# per request, less throughput under concurrency.
+GEN_ASSIST = os.environ.get("GEN_ASSIST", "none").lower()          # none | prompt_lookup | draft
+GEN_ASSIST_TOKENS = int(os.environ.get("GEN_ASSIST_TOKENS", "10"))  # tokens proposed per step
+GEN_ASSIST_NGRAM = int(os.environ.get("GEN_ASSIST_NGRAM", "3"))     # prompt_lookup: longest n-gram matched
+GEN_DRAFT_MODEL_DIR = os.environ.get("GEN_DRAFT_MODEL_DIR", "")
+MAX_PROMPT_TOKENS = 1536
+# retrieved docs are packed into at most this many prompt tokens, best first
+GEN_CONTEXT_TOKENS = int(os.environ.get("GEN_CONTEXT_TOKENS", "1024"))
+GEN_CONTEXT_MIN_SCORE = float(os.environ.get("GEN_CONTEXT_MIN_SCORE", "0.2"))  # dense cosine; the best hit always goes in
+GEN_CONTEXT_DEDUP = float(os.environ.get("GEN_CONTEXT_DEDUP", "0.9"))          # word overlap of near-duplicate docs
+
+_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+
+
+def _cpu_has_bf16() -> bool:
+    try:
+        return torch.cpu._is_avx512_bf16_supported() or torch.cpu._is_amx_tile_supported()
+    except Exception:
+        return False
+
+
+def _pick_dtype() -> torch.dtype:
+    if DEVICE == "cpu" and GEN_QUANT == "int8":
+        return torch.float32            # dynamic int8 quantization starts from fp32 Linear layers
+    if GEN_DTYPE in _DTYPES:
+        return _DTYPES[GEN_DTYPE]
+    if DEVICE == "cuda":
+        return torch.float16            # use FP16 for GPU efficiency
+    return torch.bfloat16 if _cpu_has_bf16() else torch.float32
+
+
+def _tune_threads() -> int:
+    """Size torch's CPU thread pools (same policy as the legacy server)."""
+    n = GEN_NUM_THREADS or max(2, min(8, os.cpu_count() or 4))
+    try:
+        torch.set_num_threads(n)
+        torch.set_num_interop_threads(max(1, n // 2))
+    except RuntimeError:
+        pass  # inter-op pool can only be sized before the first parallel op
+    return torch.get_num_threads()
+
+
+def _quantize_cpu(model):
+    if GEN_QUANT == "int8":
+        from torch.ao.quantization import quantize_dynamic
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if GEN_QUANT == "int4":
+        try:
+            from torchao.quantization import quantize_, Int8DynamicActivationInt4WeightConfig
+        except ImportError as e:
+            raise RuntimeError("GEN_QUANT=int4 on CPU needs the torchao package") from e
+        quantize_(model, Int8DynamicActivationInt4WeightConfig())
+    return model
+
+
+def _from_pretrained():
+    kwargs: Dict[str, Any] = {
+        "torch_dtype": _pick_dtype(),
+        "trust_remote_code": True,
+        "device_map": None,             # force full load on single device
+        "low_cpu_mem_usage": True,
+    }
+    if DEVICE == "cuda" and GEN_QUANT in ("int8", "int4"):
+        try:
+            from transformers import BitsAndBytesConfig
+            import bitsandbytes  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(f"GEN_QUANT={GEN_QUANT} on CUDA needs the bitsandbytes package") from e
+        kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_8bit=GEN_QUANT == "int8",
+            load_in_4bit=GEN_QUANT == "int4",
+            bnb_4bit_compute_dtype=kwargs["torch_dtype"],
+        )
+        kwargs["device_map"] = {"": 0}
+        return AutoModelForCausalLM.from_pretrained(MODEL_DIR, **kwargs).eval()
+
+    model = AutoModelForCausalLM.from_pretrained(MODEL_DIR, **kwargs).to(DEVICE).eval()
+    if DEVICE == "cpu":
+        model = _quantize_cpu(model)
+    return model
+
+
+# -------- Load Phi-3 once, on first use or from the startup loader --------
+_threads = _tune_threads() if DEVICE == "cpu" else None
+_tok = None
+_model = None
+_eos_ids: List[int] = []
+_scheduler: Optional[Scheduler] = None
+_draft = None
+_draft_tok = None                   # only when the draft model's vocabulary differs from Phi-3's
+_tok_lock = threading.Lock()
+_model_lock = threading.Lock()
+
+_prefix_cache = PrefixCache(GEN_PREFIX_CACHE_MB * 1024 * 1024, min_hits=GEN_PREFIX_MIN_HITS)
+
+
+def load_tokenizer():
+    """Load the tokenizer (idempotent; concurrent callers wait for the same load)."""
+    global _tok
+    if _tok is None:
+        with _tok_lock:
+            if _tok is None:
+                tok = AutoTokenizer.from_pretrained(MODEL_DIR, trust_remote_code=True)
+                tok.pad_token = tok.eos_token
+                _tok = tok
+    return _tok
+
+
+def _load_draft(tok):
+    global _draft, _draft_tok
+    if not GEN_DRAFT_MODEL_DIR:
+        raise RuntimeError("GEN_ASSIST=draft needs GEN_DRAFT_MODEL_DIR")
+    draft_tok = AutoTokenizer.from_pretrained(GEN_DRAFT_MODEL_DIR, trust_remote_code=True)
+    _draft_tok = None if draft_tok.get_vocab() == tok.get_vocab() else draft_tok
+    _draft = AutoModelForCausalLM.from_pretrained(
+        GEN_DRAFT_MODEL_DIR, torch_dtype=_pick_dtype(), trust_remote_code=True, low_cpu_mem_usage=True,
+    ).to(DEVICE).eval()
+
+
+# target-model forward passes of the generate call running on this thread (assisted decoding)
+_passes = threading.local()
+
+
+def _count_pass(module, args):
+    if getattr(_passes, "n", None) is not None:
+        _passes.n += 1
 
-# -------- Load Phi-3 once --------
-_tok = AutoTokenizer.from_pretrained(MODEL_DIR, trust_remote_code=True)
-_tok.pad_token = _tok.eos_token
-_model = AutoModelForCausalLM.from_pretrained(
-    MODEL_DIR,
-    torch_dtype=torch.float16,   # use FP16 for GPU efficiency
-    trust_remote_code=True,
-    device_map=None              # force full load on single device
-).to("cuda").eval()
 
+def load_model():
+    """Load Phi-3, start the batch scheduler and pin the system-prompt KV (idempotent)."""
+    global _model, _eos_ids, _scheduler
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if GEN_ASSIST not in ("none", "prompt_lookup", "draft"):
+                    raise RuntimeError(f"unknown GEN_ASSIST '{GEN_ASSIST}', expected none, prompt_lookup or draft")
+                tok = load_tokenizer()
+                model = _from_pretrained()
+                if GEN_ASSIST == "draft":
+                    _load_draft(tok)
+                if GEN_ASSIST != "none":
+                    model.register_forward_pre_hook(_count_pass)
+
+                # Phi-3 closes a turn with <|end|>; stop there as well as on the tokenizer's eos
+                eos_ids = [tok.eos_token_id]
+                end_id = tok.convert_tokens_to_ids("<|end|>")
+                if isinstance(end_id, int) and end_id != tok.unk_token_id and end_id not in eos_ids:
+                    eos_ids.append(end_id)
+                _eos_ids = eos_ids
+
+                # -------- Batched decoding across concurrent requests --------
+                _scheduler = Scheduler(
+                    model, tok.pad_token_id, _eos_ids, max_batch=GEN_MAX_BATCH, wait_ms=GEN_BATCH_WAIT_MS,
+                    prefix_cache=_prefix_cache,
+                ) if GEN_MAX_BATCH > 1 and GEN_ASSIST == "none" else None
+                _model = model
+                _warm_prefix()
+    return _model
+
+
+def model_info() -> Dict[str, Any]:
+    """How the generator is being served: device, precision, quantization, CPU threads."""
+    return {
+        "device": DEVICE,
+        "dtype": str(next(_model.parameters()).dtype).replace("torch.", "") if _model is not None else None,
+        "quant": GEN_QUANT,
+        "threads": _threads,
+        "assist": GEN_ASSIST,
+    }
 
 
 # -------- System instruction --------
@@ -27,32 +203,244 @@ SYSTEM_MSG = (
 )
 
 
+def _format_doc(i: int, c: Dict[str, Any]) -> str:
+    title = c.get("title") or c.get("url") or c.get("id") or f"Doc{i}"
+    if c.get("question") or c.get("answer"):
+        snippet = f"Q: {c.get('question','')}\nA: {c.get('answer','')}"
+    else:
+        attrs = c.get("attributes") or {}
+        if attrs:
+            kv = "; ".join([f"{k}: {v}" for k, v in attrs.items()])
+            snippet = kv
+        else:
+            raw = c.get("raw") or {}
+            snippet = "; ".join(f"{k}: {v}" for k, v in raw.items()
+                                if k not in ("id", "title", "url") and v not in (None, "", [], {}))
+    # no per-query values (e.g. scores) here, so a doc's KV can be reused across queries
+    return f"[{title}]\n{snippet}"
+
+
 def _format_context(ctx: List[Dict[str, Any]]) -> str:
     """Convert retrieved docs into a readable context block for the prompt."""
-    lines = []
-    for i, c in enumerate(ctx, 1):
-        title = c.get("title") or c.get("url") or c.get("id") or f"Doc{i}"
-        if c.get("question") or c.get("answer"):
-            snippet = f"Q: {c.get('question','')}\nA: {c.get('answer','')}"
-        else:
-            attrs = c.get("attributes") or {}
-            if attrs:
-                kv = "; ".join([f"{k}: {v}" for k, v in attrs.items()])
-                snippet = kv
-            else:
-                snippet = str(c.get("raw") or "")
-        lines.append(f"[{title}] (score={c.get('score'):.3f})\n{snippet}")
-    return "\n\n".join(lines)
+    return "\n\n".join(_format_doc(i, c) for i, c in enumerate(ctx, 1))
+
+
+def _count_tokens(text: str) -> int:
+    return len(_tok(text, add_special_tokens=False)["input_ids"])
+
+
+def _trim_tokens(text: str, max_tokens: int) -> str:
+    return _tok.decode(_tok(text, add_special_tokens=False)["input_ids"][:max(0, max_tokens)],
+                       skip_special_tokens=True)
+
+
+_token_counts = packing.TokenCounter(_count_tokens)
+NO_CONTEXT = "No relevant context retrieved.\n\n"
+
+
+def _prompt_segments(user_query: str, ctx: List[Dict[str, Any]]) -> List[str]:
+    """The prompt as cacheable pieces: system block, one per doc, then the question.
+
+    Context comes before the question so that prompts retrieving the same
+    leading docs share a token prefix. Docs are packed into what is left of
+    MAX_PROMPT_TOKENS (and GEN_CONTEXT_TOKENS) after the system block and the
+    question, so truncation never cuts the end and assistant markers.
+    """
+    load_tokenizer()
+    head = f"<|system|>\n{SYSTEM_MSG}\n<|end|>\n<|user|>\nContext:\n"
+    room = MAX_PROMPT_TOKENS - _token_counts(head) - _token_counts("Question: \n<|end|>\n<|assistant|>\n") - 2
+    # a long question leaves at least enough room for the no-context line
+    q_room = room - _token_counts(NO_CONTEXT) - 1
+    q_tokens = _count_tokens(user_query)
+    if q_tokens > q_room:
+        user_query, q_tokens = _trim_tokens(user_query, q_room), q_room
+    tail = f"Question: {user_query}\n<|end|>\n<|assistant|>\n"
+
+    docs: List[str] = []
+    if ctx:
+        with metrics.timed("generation.pack"):
+            docs = packing.pack(
+                [(c, _format_doc(i, c) + "\n\n") for i, c in enumerate(ctx, 1)],
+                min(GEN_CONTEXT_TOKENS, room - q_tokens),
+                _token_counts,
+                min_score=GEN_CONTEXT_MIN_SCORE,
+                dedupe=GEN_CONTEXT_DEDUP,
+                trim=lambda text, n: _trim_tokens(text, n - 1) + "\n\n",
+            )
+    if not docs:
+        docs = [NO_CONTEXT]
+    return [head] + docs + [tail]
 
 
 def build_prompt(user_query: str, ctx: List[Dict[str, Any]]) -> str:
     """Build strict grounded prompt."""
-    ctx_block = _format_context(ctx) if ctx else "No relevant context retrieved."
-    return (
-        f"<|system|>\n{SYSTEM_MSG}\n<|end|>\n"
-        f"<|user|>\nQuestion: {user_query}\n\nContext:\n{ctx_block}\n<|end|>\n"
-        f"<|assistant|>\n"
-    )
+    return "".join(_prompt_segments(user_query, ctx))
+
+
+def _encode(user_query: str, ctx: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+    """Token ids of the prompt plus the token offsets where its segments end."""
+    load_tokenizer()
+    segments = _prompt_segments(user_query, ctx)
+    prompt = "".join(segments)
+    try:
+        enc = _tok(prompt, truncation=True, max_length=MAX_PROMPT_TOKENS, padding=False,
+                   return_offsets_mapping=True)
+    except NotImplementedError:     # slow tokenizer: no offsets, no prefix reuse
+        enc = _tok(prompt, truncation=True, max_length=MAX_PROMPT_TOKENS, padding=False)
+        return list(enc["input_ids"]), []
+
+    ends = [end for _, end in enc["offset_mapping"]]
+    boundaries, char_pos, t = [], 0, 0
+    for seg in segments[:-1]:
+        char_pos += len(seg)
+        while t < len(ends) and ends[t] <= char_pos:
+            t += 1
+        if t < len(ends) and (not boundaries or t > boundaries[-1]):
+            boundaries.append(t)
+    return list(enc["input_ids"]), boundaries
+
+
+def _warm_prefix() -> None:
+    """Precompute and pin the KV of the static system block."""
+    if not _prefix_cache.enabled:
+        return
+    ids, boundaries = _encode("", [])
+    if not boundaries:
+        return
+    head = ids[:boundaries[0]]
+    with torch.inference_mode():
+        out = _model(input_ids=torch.tensor([head], device=DEVICE), use_cache=True)
+    past = _to_legacy(out.past_key_values)
+    _prefix_cache.observe(ids, boundaries[:1], 0,
+                          lambda a, b: [(k[:, :, a:b], v[:, :, a:b]) for k, v in past], pin=True)
+
+
+def prefix_cache_stats() -> Dict[str, int]:
+    return _prefix_cache.stats()
+
+
+def _record(meta: Dict[str, Any]) -> None:
+    """Export one generation's queue / prefill / decode split and throughput."""
+    if "queue_ms" in meta:
+        metrics.observe_stage("generation.queue", meta["queue_ms"] / 1000)
+    decode_ms = meta.get("gen_ms", 0)
+    if "prefill_ms" in meta:
+        metrics.observe_stage("generation.prefill", meta["prefill_ms"] / 1000)
+        decode_ms -= meta["prefill_ms"]
+    metrics.observe_stage("generation.decode", decode_ms / 1000)
+    if decode_ms > 0 and meta["gen_len"]:
+        metrics.TOKENS_PER_SECOND.observe(meta["gen_len"] / (decode_ms / 1000))
+    metrics.GENERATED_TOKENS.inc(meta["gen_len"])
+    cached = meta.get("cached_tokens", 0)
+    metrics.PROMPT_TOKENS.inc(cached, source="prefix_cache")
+    metrics.PROMPT_TOKENS.inc(meta["prompt_len"] - cached, source="computed")
+    if "assist_accepted" in meta:
+        with _assist_lock:
+            _assist["accepted"] += meta["assist_accepted"]
+            _assist["verified"] += meta["gen_len"] - meta["assist_accepted"]
+
+
+# assisted decoding: tokens taken from accepted proposals vs produced by Phi-3's own passes
+_assist = {"accepted": 0, "verified": 0}
+_assist_lock = threading.Lock()
+
+
+def assist_stats() -> Dict[str, Any]:
+    with _assist_lock:
+        out: Dict[str, Any] = {"mode": GEN_ASSIST, **_assist}
+    total = out["accepted"] + out["verified"]
+    out["acceptance"] = round(out["accepted"] / total, 4) if total else None
+    return out
+
+
+def _collect():
+    pc = _prefix_cache.stats()
+    out = [
+        ("sidecar_prefix_cache_hits_total", "counter", "Prompts that reused cached prefix KV.", [({}, pc["hits"])]),
+        ("sidecar_prefix_cache_bytes", "gauge", "Memory held by cached prefix KV.", [({}, pc["bytes"])]),
+    ]
+    if GEN_ASSIST != "none":
+        st = assist_stats()
+        out += [
+            ("sidecar_assist_tokens_total", "counter", "Generated tokens by origin under assisted decoding.",
+             [({"origin": "accepted"}, st["accepted"]), ({"origin": "verified"}, st["verified"])]),
+            ("sidecar_assist_acceptance_ratio", "gauge", "Share of generated tokens drafted and accepted.",
+             [({}, st["acceptance"] or 0.0)]),
+        ]
+    if _scheduler is not None:
+        out += [
+            ("sidecar_generation_queue_depth", "gauge", "Prompts waiting to join the decode batch.",
+             [({}, _scheduler.queue_depth())]),
+            ("sidecar_generation_batch_size", "gauge", "Sequences in the running decode batch.",
+             [({}, _scheduler.active())]),
+        ]
+    return out
+
+
+metrics.register_collector(_collect)
+
+
+def _generate_direct(ids: List[int], boundaries: List[int], streamer=None, **params) -> Tuple[List[int], Dict[str, Any]]:
+    """One model.generate call, resuming from the longest cached prompt prefix."""
+    cached_len, cached_kv, depth = _prefix_cache.match(ids, boundaries)
+    input_ids = torch.tensor([ids], device=DEVICE)
+    do_sample = params.get("temperature", 1.0) > 0      # same greedy convention as the scheduler
+    if not do_sample:
+        params.pop("temperature", None)
+        params.pop("top_p", None)
+    if GEN_ASSIST == "prompt_lookup":
+        params.update(prompt_lookup_num_tokens=GEN_ASSIST_TOKENS, max_matching_ngram_size=GEN_ASSIST_NGRAM)
+    elif GEN_ASSIST == "draft":
+        params.update(assistant_model=_draft, num_assistant_tokens=GEN_ASSIST_TOKENS)
+        if _draft_tok is not None:
+            params.update(tokenizer=_tok, assistant_tokenizer=_draft_tok)
+    t0 = time.monotonic()
+    _passes.n = 0 if GEN_ASSIST != "none" else None
+    try:
+        with torch.inference_mode():
+            out = _model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=_from_legacy(cached_kv) if cached_len else None,
+                streamer=streamer,
+                do_sample=do_sample,
+                repetition_penalty=1.05,
+                no_repeat_ngram_size=3,
+                pad_token_id=_tok.eos_token_id,
+                eos_token_id=_eos_ids,
+                return_dict_in_generate=True,
+                **params,
+            )
+    finally:
+        passes, _passes.n = _passes.n, None
+    gen_ms = int((time.monotonic() - t0) * 1000)
+    past = _to_legacy(out.past_key_values)
+    _prefix_cache.observe(ids, boundaries, depth,
+                          lambda a, b: [(k[:, :, a:b], v[:, :, a:b]) for k, v in past])
+    new_tokens = out.sequences[0, len(ids):].tolist()
+    meta = {
+        "prompt_len": len(ids),
+        "gen_len": len(new_tokens),
+        "cached_tokens": cached_len,
+        "gen_ms": gen_ms,
+    }
+    if passes is not None:
+        # every target pass verifies the pending proposal and emits one token of its own
+        meta["assist_accepted"] = max(0, len(new_tokens) - passes)
+    return new_tokens, meta
+
+
+# generate_from_context's defaults, for callers passing params through
+_DEFAULTS = {"temperature": 0.4, "top_p": 0.92, "max_new_tokens": 220, "min_new_tokens": 64, "max_time": 45.0}
+
+
+def _submit(ids: List[int], boundaries: List[int], **params):
+    return _scheduler.submit(ids, segments=boundaries, repetition_penalty=1.05, no_repeat_ngram_size=3, **params)
+
+
+def _finish(new_tokens: List[int], meta: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    _record(meta)
+    return _clean(_tok.decode(new_tokens, skip_special_tokens=True)), meta
 
 
 def generate_from_context(
@@ -66,35 +454,154 @@ def generate_from_context(
     max_time: float = 45.0,
 ) -> Tuple[str, Dict[str, Any]]:
     """Generate an answer from Phi-3 given retrieved docs."""
-    prompt = build_prompt(user_query, ctx)
-    tokens = _tok(
-        prompt,
-        return_tensors="pt",
-        truncation=True,
-        max_length=1536,
-        padding=False
-    )
-    tokens = {k: v.to(DEVICE) for k, v in tokens.items()}
+    load_model()
+    with metrics.timed("generation.tokenize"):
+        ids, boundaries = _encode(user_query, ctx)
 
-    with torch.inference_mode():
-        out = _model.generate(
-            **tokens,
+    if _scheduler is not None:
+        # queued and decoded alongside other requests, with this request's own sampling params
+        new_tokens, meta = _submit(
+            ids, boundaries,
+            temperature=temperature,
+            top_p=top_p,
+            max_new_tokens=max_new_tokens,
+            min_new_tokens=min_new_tokens,
+            max_time=max_time,
+        ).result()
+    else:
+        new_tokens, meta = _generate_direct(
+            ids, boundaries,
             max_new_tokens=max_new_tokens,
             min_new_tokens=min_new_tokens,
-            do_sample=True,
             temperature=temperature,
             top_p=top_p,
-            repetition_penalty=1.05,
-            no_repeat_ngram_size=3,
             max_time=max_time,
-            pad_token_id=_tok.eos_token_id,
-            eos_token_id=_tok.eos_token_id,
         )
+    return _finish(new_tokens, meta)
 
-    new_tokens = out[0, tokens["input_ids"].shape[1]:]
-    text = _tok.decode(new_tokens, skip_special_tokens=True).strip().split("<|end|>")[0]
 
-    return text, {
-        "prompt_len": int(tokens["input_ids"].shape[1]),
-        "gen_len": int(new_tokens.shape[0]),
-    }
+def generate_many(items: List[Tuple[str, List[Dict[str, Any]]]], **params) -> List[Any]:
+    """generate_from_context for several (query, ctx) pairs, with the same keyword params.
+
+    All prompts are queued on the scheduler at once so they decode in shared
+    batches. Each entry of the result is (text, meta), or the exception that
+    item raised; one bad item does not fail the others.
+    """
+    load_model()
+    if _scheduler is None:
+        out: List[Any] = []
+        for user_query, ctx in items:
+            try:
+                out.append(generate_from_context(user_query, ctx, **params))
+            except Exception as e:
+                out.append(e)
+        return out
+
+    pending: List[Any] = []
+    for user_query, ctx in items:
+        try:
+            with metrics.timed("generation.tokenize"):
+                ids, boundaries = _encode(user_query, ctx)
+            pending.append(_submit(ids, boundaries, **{**_DEFAULTS, **params}))
+        except Exception as e:
+            pending.append(e)
+
+    out = []
+    for p in pending:
+        try:
+            out.append(p if isinstance(p, Exception) else _finish(*p.result()))
+        except Exception as e:
+            out.append(e)
+    return out
+
+
+def _clean(text: str) -> str:
+    return text.strip().split("<|end|>")[0]
+
+
+def stream_from_context(
+    user_query: str,
+    ctx: List[Dict[str, Any]],
+    *,
+    temperature: float = 0.4,
+    top_p: float = 0.92,
+    max_new_tokens: int = 220,
+    min_new_tokens: int = 64,
+    max_time: float = 45.0,
+) -> Iterator[Tuple[str, Any]]:
+    """Stream an answer from Phi-3 given retrieved docs.
+
+    Yields ("token", text_delta) as tokens are produced, then ("done", (text, meta)).
+    """
+    load_model()
+    with metrics.timed("generation.tokenize"):
+        ids, boundaries = _encode(user_query, ctx)
+
+    if _scheduler is None:
+        streamer = TextIteratorStreamer(_tok, skip_prompt=True, skip_special_tokens=True)
+        result: Dict[str, Any] = {}
+
+        def _run():
+            try:
+                result["out"] = _generate_direct(
+                    ids, boundaries, streamer=streamer,
+                    max_new_tokens=max_new_tokens,
+                    min_new_tokens=min_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_time=max_time,
+                )
+            except Exception as e:
+                result["error"] = e
+                streamer.end()
+
+        worker = threading.Thread(target=_run, daemon=True)
+        worker.start()
+        text = ""
+        for piece in streamer:
+            if "<|end|>" in text + piece:
+                break
+            text += piece
+            if piece:
+                yield "token", piece
+        worker.join()
+        if "error" in result:
+            raise result["error"]
+        _record(result["out"][1])
+        yield "done", (_clean(text), result["out"][1])
+        return
+
+    # Token ids arrive from the scheduler thread; decode the running sequence and emit the new suffix
+    ids_q: "queue.Queue[Optional[int]]" = queue.Queue()
+    fut = _submit(
+        ids, boundaries,
+        temperature=temperature,
+        top_p=top_p,
+        max_new_tokens=max_new_tokens,
+        min_new_tokens=min_new_tokens,
+        max_time=max_time,
+        on_token=ids_q.put,
+    )
+    fut.add_done_callback(lambda _: ids_q.put(None))
+
+    generated: List[int] = []
+    sent = ""
+    while True:
+        tok_id = ids_q.get()
+        if tok_id is None:
+            break
+        generated.append(tok_id)
+        text = _clean(_tok.decode(generated, skip_special_tokens=True))
+        # hold back while the tail is an incomplete multi-byte character
+        if text.endswith("\ufffd") or not text.startswith(sent):
+            continue
+        if len(text) > len(sent):
+            yield "token", text[len(sent):]
+            sent = text
+
+    new_tokens, meta = fut.result()
+    _record(meta)
+    text = _clean(_tok.decode(new_tokens, skip_special_tokens=True))
+    if len(text) > len(sent) and text.startswith(sent):
+        yield "token", text[len(sent):]
+    yield "done", (text, meta)
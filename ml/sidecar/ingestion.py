@@ -1,38 +1,13 @@
-import os, json
-from typing import List, Dict
+import os, hashlib
+from typing import Callable, Dict, Iterable, List, Optional
 import numpy as np
 
 # pip install sentence-transformers faiss-cpu
-from sentence_transformers import SentenceTransformer
-import faiss
-
-VEC_DIR = os.path.join(os.path.dirname(__file__), "vectorstores")
-EMB_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-_model = SentenceTransformer(EMB_MODEL)
-
-def _tenant_dir(tenant_id: str):
-    d = os.path.join(VEC_DIR, tenant_id)
-    os.makedirs(d, exist_ok=True)
-    return d
-
-def _index_paths(tenant_id: str):
-    base = _tenant_dir(tenant_id)
-    return (
-        os.path.join(base, "index.faiss"),
-        os.path.join(base, "id_map.json"),   # id -> row and metadata store
-        os.path.join(base, "docs.json")      # raw docs by id
-    )
-
-def _load_index(index_path: str, dim: int):
-    if os.path.exists(index_path):
-        return faiss.read_index(index_path)
-    # Use Inner Product with normalized vectors for cosine similarity
-    index = faiss.IndexFlatIP(dim)
-    return index
-
-def _normalize(v: np.ndarray):
-    norms = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
-    return v / norms
+import embedder
+import metrics
+import stores
+
+VEC_DIR = stores.VEC_DIR
 
 def _make_text_for_embedding(doc: Dict):
     # Build a consistent text representation
@@ -45,66 +20,155 @@ def _make_text_for_embedding(doc: Dict):
     attrs_text = " ".join([f"{k}: {v}" for k, v in attrs.items()])
     return f"Title: {doc.get('title','')}\n{attrs_text}\nURL: {doc.get('url','')}"
 
-def upsert_documents(tenant_id: str, dataset_type: str, documents: List[Dict]) -> int:
-    # Load existing artifacts
-    index_path, idmap_path, docs_path = _index_paths(tenant_id)
-
-    # Encode all docs
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# Compact once more than this share of rows are tombstones left by deletes/replacements,
+# or more than this share of the doc blob holds replaced or deleted bodies
+COMPACT_RATIO = float(os.environ.get("INGEST_COMPACT_RATIO", "0.5"))
+BLOB_COMPACT_RATIO = float(os.environ.get("INGEST_BLOB_COMPACT_RATIO", "0.5"))
+
+def _draft(tenant_id: str) -> stores.Draft:
+    """A draft on top of the tenant's current store (or an empty one)."""
+    if not stores.exists(tenant_id):
+        return stores.Draft(tenant_id, embedder.dim(), embedder.model_id())
+    base = stores.get(tenant_id)
+    draft = stores.Draft(tenant_id, 0, base.model, base=base)
+    if draft.lex is None:
+        # stores from before the BM25 index get it on their next write (older
+        # segments get the filter index the same way, see Draft.compacting)
+        with metrics.timed("ingest.lexical_backfill"):
+            rows = base.live_rows().tolist()
+            draft.index_text(rows, [_make_text_for_embedding(base.doc(r)) for r in rows])
+    return draft
+
+def _commit(draft: stores.Draft) -> None:
+    if draft.rows > 0 and draft.live < (1.0 - COMPACT_RATIO) * draft.rows or \
+            draft.dead_bytes > BLOB_COMPACT_RATIO * draft.blob_size:
+        draft.compact()
+    # Swap the resident copy so queries never re-read what we just wrote
+    stores.publish(draft.tenant_id, stores.commit(draft))
+
+def _reembed(draft: stores.Draft, batch_size: int = 1024) -> None:
+    """Re-encode every doc of the draft's base store with the current model and backend."""
+    rows = draft.base.live_rows().tolist()
+    with metrics.timed("ingest.reembed"):
+        for i in range(0, len(rows), batch_size):
+            docs = [draft.base.doc(r) for r in rows[i:i + batch_size]]
+            texts = [_make_text_for_embedding(d) for d in docs]
+            draft.put_many(docs, [_text_hash(t) for t in texts], embedder.encode(texts),
+                           [False] * len(docs), texts)
+    draft.model = embedder.model_id()
+
+def _stage(draft: stores.Draft, documents: List[Dict], texts: List[str], text_hashes: List[str]) -> int:
+    """Put documents into a draft, reusing stored vectors where the text is unchanged.
+
+    Returns how many vectors had to be computed.
+    """
+    if draft.model != embedder.model_id() and draft.rows:
+        # vectors of another model or backend (or an unknown one) must not share
+        # an index with ours: re-embed the whole store, once
+        _reembed(draft)
+    reusable = bool(draft.rows)
+    draft.model = embedder.model_id()
+
+    emb = np.zeros((len(documents), draft.dim), dtype="float32")
+    keep, to_encode = [False] * len(documents), []
+    for i, (d, h) in enumerate(zip(documents, text_hashes)):
+        if reusable and draft.hash_of(d["id"]) == h:
+            keep[i] = True              # same text: keep its stored vector
+            continue
+        # any stored row whose embedded text hashes the same can donate its vector
+        row = draft.row_with_hash(h) if reusable else None
+        if row is not None:
+            emb[i] = draft.vector(row)
+        else:
+            to_encode.append(i)
+    if to_encode:
+        with metrics.timed("ingest.embed"):
+            emb[to_encode] = embedder.encode([texts[i] for i in to_encode])
+
+    draft.put_many(documents, text_hashes, emb, keep, texts)
+    return len(to_encode)
+
+def _prepare(documents: List[Dict]):
+    """Dedupe by id (last write wins) and build the embedded texts and their hashes."""
+    documents = list({d["id"]: d for d in documents}.values())
     texts = [_make_text_for_embedding(d) for d in documents]
-    emb = _model.encode(texts, convert_to_numpy=True)
-    emb = _normalize(emb.astype("float32"))
-    dim = emb.shape[1]
-
-    # Load or create index
-    index = _load_index(index_path, dim)
-
-    # Load id_map and docs
-    id_map = {}
-    if os.path.exists(idmap_path):
-        with open(idmap_path, "r", encoding="utf-8") as f:
-            id_map = json.load(f)
-
-    docs_store = {}
-    if os.path.exists(docs_path):
-        with open(docs_path, "r", encoding="utf-8") as f:
-            docs_store = json.load(f)
-
-    # Build arrays for new vectors and ids, but handle upsert
-    # We emulate upsert by: if id exists, mark to replace (faiss flat index has no delete; simple approach: rebuild)
-    existing_ids = list(id_map.keys())
-    new_ids = [d["id"] for d in documents]
-
-    need_rebuild = any(i in existing_ids for i in new_ids) and index.ntotal > 0
-
-    if need_rebuild:
-        # Rebuild: merge old docs with replacements
-        for d in documents:
-            docs_store[d["id"]] = d
-        # Re-encode ALL docs
-        all_docs = list(docs_store.values())
-        all_texts = [_make_text_for_embedding(d) for d in all_docs]
-        all_emb = _normalize(_model.encode(all_texts, convert_to_numpy=True).astype("float32"))
-
-        # Recreate index
-        index = faiss.IndexFlatIP(all_emb.shape[1])
-        index.add(all_emb)
-
-        # New id_map: row -> id
-        id_map = {doc["id"]: idx for idx, doc in enumerate(all_docs)}
-
-    else:
-        # Pure append (fast path)
-        start_id = index.ntotal
-        index.add(emb)
-        for i, d in enumerate(documents):
-            docs_store[d["id"]] = d
-            id_map[d["id"]] = start_id + i
-
-    # Persist
-    faiss.write_index(index, index_path)
-    with open(idmap_path, "w", encoding="utf-8") as f:
-        json.dump(id_map, f, ensure_ascii=False, indent=2)
-    with open(docs_path, "w", encoding="utf-8") as f:
-        json.dump(docs_store, f, ensure_ascii=False, indent=2)
-
-    return len(documents)
+    return documents, texts, [_text_hash(t) for t in texts]
+
+def upsert_documents(tenant_id: str, dataset_type: str, documents: List[Dict]) -> Dict[str, int]:
+    """Insert or replace documents. Returns counts of docs and of vectors reused vs computed."""
+    if not documents:
+        return {"count": 0, "reused": 0, "computed": 0}
+
+    with metrics.timed("ingest.prepare"):
+        documents, texts, text_hashes = _prepare(documents)
+
+    # one writer per tenant from draft to publish, so concurrent ingests can't drop each other's rows
+    with stores.writer(tenant_id):
+        draft = _draft(tenant_id)
+        computed = _stage(draft, documents, texts, text_hashes)
+        with metrics.timed("ingest.commit"):
+            _commit(draft)
+    return {
+        "count": len(documents),
+        "reused": len(documents) - computed,
+        "computed": computed,
+    }
+
+def upsert_batches(tenant_id: str, batches: Iterable[List[Dict]], checkpoint_docs: int,
+                   on_checkpoint: Optional[Callable[[Dict[str, int]], None]] = None,
+                   should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+    """Upsert a stream of document batches, committing every `checkpoint_docs` documents.
+
+    Each checkpoint publishes what was staged so far, writing only the docs
+    staged since the previous one (see stores.commit); on_checkpoint then gets
+    the running totals. If should_stop() turns true, documents staged since the
+    last checkpoint are dropped.
+    """
+    totals = {"count": 0, "reused": 0, "computed": 0, "checkpoints": 0}
+    batches = iter(batches)
+    while True:
+        # the tenant's write lock is held one checkpoint window at a time, so
+        # regular /ingest calls for the same tenant get in between commits
+        with stores.writer(tenant_id):
+            draft, pending = None, 0
+            for batch in batches:
+                if should_stop is not None and should_stop():
+                    return totals
+                if not batch:
+                    continue
+                with metrics.timed("ingest.prepare"):
+                    documents, texts, text_hashes = _prepare(batch)
+                    if draft is None:
+                        draft = _draft(tenant_id)
+                computed = _stage(draft, documents, texts, text_hashes)
+                totals["count"] += len(documents)
+                totals["computed"] += computed
+                totals["reused"] += len(documents) - computed
+                pending += len(documents)
+                if pending >= checkpoint_docs:
+                    break
+            if draft is None:
+                return totals
+            with metrics.timed("ingest.commit"):
+                _commit(draft)
+        totals["checkpoints"] += 1
+        if on_checkpoint is not None:
+            on_checkpoint(dict(totals))
+
+def delete_documents(tenant_id: str, doc_ids: List[str]) -> int:
+    """Remove documents and their vectors. Returns how many existed."""
+    with stores.writer(tenant_id):
+        if not stores.exists(tenant_id):
+            return 0
+        cur = stores.get(tenant_id)
+        if all(cur.row_of(i) is None for i in doc_ids):
+            return 0
+
+        with metrics.timed("ingest.commit"):
+            draft = _draft(tenant_id)
+            removed = draft.remove(doc_ids)
+            _commit(draft)
+    return removed
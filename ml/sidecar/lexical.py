@@ -0,0 +1,185 @@
+import os, math, re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# -------- Config --------
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+# BM25 inverted index over the same text the embedder sees, one per store
+# segment (see stores.py). Postings are three parallel arrays sorted by term id
+# (term, row, tf), so a term's list is a searchsorted range and the arrays can
+# be memory-mapped like vectors.npy. Rows are numbered within the segment and
+# only rows that were live when it was written have postings; rows deleted
+# since are masked at search time.
+
+# SKU-style compounds ("HELM-MIPS", "F1163", "3.5mm") stay one token; their
+# parts are indexed too so "mips helmet" still matches "HELM-MIPS".
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PARTS = re.compile(r"[-_./]")
+# English filler plus the field labels _make_text_for_embedding adds to every doc
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my no not of on or our so that the their there these this to was we what when where
+which who why will with you your q title url tags https http www com
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok not in STOPWORDS:
+            out.append(tok)
+        parts = _PARTS.split(tok)
+        if len(parts) > 1:
+            out.extend(p for p in parts if p and p not in STOPWORDS)
+    return out
+
+
+class Index:
+    """Read-only BM25 postings of one store segment."""
+
+    def __init__(self, vocab: List[str], terms: np.ndarray, rows: np.ndarray, tf: np.ndarray,
+                 row_len: np.ndarray):
+        self.vocab = vocab
+        self.term_id: Dict[str, int] = {t: i for i, t in enumerate(vocab)}
+        self.terms = terms              # int32, sorted
+        self.rows = rows                # int32
+        self.tf = tf                    # uint16
+        self.row_len = row_len          # int32 tokens per row (0 for dead rows)
+        self.total_len = int(row_len.sum())
+        self.nbytes = terms.nbytes + rows.nbytes + tf.nbytes + row_len.nbytes
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = np.searchsorted(self.terms, [term_id, term_id + 1])
+        return self.rows[lo:hi], self.tf[lo:hi]
+
+
+class Segments:
+    """BM25 over a whole store: postings per segment, statistics over the live docs.
+
+    `parts` are (first row, postings, rows deleted since the segment was written
+    or None). Document frequencies still count deleted rows until their segment
+    is merged, which only shifts idf slightly.
+    """
+
+    def __init__(self, parts: List[Tuple[int, Index, Optional[np.ndarray]]], live: int):
+        self.parts = parts
+        self.live = live
+        total = sum(ix.total_len - (int(ix.row_len[dead].sum()) if dead is not None else 0)
+                    for _, ix, dead in parts)
+        self.avgdl = float(total) / max(live, 1)
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (rows, BM25 scores), best first; empty when no query term is indexed.
+
+        `allowed` is an optional row bitmap (a metadata filter) hits must be in.
+        """
+        found, df = [], Counter()
+        for term, qtf in Counter(tokenize(query)).items():
+            for start, ix, dead in self.parts:
+                tid = ix.term_id.get(term)
+                if tid is None:
+                    continue
+                rows, tf = ix.postings(tid)
+                if len(rows):
+                    df[term] += len(rows)
+                    found.append((term, qtf, start, ix, dead, rows, tf))
+        hits_r, hits_s = [], []
+        for term, qtf, start, ix, dead, rows, tf in found:
+            idf = math.log(1.0 + (max(self.live - df[term], 0) + 0.5) / (df[term] + 0.5))
+            f = tf.astype("float32")
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * ix.row_len[rows] / max(self.avgdl, 1e-6))
+            scores = qtf * idf * f * (BM25_K1 + 1.0) / (f + norm)
+            if dead is not None:
+                keep = ~dead[rows]
+                rows, scores = rows[keep], scores[keep]
+            hits_r.append(rows.astype("int64") + start)
+            hits_s.append(scores)
+        if not hits_r:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        rows, inv = np.unique(np.concatenate(hits_r), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(hits_s)).astype("float32")
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+        if not len(rows):
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+
+class Builder:
+    """Postings of the rows a Draft appends, numbered from 0."""
+
+    def __init__(self):
+        self.vocab: List[str] = []
+        self.term_id: Dict[str, int] = {}
+        self._new: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._new_len: Dict[int, int] = {}
+
+    def set(self, row: int, text: str) -> None:
+        """(Re)index a row's text."""
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        ids = np.empty(len(counts), dtype="int32")
+        for i, term in enumerate(counts):
+            tid = self.term_id.get(term)
+            if tid is None:
+                tid = self.term_id[term] = len(self.vocab)
+                self.vocab.append(term)
+            ids[i] = tid
+        tf = np.minimum(np.fromiter(counts.values(), dtype="int64", count=len(counts)), 65535).astype("uint16")
+        self._new[row] = (ids, tf)
+        self._new_len[row] = len(tokens)
+
+    def drop(self, row: int) -> None:
+        self._new.pop(row, None)
+        self._new_len[row] = 0
+
+    def index(self, n_rows: int) -> Index:
+        """The postings of rows [0, n_rows) as an Index."""
+        terms = np.zeros(0, dtype="int32")
+        rows = np.zeros(0, dtype="int32")
+        tf = np.zeros(0, dtype="uint16")
+        if self._new:
+            rows = np.concatenate([np.full(len(v[0]), r, dtype="int32") for r, v in self._new.items()])
+            terms = np.concatenate([v[0] for v in self._new.values()])
+            tf = np.concatenate([v[1] for v in self._new.values()])
+            order = np.argsort(terms, kind="stable")
+            terms, rows, tf = terms[order], rows[order], tf[order]
+        row_len = np.zeros(n_rows, dtype="int32")
+        for r, length in self._new_len.items():
+            if r < n_rows:
+                row_len[r] = length
+        return Index(self.vocab, terms, rows, tf, row_len)
+
+
+def merge(parts: List[Tuple[Index, np.ndarray]], n_rows: int) -> Index:
+    """Combine the postings of several segments into one of n_rows rows.
+
+    Each part is (postings, row_map): row_map[r] is where row r lands, or -1
+    to drop it. Terms left without postings are dropped from the vocabulary.
+    """
+    term_id: Dict[str, int] = {}
+    terms, rows, tf = [], [], []
+    row_len = np.zeros(n_rows, dtype="int32")
+    for ix, row_map in parts:
+        remap = np.array([term_id.setdefault(t, len(term_id)) for t in ix.vocab], dtype="int32")
+        mapped = row_map[ix.rows] if len(ix.rows) else np.zeros(0, dtype="int64")
+        keep = mapped >= 0
+        terms.append(remap[ix.terms[keep]] if keep.any() else np.zeros(0, dtype="int32"))
+        rows.append(mapped[keep].astype("int32"))
+        tf.append(np.asarray(ix.tf[keep], dtype="uint16"))
+        kept = row_map >= 0
+        row_len[row_map[kept]] = ix.row_len[kept]
+    vocab = list(term_id)
+    terms, rows, tf = (np.concatenate(a) if a else np.zeros(0, dtype=dt)
+                       for a, dt in ((terms, "int32"), (rows, "int32"), (tf, "uint16")))
+    used, terms = np.unique(terms, return_inverse=True)
+    order = np.argsort(terms, kind="stable")
+    return Index([vocab[t] for t in used.tolist()], terms[order].astype("int32"), rows[order], tf[order], row_len)
@@ -0,0 +1,142 @@
+import bisect, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Minimal Prometheus instrumentation (text exposition format 0.0.4, no extra
+# dependency). Hot paths wrap their stages in `timed("...")`; every timing
+# lands in the sidecar_stage_seconds histogram and, when the current request
+# asked for it, in that request's breakdown dict.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+def _fmt_labels(labels: _Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self._series: Dict[_Labels, List] = {}      # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labels, counts, total, n in sorted(series):
+            cum = 0
+            for bound, c in zip(self.buckets, counts):
+                cum += c
+                out.append(f"{self.name}_bucket{_fmt_labels(labels, (('le', _fmt_value(bound)),))} {cum}")
+            out.append(f"{self.name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {n}")
+            out.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(labels)} {n}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[_Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in items]
+        return out
+
+
+# -------- Core metrics --------
+STAGE_SECONDS = Histogram("sidecar_stage_seconds", "Time spent in each pipeline stage.")
+REQUEST_SECONDS = Histogram("sidecar_request_seconds", "End-to-end request latency by route and strategy.")
+TTFT_SECONDS = Histogram("sidecar_time_to_first_token_seconds", "Streaming time to first token.")
+TOKENS_PER_SECOND = Histogram("sidecar_generation_tokens_per_second", "Decode throughput per request.", RATE_BUCKETS)
+GENERATED_TOKENS = Counter("sidecar_generated_tokens_total", "Tokens generated.")
+PROMPT_TOKENS = Counter("sidecar_prompt_tokens_total", "Prompt tokens, split by prefix-cache reuse.")
+REQUESTS = Counter("sidecar_requests_total", "Requests by route and outcome.")
+
+_registry: List = [STAGE_SECONDS, REQUEST_SECONDS, TTFT_SECONDS, TOKENS_PER_SECOND,
+                   GENERATED_TOKENS, PROMPT_TOKENS, REQUESTS]
+# callbacks returning (name, type, help, [(labels, value)]) sampled at scrape time
+_collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def register_collector(fn) -> None:
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines += m.render()
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception:
+            continue            # a broken collector must not break the scrape
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_fmt_labels(tuple(sorted(l.items())))} {_fmt_value(v)}" for l, v in samples]
+    return "\n".join(lines) + "\n"
+
+
+# -------- Per-request timing breakdown --------
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("sidecar_timings", default=None)
+
+
+def start_breakdown() -> Dict[str, float]:
+    """Collect this request's stage timings (ms) into the returned dict."""
+    d: Dict[str, float] = {}
+    _breakdown.set(d)
+    return d
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    d = _breakdown.get()
+    if d is not None:
+        d[stage] = round(d.get(stage, 0.0) + seconds * 1000, 2)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
@@ -0,0 +1,108 @@
+import re, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+# Token-budgeted selection of retrieved docs for the prompt.
+#
+# Docs are taken in retrieval rank order (the fused dense + BM25 ranking) until
+# the token budget is full. Docs scoring below min_score and near-duplicates of
+# a doc already taken are skipped, and a doc that no longer fits is passed over
+# for smaller ones further down. Token counts are cached per formatted doc: its
+# text does not depend on the query, so popular docs are tokenized once.
+
+_WORD = re.compile(r"\w+")
+# segments are tokenized separately, so counts can be off by one at the seams
+_SEAM_TOKENS = 1
+
+
+class TokenCounter:
+    """LRU cache of token counts keyed by text."""
+
+    def __init__(self, count: Callable[[str], int], max_entries: int = 8192):
+        self._count = count
+        self._max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text: str) -> int:
+        with self._lock:
+            n = self._cache.get(text)
+            if n is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return n
+            self.misses += 1
+        n = self._count(text)
+        with self._lock:
+            self._cache[text] = n
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return n
+
+
+def _similar(a: set, b: set, threshold: float) -> bool:
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= threshold
+
+
+_outcomes = {"kept": 0, "trimmed": 0, "below_score": 0, "duplicate": 0, "over_budget": 0}
+_outcomes_lock = threading.Lock()
+
+
+def pack(docs: List[Tuple[Dict[str, Any], str]], budget: int, count: Callable[[str], int], *,
+         min_score: float = 0.0, dedupe: float = 1.0,
+         trim: Optional[Callable[[str, int], str]] = None) -> List[str]:
+    """Pick the prompt segments of `docs` ((hit, formatted text) pairs, best first).
+
+    The best hit is exempt from min_score so the threshold alone never empties
+    the context; if it is too long for the budget on its own it is cut down
+    with trim(text, max_tokens) when given. `dedupe` is the word-set Jaccard
+    similarity at which a doc counts as a near-duplicate (above 1 disables it).
+    """
+    kept: List[str] = []
+    seen: List[set] = []
+    left = budget
+    outcome = dict.fromkeys(_outcomes, 0)
+    for i, (hit, text) in enumerate(docs):
+        score = hit.get("score")
+        if i > 0 and score is not None and score < min_score:
+            outcome["below_score"] += 1
+            continue
+        words = set(_WORD.findall(text.lower()))
+        if dedupe <= 1.0 and any(_similar(words, w, dedupe) for w in seen):
+            outcome["duplicate"] += 1
+            continue
+        n = count(text) + _SEAM_TOKENS
+        if n > left:
+            if kept or trim is None or left <= _SEAM_TOKENS:
+                outcome["over_budget"] += 1
+                continue
+            text = trim(text, left - _SEAM_TOKENS)
+            n = left
+            outcome["trimmed"] += 1
+        kept.append(text)
+        seen.append(words)
+        left -= n
+    outcome["kept"] = len(kept)
+    with _outcomes_lock:
+        for k, v in outcome.items():
+            _outcomes[k] += v
+    return kept
+
+
+def stats() -> Dict[str, int]:
+    with _outcomes_lock:
+        return dict(_outcomes)
+
+
+def _collect():
+    return [("sidecar_context_docs_total", "counter", "Retrieved docs by what the prompt packer did with them.",
+             [({"outcome": k}, v) for k, v in stats().items()])]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,163 @@
+import asyncio, contextvars, math, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+import metrics
+
+# Bounded worker pools for the blocking stages of the request pipeline.
+#
+# Every stage owns its executor and an admission limit of workers + max_queue
+# tasks in flight. Past that limit run() fails fast with Overloaded instead of
+# piling work onto a shared threadpool, so a burst on one stage (say /ingest)
+# cannot starve the others.
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+class Overloaded(Exception):
+    """A stage's queue is full; retry_after is a rough wait in seconds."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"stage '{stage}' is at capacity")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class _End:
+    def __init__(self, error: Optional[BaseException]):
+        self.error = error
+
+
+class Stage:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"stage-{name}")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._avg_s = 0.05              # EWMA of task duration, for Retry-After
+        self.completed = 0
+        self.rejected = 0
+
+    # -------- admission --------
+    def acquire(self) -> None:
+        """Reserve a slot or raise Overloaded. Pair with release()."""
+        with self._lock:
+            if self._inflight >= self.workers + self.max_queue:
+                self.rejected += 1
+                waves = (self._inflight - self.workers + 1) / self.workers
+                raise Overloaded(self.name, min(60, max(1, math.ceil(self._avg_s * waves))))
+            self._inflight += 1
+
+    def release(self, elapsed_s: float) -> None:
+        with self._lock:
+            self._inflight -= 1
+            self.completed += 1
+            self._avg_s = 0.8 * self._avg_s + 0.2 * elapsed_s
+
+    # -------- execution --------
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on this stage's pool; raises Overloaded when full."""
+        self.acquire()
+        t0 = time.monotonic()
+        try:
+            # carry the request's context (e.g. its timing breakdown) onto the worker thread
+            fut = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self.release(0.0)
+            raise
+        # the slot is freed when the task ends, not when the caller stops waiting:
+        # a cancelled request (client gone) leaves a started task running
+        fut.add_done_callback(lambda _: self.release(time.monotonic() - t0))
+        return await asyncio.wrap_future(fut)
+
+    def stream(self, make_iter: Callable[[], Iterator[Any]]) -> AsyncIterator[Any]:
+        """Drive a blocking iterator on this stage's pool and expose its items to async code.
+
+        Admission happens here (raising Overloaded), before any response is sent.
+        The work is submitted right away and releases its slot when it ends, even
+        if the consumer stops early.
+        """
+        self.acquire()
+        loop = asyncio.get_running_loop()
+        items: "asyncio.Queue" = asyncio.Queue()
+        stop = threading.Event()
+        t0 = time.monotonic()
+
+        def produce():
+            error = None
+            try:
+                for item in make_iter():
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                error = e
+            finally:
+                self.release(time.monotonic() - t0)
+                loop.call_soon_threadsafe(items.put_nowait, _End(error))
+
+        try:
+            self._executor.submit(contextvars.copy_context().run, produce)
+        except Exception:
+            self.release(0.0)
+            raise
+
+        async def drain():
+            try:
+                while True:
+                    item = await items.get()
+                    if isinstance(item, _End):
+                        if item.error is not None:
+                            raise item.error
+                        return
+                    yield item
+            finally:
+                stop.set()
+
+        return drain()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._inflight,
+                "queued": max(0, self._inflight - self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_ms": int(self._avg_s * 1000),
+            }
+
+
+# -------- Stages --------
+EMBED = Stage("embed", _env_int("STAGE_EMBED_WORKERS", 8), _env_int("STAGE_EMBED_QUEUE", 64))
+RETRIEVAL = Stage("retrieval", _env_int("STAGE_RETRIEVAL_WORKERS", 4), _env_int("STAGE_RETRIEVAL_QUEUE", 64))
+# generation workers mostly wait on the batch scheduler, so size them to fill its batch
+GENERATION = Stage("generation", _env_int("STAGE_GENERATION_WORKERS", _env_int("GEN_MAX_BATCH", 8)),
+                   _env_int("STAGE_GENERATION_QUEUE", 32))
+INGEST = Stage("ingest", _env_int("STAGE_INGEST_WORKERS", 2), _env_int("STAGE_INGEST_QUEUE", 8))
+
+STAGES = [EMBED, RETRIEVAL, GENERATION, INGEST]
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {s.name: s.stats() for s in STAGES}
+
+
+def _collect():
+    st = stats()
+    return [
+        ("sidecar_stage_in_flight", "gauge", "Tasks running or waiting per pipeline stage.",
+         [({"stage": k}, v["in_flight"]) for k, v in st.items()]),
+        ("sidecar_stage_queue_depth", "gauge", "Tasks waiting for a worker per pipeline stage.",
+         [({"stage": k}, v["queued"]) for k, v in st.items()]),
+        ("sidecar_stage_rejected_total", "counter", "Tasks turned away (429) per pipeline stage.",
+         [({"stage": k}, v["rejected"]) for k, v in st.items()]),
+    ]
+
+
+metrics.register_collector(_collect)
@@ -0,0 +1,83 @@
+import os, json, threading
+from typing import Any, Dict, List, Optional
+
+from cache import normalize_query
+
+# -------- Config --------
+POLICY_FILE = os.environ.get("TENANT_POLICY_FILE", os.path.join(os.path.dirname(__file__), "tenant_policies.json"))
+DEFAULTS: Dict[str, Any] = {
+    "direct_answer": os.environ.get("DIRECT_ANSWER", "1") == "1",
+    "direct_min_score": float(os.environ.get("DIRECT_MIN_SCORE", "0.80")),   # dense cosine of the top hit
+    "direct_min_margin": float(os.environ.get("DIRECT_MIN_MARGIN", "0.10")),  # over the runner-up
+}
+
+# Per-tenant overrides of DEFAULTS, kept in one JSON file: {tenant_id: {key: value}}.
+# The direct-answer strategy returns a FAQ doc's stored answer as-is when
+# retrieval is confident enough, instead of having Phi-3 paraphrase it.
+
+_lock = threading.Lock()
+_overrides: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    global _overrides
+    if _overrides is None:
+        try:
+            with open(POLICY_FILE, "r", encoding="utf-8") as f:
+                _overrides = json.load(f)
+        except FileNotFoundError:
+            _overrides = {}
+    return _overrides
+
+
+def get(tenant_id: str) -> Dict[str, Any]:
+    """Effective policy for a tenant (defaults plus its overrides)."""
+    with _lock:
+        return {**DEFAULTS, **_load().get(tenant_id, {})}
+
+
+def update(tenant_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Set (or, with None values, reset to default) a tenant's overrides and persist them."""
+    unknown = set(changes) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown policy keys: {', '.join(sorted(unknown))}")
+    with _lock:
+        overrides = _load()
+        mine = {**overrides.get(tenant_id, {}), **changes}
+        mine = {k: v for k, v in mine.items() if v is not None}
+        if mine:
+            overrides[tenant_id] = mine
+        else:
+            overrides.pop(tenant_id, None)
+        tmp = POLICY_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(overrides, f, indent=2)
+        os.replace(tmp, POLICY_FILE)
+        return {**DEFAULTS, **mine}
+
+
+def direct_answer(tenant_id: str, query: str, hits: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The hit whose stored answer can be returned as-is, or None to generate.
+
+    A FAQ hit (one with an answer) qualifies when it repeats the query verbatim
+    as its question. Otherwise the hit with the best dense score must be a FAQ
+    doc, clear the tenant's score threshold, and lead the runner-up by at least
+    the configured margin; with a single hit there is no margin to measure.
+    """
+    p = get(tenant_id)
+    if not hits or not p["direct_answer"]:
+        return None
+    q = normalize_query(query)
+    for h in hits:
+        if h.get("answer") and h.get("question") and normalize_query(h["question"]) == q:
+            return h
+    if len(hits) < 2:
+        return None
+    # hits come in fused (dense + BM25) order; the thresholds are on dense cosine
+    best = max(range(len(hits)), key=lambda i: hits[i]["score"])
+    top = hits[best]
+    runner_up = max(h["score"] for i, h in enumerate(hits) if i != best)
+    if top.get("answer") and top["score"] >= p["direct_min_score"] and \
+            top["score"] - runner_up >= p["direct_min_margin"]:
+        return top
+    return None
@@ -0,0 +1,150 @@
+import threading, time
+from typing import Callable, Dict, List, Optional, Tuple
+import torch
+
+# Reusable attention KV for prompt prefixes.
+#
+# Prompts are split into segments (the static system block, then one per
+# context document). The cache is a trie over those segments: each node holds
+# the K/V of its own segment's tokens only, so a prefix's KV is the
+# concatenation along its path. Keys are exact token ids, which makes a hit
+# bit-identical to recomputing the prefix.
+
+KV = List[Tuple[torch.Tensor, torch.Tensor]]     # per layer (k, v), [1, heads, T, dim]
+
+
+class _Node:
+    __slots__ = ("tokens", "kv", "parent", "children", "last_used", "pinned", "nbytes")
+
+    def __init__(self, tokens: Tuple[int, ...], kv: Optional[KV], parent: Optional["_Node"], pinned: bool = False):
+        self.tokens = tokens
+        self.kv = kv
+        self.parent = parent
+        self.children: Dict[Tuple[int, ...], "_Node"] = {}
+        self.last_used = time.monotonic()
+        self.pinned = pinned
+        self.nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in kv) if kv else 0
+
+
+class PrefixCache:
+    """Segment trie of prefix KV, bounded by max_bytes with LRU eviction of leaves.
+
+    A segment is only cached once the same prefix has been seen min_hits times,
+    so one-off documents don't churn the cache. Pinned entries are never evicted.
+    """
+
+    def __init__(self, max_bytes: int, min_hits: int = 2, max_tracked: int = 8192):
+        self.max_bytes = max_bytes
+        self.min_hits = max(1, min_hits)
+        self.enabled = max_bytes > 0
+        self._root = _Node((), None, None, pinned=True)
+        self._bytes = 0
+        self._nodes = 0
+        self._seen: Dict[int, int] = {}          # hash(prefix tokens) -> times observed
+        self._max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "tokens_reused": 0, "inserts": 0, "evictions": 0}
+
+    def match(self, ids: List[int], boundaries: List[int]) -> Tuple[int, Optional[KV], int]:
+        """Longest cached prefix of ids ending on a boundary.
+
+        Returns (n_tokens, per-layer KV for those tokens, depth). Always leaves at
+        least one token uncached so the caller gets next-token logits.
+        """
+        if not self.enabled:
+            return 0, None, 0
+        with self._lock:
+            self._counters["lookups"] += 1
+            node, start, path = self._root, 0, []
+            for b in boundaries:
+                if b >= len(ids):
+                    break
+                child = node.children.get(tuple(ids[start:b]))
+                if child is None:
+                    break
+                path.append(child)
+                node, start = child, b
+            if not path:
+                return 0, None, 0
+            now = time.monotonic()
+            for n in path:
+                n.last_used = now
+            self._counters["hits"] += 1
+            self._counters["tokens_reused"] += start
+            kvs = [n.kv for n in path]
+        if len(kvs) == 1:
+            return start, kvs[0], len(path)
+        layers = [(torch.cat([kv[i][0] for kv in kvs], dim=2), torch.cat([kv[i][1] for kv in kvs], dim=2))
+                  for i in range(len(kvs[0]))]
+        return start, layers, len(path)
+
+    def observe(self, ids: List[int], boundaries: List[int], depth: int,
+                kv_of: Callable[[int, int], KV], pin: bool = False) -> None:
+        """Record the prefixes of a freshly prefilled prompt, caching the frequent ones.
+
+        depth is the number of segments match() already served; kv_of(start, end)
+        returns the KV of tokens [start, end) from the prefill just run.
+        """
+        if not self.enabled:
+            return
+        bounds = [b for b in boundaries if b < len(ids)]
+        with self._lock:
+            node, start = self._root, 0
+            for i, b in enumerate(bounds):
+                seg = tuple(ids[start:b])
+                child = node.children.get(seg)
+                if child is None:
+                    if i < depth:
+                        return            # evicted since match(); nothing to extend
+                    if not pin and self._count(hash(tuple(ids[:b]))) < self.min_hits:
+                        return
+                    kv = [(k.contiguous(), v.contiguous()) for k, v in kv_of(start, b)]
+                    child = _Node(seg, kv, node, pinned=pin)
+                    node.children[seg] = child
+                    self._bytes += child.nbytes
+                    self._nodes += 1
+                    self._counters["inserts"] += 1
+                node, start = child, b
+            self._evict()
+
+    def _count(self, key: int) -> int:
+        n = self._seen.get(key, 0) + 1
+        if n == 1 and len(self._seen) >= self._max_tracked:
+            self._seen.clear()
+        self._seen[key] = n
+        return n
+
+    def _leaves(self) -> List[_Node]:
+        out, stack = [], [self._root]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                stack.extend(node.children.values())
+            elif not node.pinned:
+                out.append(node)
+        return out
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes:
+            leaves = self._leaves()
+            if not leaves:
+                return
+            victim = min(leaves, key=lambda n: n.last_used)
+            del victim.parent.children[victim.tokens]
+            self._bytes -= victim.nbytes
+            self._nodes -= 1
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._root = _Node((), None, None, pinned=True)
+            self._bytes = 0
+            self._nodes = 0
+            self._seen.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._counters)
+            out["bytes"] = self._bytes
+            out["entries"] = self._nodes
+        return out
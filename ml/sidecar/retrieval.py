@@ -1,73 +1,127 @@
-import os, json
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Optional
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+
+import embedder
+import metrics
+import stores
+from filters import parse as parse_filters
 
 # -------- Config --------
-VEC_DIR = os.path.join(os.path.dirname(__file__), "vectorstores")
-EMB_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-_embedder = SentenceTransformer(EMB_MODEL)
+HYBRID = os.environ.get("RETRIEVAL_HYBRID", "1") == "1"        # fuse BM25 with dense results
+RRF_K = int(os.environ.get("RETRIEVAL_RRF_K", "60"))
+# each retriever contributes this many candidates (at least) to the fusion
+FUSION_DEPTH = int(os.environ.get("RETRIEVAL_FUSION_DEPTH", "20"))
+# filtered searches matching at most this many docs score them exactly instead of going through faiss
+FILTER_EXACT_MAX = int(os.environ.get("RETRIEVAL_FILTER_EXACT_MAX", "4096"))
 
 
-def _normalize(v: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
-    return v / norms
+def _rrf(*rankings: List[int]) -> List[int]:
+    """Reciprocal rank fusion: order rows by sum(1 / (RRF_K + rank)) over the rankings."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
 
 
-def _paths(tenant_id: str):
-    base = os.path.join(VEC_DIR, tenant_id)
-    return (
-        os.path.join(base, "index.faiss"),
-        os.path.join(base, "id_map.json"),
-        os.path.join(base, "docs.json"),
-    )
+def _allowed(store: stores.TenantStore, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Row bitmap of the docs passing `filters`, or None when nothing is filtered."""
+    conditions = parse_filters(filters)
+    if not conditions:
+        return None
+    with metrics.timed("retrieval.filter"):
+        return store.filter_mask(conditions)
 
 
-def _load_artifacts(tenant_id: str):
-    index_path, idmap_path, docs_path = _paths(tenant_id)
+def _dense(store: stores.TenantStore, qvs: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+    """faiss (scores, rows) for each query row, restricted to the allowed rows."""
+    if allowed is None:
+        return store.search(qvs, k)
+    rows = np.flatnonzero(allowed)
+    if len(rows) <= FILTER_EXACT_MAX:
+        # a selective filter: scoring its few docs directly beats (and is exact unlike) an ANN probe
+        sims = qvs @ store.vectors_of(rows).T
+        top = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(sims, top, axis=1), rows[top]
+    return store.search(qvs, k, allowed)
 
-    if not (os.path.exists(index_path) and os.path.exists(idmap_path) and os.path.exists(docs_path)):
-        raise FileNotFoundError(f"No vector store found for tenant '{tenant_id}'. Please ingest first.")
 
-    index = faiss.read_index(index_path)
-    with open(idmap_path, "r", encoding="utf-8") as f:
-        id_map: Dict[str, int] = json.load(f)
-    with open(docs_path, "r", encoding="utf-8") as f:
-        docs_store: Dict[str, Dict[str, Any]] = json.load(f)
+def _hits(store: stores.TenantStore, query: str, qv: np.ndarray, top_k: int, depth: int,
+          scores: np.ndarray, rows: np.ndarray, allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """Fuse one query's faiss row (scores, rows) with its BM25 hits and decode the top_k docs."""
+    dense_score: Dict[int, float] = {}
+    for score, row in zip(scores, rows):
+        if len(dense_score) == depth:
+            break
+        if store.doc_id(int(row)):
+            dense_score[int(row)] = float(score)
+    ranked = list(dense_score)
 
-    # Invert mapping row -> doc_id
-    inv_map = {row: doc_id for doc_id, row in id_map.items()}
-    return index, inv_map, docs_store
+    if HYBRID and store.lexical is not None:
+        with metrics.timed("retrieval.lexical"):
+            lex_rows, _ = store.lexical.search(query, depth, allowed)
+        if len(lex_rows):
+            ranked = _rrf(ranked, [int(r) for r in lex_rows])
 
+    results: List[Dict[str, Any]] = []
+    with metrics.timed("retrieval.docs"):
+        for row in ranked[:top_k]:
+            score = dense_score.get(row)
+            if score is None:
+                # lexical-only hit: score it against the stored vector
+                score = float(np.dot(store.vector(row), qv.reshape(-1)))
+            # only the hits are decoded from the document blob
+            d = store.doc(row)
+            results.append({
+                "id": store.doc_id(row),
+                "title": d.get("title"),
+                "url": d.get("url"),
+                "score": score,
+                "attributes": d.get("attributes", {}),
+                "question": d.get("question"),
+                "answer": d.get("answer"),
+                "metadata": d.get("metadata", {}),
+                "tags": d.get("tags", []),
+                "raw": d  # keep full doc for prompt
+            })
+    return results
 
-def search(tenant_id: str, query: str, top_k: int = 4) -> List[Dict[str, Any]]:
-    """Return top_k retrieved documents for a tenant query."""
-    index, inv_map, docs_store = _load_artifacts(tenant_id)
 
-    qv = _embedder.encode([query], convert_to_numpy=True).astype("float32")
-    qv = _normalize(qv)
-    scores, rows = index.search(qv, top_k)
+def _depth(store: stores.TenantStore, top_k: int) -> int:
+    """Candidates per retriever for a query against this store."""
+    return max(top_k, FUSION_DEPTH) if HYBRID and store.lexical is not None else top_k
 
-    results: List[Dict[str, Any]] = []
-    for score, row in zip(scores[0], rows[0]):
-        if row == -1:
-            continue
-        doc_id = inv_map.get(int(row))
-        if not doc_id:
-            continue
-        d = docs_store.get(doc_id, {})
-        results.append({
-            "id": doc_id,
-            "title": d.get("title"),
-            "url": d.get("url"),
-            "score": float(score),
-            "attributes": d.get("attributes", {}),
-            "question": d.get("question"),
-            "answer": d.get("answer"),
-            "metadata": d.get("metadata", {}),
-            "tags": d.get("tags", []),
-            "raw": d  # keep full doc for prompt
-        })
 
-    return results
+def search(tenant_id: str, query: str, top_k: int = 4, qv: Optional[np.ndarray] = None,
+           filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Return top_k retrieved documents for a tenant query.
+
+    Dense (faiss) and lexical (BM25) hits are merged with reciprocal rank
+    fusion; `score` stays the dense cosine similarity of each hit.
+    Pass the already-computed query vector as `qv` to avoid a second embedding.
+    `filters` (see filters.py) restricts both retrievers to matching docs.
+    """
+    with metrics.timed("retrieval.store"):
+        store = stores.get(tenant_id)
+    allowed = _allowed(store, filters)
+
+    if qv is None:
+        with metrics.timed("retrieval.embed"):
+            qv = embedder.encode_query(query)
+    depth = _depth(store, top_k)
+    with metrics.timed("retrieval.faiss"):
+        scores, rows = _dense(store, qv.reshape(1, -1), depth, allowed)
+    return _hits(store, query, qv, top_k, depth, scores[0], rows[0], allowed)
+
+
+def search_many(tenant_id: str, queries: List[str], qvs: np.ndarray, top_k: int = 4,
+                filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    """search() for several queries of one tenant (and filter), with a single multi-row faiss search."""
+    with metrics.timed("retrieval.store"):
+        store = stores.get(tenant_id)
+    allowed = _allowed(store, filters)
+    depth = _depth(store, top_k)
+    with metrics.timed("retrieval.faiss"):
+        scores, rows = _dense(store, np.ascontiguousarray(qvs, dtype="float32").reshape(len(queries), -1), depth, allowed)
+    return [_hits(store, q, qvs[i], top_k, depth, scores[i], rows[i], allowed) for i, q in enumerate(queries)]
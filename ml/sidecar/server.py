@@ -1,19 +1,51 @@
-import os, sys, time, traceback
+import os, sys, json, time, traceback
+from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse, PlainTextResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 # ensure local imports work when running via uvicorn
 sys.path.insert(0, os.path.dirname(__file__))
 
-from ingestion import upsert_documents
-from retrieval import search
-from generation import generate_from_context
-from cache import get as cache_get, put as cache_put
+from ingestion import upsert_documents, delete_documents
+from retrieval import search, search_many
+from generation import generate_from_context, generate_many, stream_from_context, prefix_cache_stats
+from cache import get as cache_get, get_exact as cache_get_exact, put as cache_put, clear as cache_clear, tenant_epoch
+import bulk
+import cache
+from embedder import encode_query
+from filters import FilterError, parse as parse_filters
+import embedder
+import generation
+import metrics
+import pipeline
+import policy
+import startup
+import stores
+from pipeline import Overloaded
+
+# ------------- Model loading -------------
+# Models load in background threads after the app starts; /health answers at
+# once, /ready reports when (and how fast) each component came up.
+startup.register("embedder", embedder.load, warmup=lambda: encode_query("warm up"))
+startup.register("tokenizer", generation.load_tokenizer, warmup=lambda: generation.load_tokenizer()("warm up"))
+startup.register("generator", generation.load_model, after=["tokenizer"],
+                 warmup=lambda: generate_from_context("warm up", [], max_new_tokens=4, min_new_tokens=0))
+
+# cached answers were built from a tenant's docs: drop them once the docs change
+stores.on_change(cache_clear)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.start()
+    yield
+
 
 # ------------- FastAPI -------------
-app = FastAPI(title="RAG Sidecar (Phi-3)")
+app = FastAPI(title="RAG Sidecar (Phi-3)", lifespan=lifespan)
 
 # --------- Schemas ----------
 class Document(BaseModel):
@@ -31,16 +63,77 @@ class IngestRequest(BaseModel):
     dataset_type: str
     documents: List[Document]
 
+class QueryFilters(BaseModel):
+    """Restrict retrieval to matching docs; see filters.py for the value forms."""
+    tags: Optional[List[str]] = None                    # every tag must be present
+    attributes: Optional[Dict[str, object]] = None
+    metadata: Optional[Dict[str, object]] = None
+
 class QueryRequest(BaseModel):
     tenant_id: str
     query: str
     top_k: int = 4
+    filters: Optional[QueryFilters] = None
+    timings: bool = False       # include a per-stage timing breakdown (ms) in the response
 
 class QueryResponse(BaseModel):
     answer: str
     strategy: str
     latency_ms: int
     context: List[Dict[str, object]]
+    timings: Optional[Dict[str, float]] = None
+
+class TenantPolicy(BaseModel):
+    direct_answer: Optional[bool] = None
+    direct_min_score: Optional[float] = Field(None, ge=-1.0, le=1.0)
+    direct_min_margin: Optional[float] = Field(None, ge=0.0, le=2.0)
+
+class BatchQueryItem(BaseModel):
+    tenant_id: str
+    query: str
+    top_k: int = 4
+    filters: Optional[QueryFilters] = None
+
+class BatchQueryRequest(BaseModel):
+    items: List[BatchQueryItem]
+    use_cache: bool = True      # False for evaluation runs: no cache reads or writes
+
+class BatchQueryResult(BaseModel):
+    answer: Optional[str] = None
+    strategy: str
+    context: List[Dict[str, object]] = []
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+    latency_ms: int
+    timings: Dict[str, float]
+
+
+# --------- Backpressure ----------
+NOT_READY_RETRY_S = 5
+BATCH_MAX_ITEMS = int(os.environ.get("QUERY_BATCH_MAX_ITEMS", "64"))
+
+def _observe(route: str, outcome: str, t0: float) -> None:
+    metrics.REQUEST_SECONDS.observe(time.time() - t0, route=route, strategy=outcome)
+    metrics.REQUESTS.inc(route=route, outcome=outcome)
+
+def _busy(e: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+        content={"error": "overloaded", "stage": e.stage, "retry_after": e.retry_after},
+    )
+
+def _not_ready(*components: str) -> Optional[JSONResponse]:
+    """503 + Retry-After while the models a route needs are still loading."""
+    if startup.is_ready(*components):
+        return None
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(NOT_READY_RETRY_S)},
+        content={"error": "not_ready", "components": startup.status()["components"]},
+    )
 
 
 # --------- Routes ----------
@@ -54,15 +147,58 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    status = startup.status()
+    status["embedder"] = embedder.info()
+    status["generator"] = generation.model_info()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**cache.stats(), "prefix_kv": prefix_cache_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/pipeline/stats")
+def pipeline_stats():
+    return pipeline.stats()
+
+
+@app.get("/policy/{tenant_id}")
+def get_policy(tenant_id: str):
+    return policy.get(tenant_id)
+
+
+@app.put("/policy/{tenant_id}")
+def put_policy(tenant_id: str, req: TenantPolicy):
+    """Override this tenant's direct-answer settings; null resets a key to the default."""
+    return policy.update(tenant_id, req.model_dump(exclude_unset=True))
+
+
 @app.post("/ingest")
-def ingest(req: IngestRequest):
+async def ingest(req: IngestRequest):
+    waiting = _not_ready("embedder")
+    if waiting is not None:
+        return waiting
     try:
-        count = upsert_documents(
+        t0 = time.time()
+        stats = await pipeline.INGEST.run(
+            upsert_documents,
             req.tenant_id,
             req.dataset_type,
             [d.model_dump() for d in req.documents]
         )
-        return {"status": "ingested", "count": count}
+        _observe("/ingest", "ingested", t0)
+        return {"status": "ingested", **stats}
+    except Overloaded as e:
+        metrics.REQUESTS.inc(route="/ingest", outcome="overloaded")
+        return _busy(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={
             "error": "ingest_failed",
@@ -70,76 +206,435 @@ def ingest(req: IngestRequest):
         })
 
 
+SPOOL_WRITE_BYTES = 1024 * 1024     # upload bytes gathered per disk write
+
+
+def _upload_too_large() -> JSONResponse:
+    return JSONResponse(status_code=413, content={"error": "upload_too_large", "max_bytes": bulk.MAX_UPLOAD_BYTES})
+
+
+@app.post("/ingest/bulk", status_code=202)
+async def ingest_bulk(request: Request, tenant_id: str, dataset_type: str = "faq", format: Optional[str] = None):
+    """Stream an NDJSON or CSV upload to disk and ingest it as a background job.
+
+    Disk writes run on the threadpool so a large upload doesn't stall the event
+    loop; bodies over BULK_MAX_UPLOAD_MB are refused with 413.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > bulk.MAX_UPLOAD_BYTES:
+        return _upload_too_large()
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    try:
+        job = await run_in_threadpool(bulk.create, tenant_id, dataset_type, format)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    received, too_large = 0, False
+    try:
+        f = await run_in_threadpool(open, bulk.spool_path(job.id), "wb")
+        try:
+            buf = bytearray()
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > bulk.MAX_UPLOAD_BYTES:
+                    too_large = True
+                    break
+                buf += chunk
+                if len(buf) >= SPOOL_WRITE_BYTES:
+                    await run_in_threadpool(f.write, buf)
+                    buf.clear()
+            if buf and not too_large:
+                await run_in_threadpool(f.write, buf)
+        finally:
+            await run_in_threadpool(f.close)
+    except Exception as e:
+        await run_in_threadpool(bulk.abandon, job, f"upload failed: {e}")
+        raise
+    if too_large:
+        await run_in_threadpool(bulk.abandon, job, f"upload larger than {bulk.MAX_UPLOAD_BYTES} bytes")
+        return _upload_too_large()
+    await run_in_threadpool(bulk.submit, job)
+    return {"job_id": job.id, "state": job.state, "status_url": f"/ingest/jobs/{job.id}"}
+
+
+@app.get("/ingest/jobs")
+def ingest_jobs(tenant_id: Optional[str] = None):
+    return bulk.list_jobs(tenant_id)
+
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job(job_id: str):
+    job = bulk.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "job_not_found"})
+    return job.to_dict()
+
+
+@app.delete("/ingest/jobs/{job_id}")
+def cancel_ingest_job(job_id: str):
+    job = bulk.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "job_not_found"})
+    return job.to_dict()
+
+
+@app.post("/ingest/jobs/{job_id}/resume")
+def resume_ingest_job(job_id: str):
+    if bulk.get(job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "job_not_found"})
+    job = bulk.resume(job_id)
+    if job is None:
+        return JSONResponse(status_code=409, content={"error": "job_not_resumable"})
+    return job.to_dict()
+
+
+def _filter_spec(filters: Optional[QueryFilters]) -> Optional[Dict[str, object]]:
+    """A request's filters as a plain dict, None when they filter nothing. Raises FilterError."""
+    spec = filters.model_dump(exclude_none=True) if filters is not None else None
+    return spec if parse_filters(spec) else None
+
+
+def _invalid_filters(e: FilterError) -> JSONResponse:
+    return JSONResponse(status_code=422, content={"error": "invalid_filters", "detail": str(e)})
+
+
 @app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest):
+async def query(req: QueryRequest):
     t0 = time.time()
+    timings = metrics.start_breakdown()
+    try:
+        filters = _filter_spec(req.filters)
+    except FilterError as e:
+        return _invalid_filters(e)
+    # cached answers were produced without a filter, so filtered queries bypass the cache
+    use_cache = filters is None
+    epoch = tenant_epoch(req.tenant_id)
 
     try:
-        # 1. cache check
-        cached = cache_get(req.tenant_id, req.query)
+        # 0. exact-match cache check (no embedding needed)
+        cached = cache_get_exact(req.tenant_id, req.query) if use_cache else None
         if cached:
             latency = int((time.time() - t0) * 1000)
+            _observe("/query", "cache_exact", t0)
             return QueryResponse(
                 answer=cached,
-                strategy="cache",
+                strategy="cache_exact",
                 latency_ms=latency,
-                context=[]
+                context=[],
+                timings=timings if req.timings else None
+            )
+
+        waiting = _not_ready()
+        if waiting is not None:
+            return waiting
+
+        # embed once; the vector is shared by cache and retrieval
+        with metrics.timed("embed"):
+            qv = await pipeline.EMBED.run(encode_query, req.query)
+
+        # 1. semantic cache check
+        cached = cache_get(req.tenant_id, req.query, qv=qv) if use_cache else None
+        if cached:
+            latency = int((time.time() - t0) * 1000)
+            _observe("/query", "cache_semantic", t0)
+            return QueryResponse(
+                answer=cached,
+                strategy="cache_semantic",
+                latency_ms=latency,
+                context=[],
+                timings=timings if req.timings else None
             )
 
         # 2. retrieve docs
-        ctx = search(req.tenant_id, req.query, top_k=req.top_k)
+        with metrics.timed("retrieval"):
+            ctx = await pipeline.RETRIEVAL.run(search, req.tenant_id, req.query, top_k=req.top_k, qv=qv,
+                                               filters=filters)
+
+        # 3. a confident FAQ match is answered with its stored answer, no generation
+        hit = policy.direct_answer(req.tenant_id, req.query, ctx)
+        if hit is not None:
+            _observe("/query", "direct_faq", t0)
+            return QueryResponse(
+                answer=hit["answer"],
+                strategy="direct_faq",
+                latency_ms=int((time.time() - t0) * 1000),
+                context=[hit],
+                timings=timings if req.timings else None
+            )
 
-        # 3. generate answer
-        answer, meta = generate_from_context(req.query, ctx)
+        # 4. generate answer
+        with metrics.timed("generation"):
+            answer, meta = await pipeline.GENERATION.run(generate_from_context, req.query, ctx)
 
-        # 4. update cache
-        cache_put(req.tenant_id, req.query, answer)
+        # 5. update cache
+        if use_cache:
+            cache_put(req.tenant_id, req.query, answer, qv=qv, epoch=epoch)
 
         latency = int((time.time() - t0) * 1000)
+        _observe("/query", "rag", t0)
         return QueryResponse(
             answer=answer,
             strategy="rag",
             latency_ms=latency,
-            context=ctx
+            context=ctx,
+            timings=timings if req.timings else None
         )
 
+    except Overloaded as e:
+        metrics.REQUESTS.inc(route="/query", outcome="overloaded")
+        return _busy(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={
             "error": "query_failed",
             "detail": "".join(traceback.format_exception(e))
         })
 
+
+def _retrieve_batch(items: List[BatchQueryItem], pick: List[int], qvs, specs: List[Optional[Dict[str, object]]]) -> Dict[int, object]:
+    """One multi-row search per (tenant, top_k, filters) group; a failing tenant only fails its own items."""
+    pos = {i: j for j, i in enumerate(pick)}
+    groups: Dict[tuple, List[int]] = {}
+    for i in pick:
+        key = (items[i].tenant_id, items[i].top_k, json.dumps(specs[i], sort_keys=True, default=str))
+        groups.setdefault(key, []).append(i)
+    out: Dict[int, object] = {}
+    for (tenant_id, top_k, _), idx in groups.items():
+        try:
+            hits = search_many(tenant_id, [items[i].query for i in idx], qvs[[pos[i] for i in idx]], top_k=top_k,
+                               filters=specs[idx[0]])
+            out.update(zip(idx, hits))
+        except Exception as e:
+            out.update((i, e) for i in idx)
+    return out
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(req: BatchQueryRequest):
+    """Answer many queries at once: one embedding pass, one faiss search per tenant,
+    and generation queued together so it decodes in shared batches. Errors are
+    reported per item."""
+    t0 = time.time()
+    timings = metrics.start_breakdown()
+    if len(req.items) > BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=413, content={"error": "batch_too_large", "max_items": BATCH_MAX_ITEMS})
+    results: List[Optional[BatchQueryResult]] = [None] * len(req.items)
+    epochs = [tenant_epoch(item.tenant_id) for item in req.items]
+
+    def fail(i: int, e: BaseException) -> None:
+        results[i] = BatchQueryResult(strategy="error", error="".join(traceback.format_exception_only(type(e), e)).strip())
+
+    try:
+        pending = []
+        specs: List[Optional[Dict[str, object]]] = [None] * len(req.items)
+        for i, item in enumerate(req.items):
+            try:
+                specs[i] = _filter_spec(item.filters)
+                pending.append(i)
+            except FilterError as e:
+                fail(i, e)
+
+        def cacheable(i: int) -> bool:
+            # as in /query, filtered items neither read nor fill the cache
+            return req.use_cache and specs[i] is None
+
+        if req.use_cache:
+            for i in list(pending):
+                if not cacheable(i):
+                    continue
+                cached = cache_get_exact(req.items[i].tenant_id, req.items[i].query)
+                if cached:
+                    results[i] = BatchQueryResult(answer=cached, strategy="cache_exact")
+                    pending.remove(i)
+
+        if pending:
+            waiting = _not_ready()
+            if waiting is not None:
+                return waiting
+
+            with metrics.timed("embed"):
+                qvs = await pipeline.EMBED.run(embedder.encode, [req.items[i].query for i in pending])
+            if req.use_cache:
+                for j, i in enumerate(list(pending)):
+                    if not cacheable(i):
+                        continue
+                    cached = cache_get(req.items[i].tenant_id, req.items[i].query, qv=qvs[j])
+                    if cached:
+                        results[i] = BatchQueryResult(answer=cached, strategy="cache_semantic")
+                keep = [j for j, i in enumerate(pending) if results[i] is None]
+                pending, qvs = [pending[j] for j in keep], qvs[keep]
+
+        if pending:
+            with metrics.timed("retrieval"):
+                ctx = await pipeline.RETRIEVAL.run(_retrieve_batch, req.items, pending, qvs, specs)
+            gen = []
+            for i in pending:
+                if isinstance(ctx[i], Exception):
+                    fail(i, ctx[i])
+                    continue
+                hit = policy.direct_answer(req.items[i].tenant_id, req.items[i].query, ctx[i])
+                if hit is not None:
+                    results[i] = BatchQueryResult(answer=hit["answer"], strategy="direct_faq", context=[hit])
+                else:
+                    gen.append(i)
+
+            answers = []
+            if gen:
+                with metrics.timed("generation"):
+                    answers = await pipeline.GENERATION.run(
+                        generate_many, [(req.items[i].query, ctx[i]) for i in gen])
+            for i, out in zip(gen, answers):
+                if isinstance(out, Exception):
+                    fail(i, out)
+                    continue
+                results[i] = BatchQueryResult(answer=out[0], strategy="rag", context=ctx[i])
+                if cacheable(i):
+                    cache_put(req.items[i].tenant_id, req.items[i].query, out[0], qv=qvs[pending.index(i)],
+                              epoch=epochs[i])
+
+        for r in results:
+            metrics.REQUESTS.inc(route="/query/batch/item", outcome=r.strategy)
+        _observe("/query/batch", "batch", t0)
+        return BatchQueryResponse(results=results, latency_ms=int((time.time() - t0) * 1000), timings=timings)
+
+    except Overloaded as e:
+        metrics.REQUESTS.inc(route="/query/batch", outcome="overloaded")
+        return _busy(e)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={
+            "error": "query_failed",
+            "detail": "".join(traceback.format_exception(e))
+        })
+
+
+def _event(kind: str, **fields) -> bytes:
+    return (json.dumps({"type": kind, **fields}, default=str) + "\n").encode("utf-8")
+
+
+def _ndjson(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Same pipeline as /query, streamed as NDJSON events:
+
+    {"type": "context", ...} once retrieval is done, {"type": "token", "text": ...}
+    per decoded chunk, then {"type": "done", "answer", "strategy", "ttft_ms", "latency_ms"}
+    (or {"type": "error", "detail"}). Overload and cold start are reported as
+    429/503 before the stream starts.
+    """
+    t0 = time.time()
+    timings = metrics.start_breakdown()
+    extra = {"timings": timings} if req.timings else {}
+    try:
+        filters = _filter_spec(req.filters)
+    except FilterError as e:
+        return _invalid_filters(e)
+    use_cache = filters is None
+    epoch = tenant_epoch(req.tenant_id)
+
+    def ms() -> int:
+        return int((time.time() - t0) * 1000)
+
+    # cache hits and direct FAQ answers arrive as a single chunk
+    def whole(answer: str, strategy: str, context: List[Dict[str, object]]):
+        async def events():
+            yield _event("context", strategy=strategy, context=context, retrieval_ms=ms())
+            ttft = ms()
+            yield _event("token", text=answer)
+            _observe("/query/stream", strategy, t0)
+            yield _event("done", answer=answer, strategy=strategy, ttft_ms=ttft, latency_ms=ms(), **extra)
+        return _ndjson(events())
+
+    try:
+        cached = cache_get_exact(req.tenant_id, req.query) if use_cache else None
+        strategy = "cache_exact"
+        qv = None
+        if not cached:
+            waiting = _not_ready()
+            if waiting is not None:
+                return waiting
+            with metrics.timed("embed"):
+                qv = await pipeline.EMBED.run(encode_query, req.query)
+            cached = cache_get(req.tenant_id, req.query, qv=qv) if use_cache else None
+            strategy = "cache_semantic"
+        if cached:
+            return whole(cached, strategy, [])
+
+        with metrics.timed("retrieval"):
+            ctx = await pipeline.RETRIEVAL.run(search, req.tenant_id, req.query, top_k=req.top_k, qv=qv,
+                                               filters=filters)
+        hit = policy.direct_answer(req.tenant_id, req.query, ctx)
+        if hit is not None:
+            return whole(hit["answer"], "direct_faq", [hit])
+        retrieval_ms = ms()
+        tokens = pipeline.GENERATION.stream(lambda: stream_from_context(req.query, ctx))
+    except Overloaded as e:
+        metrics.REQUESTS.inc(route="/query/stream", outcome="overloaded")
+        return _busy(e)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={
+            "error": "query_failed",
+            "detail": "".join(traceback.format_exception(e))
+        })
+
+    async def events():
+        yield _event("context", strategy="rag", context=ctx, retrieval_ms=retrieval_ms)
+        try:
+            ttft = None
+            answer, meta = "", {}
+            async for kind, payload in tokens:
+                if kind == "token":
+                    if ttft is None:
+                        ttft = ms()
+                        metrics.TTFT_SECONDS.observe(ttft / 1000)
+                    yield _event("token", text=payload)
+                else:
+                    answer, meta = payload
+            metrics.observe_stage("generation", time.time() - t0 - retrieval_ms / 1000)
+
+            if use_cache:
+                cache_put(req.tenant_id, req.query, answer, qv=qv, epoch=epoch)
+            _observe("/query/stream", "rag", t0)
+            yield _event("done", answer=answer, strategy="rag",
+                         ttft_ms=ttft if ttft is not None else ms(), latency_ms=ms(),
+                         gen_len=meta.get("gen_len"), **extra)
+        except Exception as e:
+            yield _event("error", error="query_failed", detail="".join(traceback.format_exception(e)))
+
+    return _ndjson(events())
+
+
 @app.get("/list/{tenant_id}")
-def list_docs(tenant_id: str):
+async def list_docs(tenant_id: str):
     try:
-        index, inv_map, docs_store = _load_artifacts(tenant_id)
-        return list(docs_store.values())
+        return await pipeline.RETRIEVAL.run(lambda: list(stores.get(tenant_id).docs()))
+    except Overloaded as e:
+        return _busy(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+def _delete_tenant(tenant_id: str) -> None:
+    # remove vectorstore folder for this tenant (waits for any write in progress)
+    stores.delete(tenant_id)
+
 @app.delete("/delete/{tenant_id}")
-def delete_tenant(tenant_id: str):
+async def delete_tenant(tenant_id: str):
     try:
-        # remove vectorstore folder for this tenant
-        path = f"vectorstores/{tenant_id}"
-        import shutil, os
-        if os.path.exists(path):
-            shutil.rmtree(path)
+        await pipeline.INGEST.run(_delete_tenant, tenant_id)
         return {"status": "deleted", "tenant": tenant_id}
+    except Overloaded as e:
+        return _busy(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.delete("/delete/{tenant_id}/{doc_id}")
-def delete_doc(tenant_id: str, doc_id: str):
+async def delete_doc(tenant_id: str, doc_id: str):
     try:
-        index, inv_map, docs_store = _load_artifacts(tenant_id)
-        if doc_id in docs_store:
-            del docs_store[doc_id]
-            # save updated docs_store (persistence logic as needed)
-            import json, os
-            with open(f"vectorstores/{tenant_id}/docs.json", "w", encoding="utf-8") as f:
-                json.dump(list(docs_store.values()), f, ensure_ascii=False, indent=2)
+        await pipeline.INGEST.run(delete_documents, tenant_id, [doc_id])
         return {"status": "deleted", "tenant": tenant_id, "doc": doc_id}
+    except Overloaded as e:
+        return _busy(e)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
-
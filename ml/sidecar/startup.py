@@ -0,0 +1,90 @@
+import os, threading, time, traceback
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# -------- Config --------
+LAZY_LOAD = os.environ.get("SIDECAR_LAZY_LOAD", "0") == "1"     # load on first request instead of at startup
+PREWARM = os.environ.get("SIDECAR_PREWARM", "0") == "1"         # run a dummy request through each component
+
+# Background loading of the sidecar's models. Each component loads in its own
+# thread as soon as the components it depends on are ready, so independent
+# models (embedder, tokenizer, Phi-3) load concurrently.
+
+
+class _Component:
+    def __init__(self, name: str, load: Callable[[], Any], after: Iterable[str], warmup: Optional[Callable[[], Any]]):
+        self.name = name
+        self.load = load
+        self.after = list(after)
+        self.warmup = warmup
+        self.state = "pending"          # pending | loading | warming | ready | failed
+        self.error: Optional[str] = None
+        self.load_ms: Optional[int] = None
+        self.warmup_ms: Optional[int] = None
+        self.done = threading.Event()
+
+
+_components: "OrderedDict[str, _Component]" = OrderedDict()
+_started_at: Optional[float] = None
+
+
+def register(name: str, load: Callable[[], Any], *, after: Iterable[str] = (),
+             warmup: Optional[Callable[[], Any]] = None) -> None:
+    """Declare a component; `load` must be idempotent, `warmup` runs only with SIDECAR_PREWARM=1."""
+    _components[name] = _Component(name, load, after, warmup)
+
+
+def _run(c: _Component) -> None:
+    for dep in c.after:
+        _components[dep].done.wait()
+        if _components[dep].state == "failed":
+            c.state, c.error = "failed", f"dependency {dep} failed"
+            c.done.set()
+            return
+    try:
+        c.state = "loading"
+        t0 = time.monotonic()
+        c.load()
+        c.load_ms = int((time.monotonic() - t0) * 1000)
+        if PREWARM and c.warmup is not None:
+            c.state = "warming"
+            t0 = time.monotonic()
+            c.warmup()
+            c.warmup_ms = int((time.monotonic() - t0) * 1000)
+        c.state = "ready"
+    except Exception as e:
+        c.state = "failed"
+        c.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        c.done.set()
+
+
+def start() -> None:
+    """Kick off background loading of every registered component (no-op when lazy)."""
+    global _started_at
+    if _started_at is not None or LAZY_LOAD:
+        return
+    _started_at = time.monotonic()
+    for c in _components.values():
+        threading.Thread(target=_run, args=(c,), name=f"load-{c.name}", daemon=True).start()
+
+
+def is_ready(*names: str) -> bool:
+    """True once the named components (default: all) have loaded; always true when lazy."""
+    if LAZY_LOAD:
+        return True
+    picked = [_components[n] for n in names] if names else list(_components.values())
+    return bool(picked) and all(c.state == "ready" for c in picked)
+
+
+def status() -> Dict[str, Any]:
+    """Per-component load state and timings, for /ready."""
+    return {
+        "ready": is_ready(),
+        "lazy": LAZY_LOAD,
+        "uptime_s": round(time.monotonic() - _started_at, 1) if _started_at is not None else None,
+        "components": {
+            c.name: {"state": c.state, "load_ms": c.load_ms, "warmup_ms": c.warmup_ms, "error": c.error}
+            for c in _components.values()
+        },
+    }
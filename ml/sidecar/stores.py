@@ -0,0 +1,1112 @@
+import os, sys, json, mmap, re, shutil, threading, uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Iterator, Tuple
+import numpy as np
+import faiss
+
+import ann
+import filters
+import lexical
+
+try:
+    import fcntl
+except ImportError:                 # Windows
+    fcntl = None
+    import msvcrt
+
+# -------- Config --------
+VEC_DIR = os.path.join(os.path.dirname(__file__), "vectorstores")
+STORE_MAX_TENANTS = int(os.environ.get("STORE_MAX_TENANTS", "64"))
+STORE_MAX_MB = float(os.environ.get("STORE_MAX_MB", "1024"))
+STORE_KEEP_GENERATIONS = int(os.environ.get("STORE_KEEP_GENERATIONS", "2"))   # current + previous on disk
+# a commit merges the newest segments until the one before them holds this many times more live rows
+STORE_MERGE_FACTOR = float(os.environ.get("STORE_MERGE_FACTOR", "4"))
+
+# On-disk layout (format 3), one directory per tenant:
+#   manifest.json  format version, generation, dim, row/live counts, embedding model, doc blob name
+#                  and committed size, and the generation's segments. Replacing it publishes a generation.
+#                  Each segment entry carries a random id: directory names start over
+#                  when a tenant is deleted and re-ingested, ids don't.
+#   gen-<n>.json   copy of the manifest of generation n
+#   seg-<n>/       rows written by the commit of generation n, never modified once published.
+#                  Row numbers are store-wide; a segment holds rows [start, start + rows):
+#     index.faiss    IndexIDMap2 over the spec ann.spec_for picks for the segment; faiss ids are row numbers
+#     vectors.npy    float32 rows x dim, memory-mapped; source of truth for merges
+#     ids.npy        row -> doc_id ("" marks a row that was dead when the segment was written)
+#     hashes.npy     row -> sha1 of the embedded text
+#     spans.npy      row -> (offset, length) of the doc inside the doc blob
+#     lex_*.npy      BM25 postings (terms, rows, tf) sorted by term, and tokens per row
+#     lex_vocab.json term id -> term
+#     filter_*.npy   keyword postings (key ids, rows) sorted by key, and numeric columns (fields x rows)
+#     filter_keys.json  key id -> "field=value", plus the numeric column names
+#     dead-<n>.npy   rows of the segment deleted or replaced as of generation n; a later
+#                    generation that deletes more writes a new list instead of changing it
+#   docs.bin       compact JSON docs, append-only; only committed spans are ever read.
+#                  A compaction starts a new docs-<n>.bin instead of rewriting it.
+# A commit writes the rows it adds or replaces as one new segment and records the
+# rows it deletes in dead lists, so its cost follows the size of the change rather
+# than of the store. While the segment before the new one holds fewer than
+# STORE_MERGE_FACTOR times its live rows, the commit merges the two (rows keep their
+# numbers), which keeps a store at O(log n) segments. A compaction (see ingestion)
+# rewrites the live rows as a single segment.
+# Format 2 stores (every array rewritten into gen-<n>/ by each commit) read as one
+# segment, and so do stores written before generations, whose artifacts sit at the
+# root and count as generation 0.
+FORMAT_VERSION = 3
+LEGACY_FILES = ("index.faiss", "id_map.json", "docs.json", "embeddings.npy", "hashes.json")
+_ARTIFACTS = ("index.faiss", "vectors.npy", "ids.npy", "hashes.npy", "spans.npy")
+_LEX_ARRAYS = ("lex_terms.npy", "lex_rows.npy", "lex_tf.npy", "lex_len.npy")
+_FILTER_ARRAYS = ("filter_terms.npy", "filter_rows.npy", "filter_numeric.npy")
+_GEN = re.compile(r"^gen-(\d+)(\.json)?$")
+_SEG_DIR = re.compile(r"^seg-\d+$")
+
+
+def tenant_dir(tenant_id: str) -> str:
+    return os.path.join(VEC_DIR, tenant_id)
+
+
+def _path(tenant_id: str, name: str) -> str:
+    return os.path.join(tenant_dir(tenant_id), name)
+
+
+def _seg_path(tenant_id: str, name: str) -> str:
+    return _path(tenant_id, name) if name else tenant_dir(tenant_id)
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_generation(tenant_id: str, generation: int) -> Dict[str, Any]:
+    path = _path(tenant_id, f"gen-{generation:06d}.json")
+    if not os.path.exists(path):
+        path = _path(tenant_id, os.path.join(f"gen-{generation:06d}", "manifest.json"))    # format 2
+    return _read_manifest(path)
+
+
+def _segments_of(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A manifest's segment entries; a format 2 generation is a single segment."""
+    if manifest.get("format") == FORMAT_VERSION:
+        return manifest["segments"]
+    if manifest.get("format") == 2:
+        generation = int(manifest.get("generation", 0))
+        return [{
+            "dir": f"gen-{generation:06d}" if generation else "",
+            "start": 0,
+            "rows": int(manifest.get("rows", 0)),
+            "live": int(manifest.get("live", manifest.get("rows", 0))),
+            "index": manifest.get("index", ann.FLAT),
+            "lexical": bool(manifest.get("lexical")),
+            "filters": bool(manifest.get("filters")),
+            "dead": None,
+        }]
+    raise ValueError(f"Unsupported store format {manifest.get('format')}.")
+
+
+def _segment_key(entry: Dict[str, Any]) -> str:
+    # format 2 entries have no id; their directory names were never reused
+    return entry.get("id") or entry["dir"]
+
+
+def exists(tenant_id: str) -> bool:
+    return os.path.exists(_path(tenant_id, "manifest.json")) or os.path.exists(_path(tenant_id, "id_map.json"))
+
+
+class Segment:
+    """Rows [start, start + rows) of a store as one commit wrote them; never modified.
+
+    Generations share Segment objects: what differs between them is only which
+    of its rows are deleted (TenantStore.deleted).
+    """
+
+    def __init__(self, name: Optional[str], start: int, spec: str, index, ids: np.ndarray,
+                 hashes: np.ndarray, spans: np.ndarray, vectors: np.ndarray,
+                 lex: Optional[lexical.Index] = None, fidx: Optional[filters.Index] = None):
+        self.name = name
+        self.start = start
+        self.spec = spec
+        self.index = index
+        self.ids = ids
+        self.hashes = hashes
+        self.spans = spans
+        self.vectors = vectors
+        self.lexical = lex              # None for segments written before the BM25 index existed
+        self.filters = fidx             # None for segments written before the filter index existed
+        self.holes = ids == ""          # rows already dead when the segment was written
+        self._id_rows: Optional[Dict[str, int]] = None
+        self._hash_rows: Optional[Dict[str, int]] = None
+        ntotal = int(index.ntotal) if index is not None else 0
+        self.nbytes = ntotal * ann.bytes_per_vector(spec, int(vectors.shape[1])) + ids.nbytes + hashes.nbytes + spans.nbytes
+
+    @property
+    def rows(self) -> int:
+        return int(self.ids.shape[0])
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        """Row (within the segment) of a doc id; the map is built on first use, queries don't need it."""
+        if self._id_rows is None:
+            self._id_rows = {d: row for row, d in enumerate(self.ids.tolist()) if d}
+        return self._id_rows.get(doc_id)
+
+    def row_with_hash(self, text_hash: str) -> Optional[int]:
+        if self._hash_rows is None:
+            self._hash_rows = {h.decode("ascii"): row for row, h in enumerate(self.hashes.tolist())
+                               if h and not self.holes[row]}
+        return self._hash_rows.get(text_hash)
+
+
+class TenantStore:
+    """Read-only, resident snapshot of one tenant's vector store: a generation's segments.
+
+    Only the indexes and the row tables live in memory; vectors and document
+    bodies stay memory-mapped and a doc is decoded only when it is a hit.
+    """
+
+    def __init__(self, tenant_id: str, manifest: Dict[str, Any], segments: List[Segment],
+                 deleted: List[Optional[np.ndarray]], blob):
+        self.tenant_id = tenant_id
+        self.generation = int(manifest.get("generation", 0))
+        self.dim = int(manifest["dim"])
+        self.model = manifest.get("model")
+        self.blob_size = int(manifest.get("blob_size", 0))
+        self.entries = _segments_of(manifest)
+        self.segments = segments
+        self.deleted = deleted          # per segment: bitmap of its rows deleted since it was written, or None
+        self._starts = [seg.start for seg in segments]
+        self.rows = segments[-1].start + segments[-1].rows if segments else 0
+        self.live = int(manifest.get("live", self.rows))
+        # blob bytes no live row points at (replaced and deleted bodies); derived for older manifests
+        self.dead_bytes = int(manifest.get("dead_bytes", self.blob_size - sum(int(seg.spans[:, 1].sum()) for seg in segments)))
+        self._blob = blob
+        self._selectors: List[Any] = [None] * len(segments)
+        self._filters: List[Optional[filters.Index]] = [seg.filters for seg in segments]
+        self.lexical: Optional[lexical.Segments] = None
+        if all(seg.lexical is not None for seg in segments):
+            self.lexical = lexical.Segments([(seg.start, seg.lexical, dead) for seg, dead in zip(segments, deleted)], self.live)
+        self.nbytes = sum(seg.nbytes for seg in segments)
+        self.stamp: Optional[Tuple[int, int, int]] = None      # manifest.json this snapshot was read from
+
+    @property
+    def dead(self) -> int:
+        """Rows deleted or replaced since the last compaction."""
+        return self.rows - self.live
+
+    def _locate(self, row: int) -> Tuple[int, int]:
+        i = bisect_right(self._starts, row) - 1
+        return i, row - self._starts[i]
+
+    def _is_live(self, i: int, row: int) -> bool:
+        return not self.segments[i].holes[row] and (self.deleted[i] is None or not self.deleted[i][row])
+
+    def live_mask(self, i: int) -> np.ndarray:
+        """Bitmap of segment i's live rows."""
+        m = ~self.segments[i].holes
+        if self.deleted[i] is not None:
+            m &= ~self.deleted[i]
+        return m
+
+    def live_rows(self) -> np.ndarray:
+        rows = [seg.start + np.flatnonzero(self.live_mask(i)) for i, seg in enumerate(self.segments)]
+        return np.concatenate(rows) if rows else np.zeros(0, dtype="int64")
+
+    def doc_id(self, row: int) -> Optional[str]:
+        """The doc id of a live row, else None."""
+        if row < 0 or row >= self.rows:
+            return None
+        i, r = self._locate(row)
+        return str(self.segments[i].ids[r]) if self._is_live(i, r) else None
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        """The row of a live doc, or None."""
+        for i in range(len(self.segments) - 1, -1, -1):
+            r = self.segments[i].row_of(doc_id)
+            if r is not None:
+                # newer rows of an id come first, so a deleted one means the doc is gone
+                return self.segments[i].start + r if self._is_live(i, r) else None
+        return None
+
+    def hash_of(self, doc_id: str) -> Optional[str]:
+        row = self.row_of(doc_id)
+        if row is None:
+            return None
+        i, r = self._locate(row)
+        return self.segments[i].hashes[r].decode("ascii")
+
+    def row_with_hash(self, text_hash: str) -> Optional[int]:
+        """A live row whose embedded text has this hash, or None."""
+        for i in range(len(self.segments) - 1, -1, -1):
+            r = self.segments[i].row_with_hash(text_hash)
+            if r is not None and self._is_live(i, r):
+                return self.segments[i].start + r
+        return None
+
+    def vector(self, row: int) -> np.ndarray:
+        i, r = self._locate(row)
+        return np.asarray(self.segments[i].vectors[r], dtype="float32")
+
+    def vectors_of(self, rows: np.ndarray) -> np.ndarray:
+        """Stored vectors of the given rows, rows x dim."""
+        rows = np.asarray(rows, dtype="int64")
+        out = np.empty((len(rows), self.dim), dtype="float32")
+        seg = np.searchsorted(self._starts, rows, side="right") - 1
+        for i in np.unique(seg).tolist():
+            pick = seg == i
+            out[pick] = self.segments[i].vectors[rows[pick] - self._starts[i]]
+        return out
+
+    def doc_bytes(self, row: int) -> bytes:
+        i, r = self._locate(row)
+        off, length = (int(x) for x in self.segments[i].spans[r])
+        return self._blob[off:off + length]
+
+    def doc(self, row: int) -> Dict[str, Any]:
+        return json.loads(self.doc_bytes(row))
+
+    def docs(self) -> Iterator[Dict[str, Any]]:
+        for row in self.live_rows().tolist():
+            yield self.doc(row)
+
+    def _filter_index(self, i: int) -> filters.Index:
+        fidx = self._filters[i]
+        if fidx is None:
+            # older segments get the index in memory here, and on disk with the next compaction
+            seg, b = self.segments[i], filters.Builder()
+            for r in np.flatnonzero(self.live_mask(i)).tolist():
+                b.set(r, self.doc(seg.start + r))
+            fidx = self._filters[i] = b.index(seg.rows)
+        return fidx
+
+    def filter_mask(self, conditions: List[filters.Condition]) -> np.ndarray:
+        """Row bitmap of the live docs meeting every condition (see filters.parse)."""
+        masks = [self._filter_index(i).mask(conditions) & self.live_mask(i) for i in range(len(self.segments))]
+        return np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+
+    def _selector(self, i: int):
+        """faiss selector skipping segment i's deleted rows, or None when it has none."""
+        if self.deleted[i] is None:
+            return None
+        if self._selectors[i] is None:
+            dead = (self.segments[i].start + np.flatnonzero(self.deleted[i])).astype("int64")
+            batch = faiss.IDSelectorBatch(len(dead), faiss.swig_ptr(dead))
+            self._selectors[i] = (faiss.IDSelectorNot(batch), batch)   # the Not only points at the batch
+        return self._selectors[i][0]
+
+    def search(self, qvs: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Dense top-k (scores, rows) of each query row across the segments.
+
+        `allowed` is an optional bitmap of live rows (see filter_mask) hits must be in.
+        """
+        bits = sel = None
+        if allowed is not None:
+            bits = np.packbits(allowed, bitorder="little")
+            sel = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+        found = []
+        for i, seg in enumerate(self.segments):
+            if not seg.index.ntotal:
+                continue
+            seg_sel = sel if sel is not None else self._selector(i)
+            if seg_sel is None:
+                found.append(seg.index.search(qvs, k))
+            else:
+                found.append(seg.index.search(qvs, k, params=ann.search_params(seg.spec, seg_sel)))
+        if len(found) == 1:
+            return found[0]
+        if not found:
+            return np.full((len(qvs), k), -np.inf, dtype="float32"), np.full((len(qvs), k), -1, dtype="int64")
+        scores = np.hstack([s for s, _ in found])
+        rows = np.hstack([r for _, r in found])
+        scores[rows < 0] = -np.inf
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(rows, top, axis=1)
+
+
+def _map_blob(path: str, size: int):
+    if size == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+
+def _load_segment(tenant_id: str, entry: Dict[str, Any]) -> Segment:
+    d = _seg_path(tenant_id, entry["dir"])
+    spec = entry.get("index", ann.FLAT)
+    index = faiss.read_index(os.path.join(d, "index.faiss"))
+    ann.tune(index, spec)
+    ids = np.load(os.path.join(d, "ids.npy"))
+    hashes = np.load(os.path.join(d, "hashes.npy"))
+    spans = np.load(os.path.join(d, "spans.npy"))
+    vectors = np.load(os.path.join(d, "vectors.npy"), mmap_mode="r")
+    lex = None
+    if entry.get("lexical"):
+        with open(os.path.join(d, "lex_vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        terms, rows, tf, row_len = (np.load(os.path.join(d, n), mmap_mode="r") for n in _LEX_ARRAYS)
+        lex = lexical.Index(vocab, terms, rows, tf, row_len)
+    fidx = None
+    if entry.get("filters"):
+        with open(os.path.join(d, "filter_keys.json"), "r", encoding="utf-8") as f:
+            names = json.load(f)
+        terms, rows, numeric = (np.load(os.path.join(d, n), mmap_mode="r") for n in _FILTER_ARRAYS)
+        fidx = filters.Index(names["keys"], terms, rows, names["numeric"], numeric, int(ids.shape[0]))
+    return Segment(entry["dir"], int(entry["start"]), spec, index, ids, hashes, spans, vectors, lex, fidx)
+
+
+def _open(tenant_id: str, manifest: Dict[str, Any], reuse: Optional[TenantStore] = None) -> TenantStore:
+    """Snapshot of a manifest's generation; segments `reuse` already holds aren't read again."""
+    known = {}
+    if reuse is not None:
+        known = {_segment_key(e): (seg, e.get("dead"), dead) for e, seg, dead in zip(reuse.entries, reuse.segments, reuse.deleted)}
+    segments, deleted = [], []
+    for entry in _segments_of(manifest):
+        seg, dead_name, dead = known.get(_segment_key(entry), (None, None, None))
+        if seg is None:
+            seg = _load_segment(tenant_id, entry)
+        if not entry.get("dead"):
+            dead = None
+        elif entry["dead"] != dead_name:
+            dead = np.zeros(seg.rows, dtype=bool)
+            dead[np.load(os.path.join(_seg_path(tenant_id, entry["dir"]), entry["dead"]))] = True
+        segments.append(seg)
+        deleted.append(dead)
+    blob = _map_blob(_path(tenant_id, manifest.get("blob", "docs.bin")), int(manifest.get("blob_size", 0)))
+    return TenantStore(tenant_id, manifest, segments, deleted, blob)
+
+
+def _stamp(tenant_id: str) -> Optional[Tuple[int, int, int]]:
+    """Identity of the tenant's current manifest.json (None without one); each commit replaces the file."""
+    try:
+        st = os.stat(_path(tenant_id, "manifest.json"))
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def load(tenant_id: str, reuse: Optional[TenantStore] = None) -> TenantStore:
+    """Read a tenant's current generation from disk (bypasses the registry)."""
+    manifest_path = _path(tenant_id, "manifest.json")
+    if not os.path.exists(manifest_path):
+        if not os.path.exists(_path(tenant_id, "id_map.json")):
+            raise FileNotFoundError(f"No vector store found for tenant '{tenant_id}'. Please ingest first.")
+        with writer(tenant_id):
+            if not os.path.exists(manifest_path):
+                migrate(tenant_id)
+
+    while True:
+        # stamp before reading: a commit in between makes the next get() read it again, never miss it
+        stamp = _stamp(tenant_id)
+        manifest = _read_manifest(manifest_path)
+        try:
+            store = _open(tenant_id, manifest, reuse)
+            store.stamp = stamp
+            return store
+        except (OSError, RuntimeError):
+            # two commits landed while we read and the generation we picked was
+            # collected: read the new manifest and try again
+            if _read_manifest(manifest_path).get("generation", 0) == manifest.get("generation", 0):
+                raise
+
+
+# -------- Writing --------
+class Draft:
+    """A writer's pending changes to a tenant store: rows to append and rows to delete.
+
+    Nothing of the base store is copied. commit() writes the appended rows as a
+    new segment and the deletions as dead lists; readers keep searching the
+    base store until it has written and loaded the new snapshot.
+    """
+
+    def __init__(self, tenant_id: str, dim: int, model: Optional[str], base: Optional[TenantStore] = None):
+        self.tenant_id = tenant_id
+        self.model = model
+        self._base = base
+        self.dim = base.dim if base is not None else dim
+        self.start = base.rows if base is not None else 0          # row number of the first appended row
+        self._base_end = base.blob_size if base is not None else 0
+        self._tail = bytearray()            # doc bodies to append after _base_end (a new blob when 0)
+        self.dead_bytes = base.dead_bytes if base is not None else 0
+        self.live = base.live if base is not None else 0
+        self._deleted: set = set()          # base rows this draft deletes
+        # the appended rows, indexed by row - start; the arrays have spare capacity past len(ids)
+        self.ids: List[str] = []
+        self.hashes: List[str] = []
+        self._spans = np.zeros((0, 2), dtype="int64")
+        self._vectors = np.zeros((0, self.dim), dtype="float32")
+        self._id_rows: Dict[str, int] = {}
+        self._hash_rows: Dict[str, int] = {}
+        # None while some live row has no postings (the base predates the BM25 index)
+        self.lex: Optional[lexical.Builder] = None
+        if base is None or base.lexical is not None:
+            self.lex = lexical.Builder()
+        self._lex_base: Optional[lexical.Index] = None
+        self.filters = filters.Builder()
+        # rewrite every live row as one segment at commit; also how indexes get
+        # persisted for segments written before they existed
+        self.compacting = base is not None and any(seg.filters is None for seg in base.segments)
+
+    @property
+    def rows(self) -> int:
+        return self.start + len(self.ids)
+
+    @property
+    def base(self) -> Optional[TenantStore]:
+        return self._base
+
+    @property
+    def blob_size(self) -> int:
+        return self._base_end + len(self._tail)
+
+    def _blob_bytes(self, off: int, length: int) -> bytes:
+        if off < self._base_end:
+            return self._base._blob[off:off + length]
+        start = off - self._base_end
+        return bytes(self._tail[start:start + length])
+
+    def _span(self, row: int) -> Tuple[int, int]:
+        if row >= self.start:
+            off, length = self._spans[row - self.start]
+        else:
+            i, r = self._base._locate(row)
+            off, length = self._base.segments[i].spans[r]
+        return int(off), int(length)
+
+    def _append_doc(self, body: bytes):
+        span = (self._base_end + len(self._tail), len(body))
+        self._tail += body
+        return span
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        row = self._id_rows.get(doc_id)
+        if row is None and self._base is not None:
+            row = self._base.row_of(doc_id)
+            if row in self._deleted:
+                return None
+        return row
+
+    def hash_of(self, doc_id: str) -> Optional[str]:
+        row = self.row_of(doc_id)
+        if row is None:
+            return None
+        return self.hashes[row - self.start] if row >= self.start else self._base.hash_of(doc_id)
+
+    def row_with_hash(self, text_hash: str) -> Optional[int]:
+        """A live row whose embedded text has this hash, or None."""
+        row = self._hash_rows.get(text_hash)
+        if row is not None and self.hashes[row - self.start] == text_hash:
+            return row
+        if self._base is not None:
+            row = self._base.row_with_hash(text_hash)
+            if row is not None and row not in self._deleted:
+                return row
+        return None
+
+    def vector(self, row: int) -> np.ndarray:
+        return self._vectors[row - self.start] if row >= self.start else self._base.vector(row)
+
+    def _reserve(self, extra: int) -> None:
+        """Make room for `extra` more appended rows, doubling the capacity so a
+        draft fed batch after batch copies each row O(1) times."""
+        n, need = len(self.ids), len(self.ids) + extra
+        if need <= len(self._vectors):
+            return
+        cap = max(need, 2 * len(self._vectors), 64)
+        vectors = np.zeros((cap, self.dim), dtype="float32")
+        vectors[:n] = self._vectors[:n]
+        spans = np.zeros((cap, 2), dtype="int64")
+        spans[:n] = self._spans[:n]
+        self._vectors, self._spans = vectors, spans
+
+    def put_many(self, docs: List[Dict[str, Any]], text_hashes: List[str], vectors: np.ndarray,
+                 keep_vector: List[bool], texts: Optional[List[str]] = None) -> None:
+        """Insert or replace docs. Docs flagged in keep_vector keep their stored vector.
+
+        A replaced base row is deleted and the doc appended as a new row; rows
+        this draft appended are updated in place. `texts` are the embedded texts,
+        for the BM25 postings; without them the draft is committed without a
+        lexical index.
+        """
+        if texts is None:
+            self.lex = None
+        changed = []
+        for i, d in enumerate(docs):
+            body = json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            row = self.row_of(d["id"])
+            if row is not None and keep_vector[i]:
+                off, length = self._span(row)
+                if length == len(body) and self._blob_bytes(off, length) == body:
+                    continue                # unchanged doc: keep its row, body and index entries
+            changed.append((i, row, body))
+
+        fresh = [(i, row) for i, row, _ in changed if row is None or row < self.start]
+        first = len(self.ids)
+        self._reserve(len(fresh))
+        for j, (i, row) in enumerate(fresh, start=first):
+            self._vectors[j] = self._base.vector(row) if keep_vector[i] else vectors[i]
+            if row is not None:
+                self._delete(row)
+            self.ids.append(docs[i]["id"])
+            self.hashes.append("")
+            self._id_rows[docs[i]["id"]] = self.start + j
+            self.live += 1
+            if self.lex is not None:
+                self.lex.set(j, texts[i])
+
+        for i, row, body in changed:
+            j = self._id_rows[docs[i]["id"]] - self.start
+            if row is not None and row >= self.start:
+                # a row this draft appended: update it in place
+                self.dead_bytes += int(self._spans[j, 1])
+                if not keep_vector[i]:
+                    self._vectors[j] = vectors[i]
+                    if self.lex is not None:
+                        self.lex.set(j, texts[i])
+            self._spans[j] = self._append_doc(body)
+            self.hashes[j] = text_hashes[i]
+            self._hash_rows[text_hashes[i]] = self.start + j
+            # metadata isn't part of the embedded text, so re-index even kept vectors
+            self.filters.set(j, docs[i])
+
+    def index_text(self, rows: List[int], texts: List[str]) -> None:
+        """Give the base's live rows BM25 postings (the base predates them); call before put_many.
+
+        The draft then commits as a compaction, which writes them to disk.
+        """
+        b = lexical.Builder()
+        for row, text in zip(rows, texts):
+            b.set(row, text)
+        self._lex_base = b.index(self.start)
+        self.lex = lexical.Builder()
+        self.compacting = True
+
+    def _delete(self, row: int) -> None:
+        self.dead_bytes += self._span(row)[1]
+        self.live -= 1
+        if row < self.start:
+            self._deleted.add(row)
+            return
+        j = row - self.start
+        self._id_rows.pop(self.ids[j], None)
+        self.ids[j] = ""                    # a hole in the new segment
+        self.hashes[j] = ""
+        self._spans[j] = 0
+        self._vectors[j] = 0.0
+        if self.lex is not None:
+            self.lex.drop(j)
+        self.filters.drop(j)
+
+    def remove(self, doc_ids: List[str]) -> int:
+        rows = [row for row in (self.row_of(i) for i in dict.fromkeys(doc_ids)) if row is not None]
+        for row in rows:
+            self._delete(row)
+        return len(rows)
+
+    def compact(self) -> None:
+        """Commit every live row as one segment with dense row numbers and a fresh blob."""
+        self.compacting = True
+
+    def _appended(self) -> Segment:
+        """The appended rows as an (unwritten) segment."""
+        n = len(self.ids)
+        ids = np.array(self.ids, dtype=str) if n else np.zeros(0, dtype="<U1")
+        return Segment(None, self.start, ann.FLAT, None, ids, np.array(self.hashes, dtype="S40"),
+                       self._spans[:n], self._vectors[:n], self.lex.index(n) if self.lex is not None else None,
+                       self.filters.index(n))
+
+
+def _replace(path: str, write) -> None:
+    """Write to a temp file and rename over `path`, so mapped readers keep the old inode."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _save_npy(path: str, arr: np.ndarray) -> None:
+    _replace(path, lambda f: np.save(f, arr))
+
+
+def _write_segment(tenant_id: str, name: str, start: int, dim: int,
+                   sources: List[Tuple[Segment, np.ndarray, filters.Index]], blob_bytes,
+                   dense: bool = False, lex_base: Optional[lexical.Index] = None):
+    """Write the kept rows of `sources` (segment, keep bitmap, filter index) as one segment.
+
+    Rows keep their numbers, leaving holes where rows were dropped, unless
+    `dense`: then the kept rows are renumbered from `start` and their bodies
+    copied into a new blob. `lex_base` stands in for the postings of every
+    source but the last. Returns (segment, manifest entry, new blob or None).
+    """
+    maps, n = [], 0
+    for seg, keep, _ in sources:
+        row_map = np.full(seg.rows, -1, dtype="int64")
+        if dense:
+            row_map[keep] = n + np.arange(int(keep.sum()))
+            n += int(keep.sum())
+        else:
+            row_map[keep] = n + np.flatnonzero(keep)
+            n += seg.rows
+        maps.append(row_map)
+
+    if dense:
+        ids = np.concatenate([seg.ids[keep] for seg, keep, _ in sources])
+        hashes = np.concatenate([seg.hashes[keep] for seg, keep, _ in sources])
+        vectors = np.concatenate([np.asarray(seg.vectors, dtype="float32")[keep] for seg, keep, _ in sources])
+        blob, spans = bytearray(), np.zeros((n, 2), dtype="int64")
+        row = 0
+        for seg, keep, _ in sources:
+            for off, length in seg.spans[keep].tolist():
+                spans[row] = (len(blob), length)
+                blob += blob_bytes(off, length)
+                row += 1
+    else:
+        ids = np.concatenate([np.where(keep, seg.ids, "") for seg, keep, _ in sources])
+        hashes = np.concatenate([np.where(keep, seg.hashes, b"") for seg, keep, _ in sources])
+        vectors = np.concatenate([np.where(keep[:, None], seg.vectors, 0.0) for seg, keep, _ in sources])
+        spans = np.concatenate([np.where(keep[:, None], seg.spans, 0) for seg, keep, _ in sources])
+        blob = None
+
+    if lex_base is not None:
+        parts = [(lex_base, np.concatenate(maps[:-1]) if len(maps) > 1 else np.zeros(0, dtype="int64")),
+                 (sources[-1][0].lexical, maps[-1])]
+    else:
+        parts = [(seg.lexical, row_map) for (seg, _, _), row_map in zip(sources, maps)]
+    lex = lexical.merge(parts, n) if all(ix is not None for ix, _ in parts) else None
+    fidx = filters.merge([(f, row_map) for (_, _, f), row_map in zip(sources, maps)], n)
+
+    live = np.flatnonzero(ids != "")
+    spec = ann.spec_for(len(live), dim)
+    index = ann.build(spec, dim, vectors[live], start + live)
+
+    d = _seg_path(tenant_id, name)
+    shutil.rmtree(d, ignore_errors=True)            # leftovers of an interrupted commit
+    os.makedirs(d)
+    _save_npy(os.path.join(d, "ids.npy"), ids if len(ids) else np.zeros(0, dtype="<U1"))
+    _save_npy(os.path.join(d, "hashes.npy"), hashes.astype("S40"))
+    _save_npy(os.path.join(d, "spans.npy"), spans.astype("int64"))
+    _save_npy(os.path.join(d, "vectors.npy"), vectors.astype("float32"))
+    index_path = os.path.join(d, "index.faiss")
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    if lex is not None:
+        for arr_name, arr in zip(_LEX_ARRAYS, (lex.terms, lex.rows, lex.tf, lex.row_len)):
+            _save_npy(os.path.join(d, arr_name), arr)
+        vocab = json.dumps(lex.vocab, ensure_ascii=False).encode("utf-8")
+        _replace(os.path.join(d, "lex_vocab.json"), lambda f: f.write(vocab))
+    for arr_name, arr in zip(_FILTER_ARRAYS, (fidx.terms, fidx.rows, fidx.numeric)):
+        _save_npy(os.path.join(d, arr_name), arr)
+    names = json.dumps({"keys": fidx.keys, "numeric": fidx.numeric_fields}, ensure_ascii=False).encode("utf-8")
+    _replace(os.path.join(d, "filter_keys.json"), lambda f: f.write(names))
+
+    seg = Segment(name, start, spec, index, ids, hashes.astype("S40"), spans,
+                  np.load(os.path.join(d, "vectors.npy"), mmap_mode="r"), lex, fidx)
+    entry = {"dir": name, "id": uuid.uuid4().hex, "start": start, "rows": n, "live": len(live), "index": spec,
+             "lexical": lex is not None, "filters": True, "dead": None}
+    return seg, entry, blob
+
+
+def commit(draft: Draft) -> TenantStore:
+    """Persist a draft as the tenant's next generation and return its snapshot.
+
+    Only the draft's own rows are written, as a new segment (merged with the
+    newest segments when those aren't much larger), plus dead lists for the
+    segments it deleted rows from; a compacting draft rewrites every live row.
+    Call with writer(tenant_id) held. Nothing a reader can see changes until
+    the root manifest is replaced, so readers keep the previous generation
+    until the new one is complete.
+    """
+    tenant_id = draft.tenant_id
+    os.makedirs(tenant_dir(tenant_id), exist_ok=True)
+    manifest_path = _path(tenant_id, "manifest.json")
+    prev = _read_manifest(manifest_path) if os.path.exists(manifest_path) else None
+    generation = int(prev.get("generation", 0)) + 1 if prev else 1
+    base = draft._base
+    segments = list(base.segments) if base is not None else []
+    entries = [dict(e) for e in base.entries] if base is not None else []
+    deleted = list(base.deleted) if base is not None else []
+
+    touched = set()
+    if draft._deleted:
+        rows = np.array(sorted(draft._deleted), dtype="int64")
+        seg_of = np.searchsorted(base._starts, rows, side="right") - 1
+        for i in np.unique(seg_of).tolist():
+            local = rows[seg_of == i] - segments[i].start
+            dead = deleted[i].copy() if deleted[i] is not None else np.zeros(segments[i].rows, dtype=bool)
+            dead[local] = True
+            deleted[i] = dead
+            entries[i]["live"] -= len(local)
+            touched.add(i)
+
+    def keep(i: int) -> np.ndarray:
+        return ~segments[i].holes & ~deleted[i] if deleted[i] is not None else ~segments[i].holes
+
+    appended = draft._appended()
+    new_live = int((~appended.holes).sum())
+    name = f"seg-{generation:06d}"
+    blob = None
+    if draft.compacting:
+        sources = [(seg, keep(i), base._filter_index(i)) for i, seg in enumerate(segments)]
+        sources.append((appended, ~appended.holes, appended.filters))
+        seg, entry, blob = _write_segment(tenant_id, name, 0, draft.dim, sources, draft._blob_bytes,
+                                          dense=True, lex_base=draft._lex_base)
+        segments, entries, deleted = ([seg], [entry], [None]) if entry["rows"] else ([], [], [])
+        touched = set()
+    else:
+        # merge the newest segments into the new one while they hold less than
+        # STORE_MERGE_FACTOR times what is merged so far
+        first, pending = len(segments), new_live
+        while first > 0 and pending and entries[first - 1]["live"] < STORE_MERGE_FACTOR * pending:
+            first -= 1
+            pending += entries[first]["live"]
+        if pending:
+            sources = [(segments[i], keep(i), base._filter_index(i)) for i in range(first, len(segments))]
+            sources.append((appended, ~appended.holes, appended.filters))
+            start = segments[first].start if first < len(segments) else draft.start
+            seg, entry, _ = _write_segment(tenant_id, name, start, draft.dim, sources, draft._blob_bytes)
+            segments, entries, deleted = segments[:first] + [seg], entries[:first] + [entry], deleted[:first] + [None]
+            touched = {i for i in touched if i < first}
+    for i in sorted(touched):
+        entries[i]["dead"] = f"dead-{generation:06d}.npy"
+        _save_npy(os.path.join(_seg_path(tenant_id, entries[i]["dir"]), entries[i]["dead"]),
+                  np.flatnonzero(deleted[i]).astype("int32"))
+
+    dead_bytes = draft.dead_bytes
+    if blob is not None or draft._base_end == 0:
+        # a fresh blob (new store or compaction); one that published generations map is never rewritten
+        data = blob if blob is not None else draft._tail
+        blob_name = f"docs-{generation:06d}.bin" if prev else "docs.bin"
+        _replace(_path(tenant_id, blob_name), lambda f: f.write(data))
+        blob_size = len(data)
+        if blob is not None:
+            dead_bytes = 0
+    else:
+        blob_name, blob_size = prev.get("blob", "docs.bin"), draft.blob_size
+        if draft._tail:
+            with open(_path(tenant_id, blob_name), "r+b") as f:
+                # drop bytes an interrupted writer appended past the committed size
+                f.truncate(draft._base_end)
+                f.seek(draft._base_end)
+                f.write(draft._tail)
+                f.flush()
+                os.fsync(f.fileno())
+
+    # the root manifest goes last: replacing it is what publishes the generation
+    manifest = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "dim": draft.dim,
+        "rows": segments[-1].start + segments[-1].rows if segments else 0,
+        "live": sum(e["live"] for e in entries),
+        "model": draft.model,
+        "blob": blob_name,
+        "blob_size": blob_size,
+        "dead_bytes": dead_bytes,
+        "segments": entries,
+    }
+    body = json.dumps(manifest, indent=2).encode("utf-8")
+    _replace(_path(tenant_id, f"gen-{generation:06d}.json"), lambda f: f.write(body))
+    _replace(manifest_path, lambda f: f.write(body))
+    _collect_generations(tenant_id, generation)
+    store = TenantStore(tenant_id, manifest, segments, deleted, _map_blob(_path(tenant_id, blob_name), blob_size))
+    store.stamp = _stamp(tenant_id)
+    return store
+
+
+def _collect_generations(tenant_id: str, current: int) -> None:
+    """Delete manifests older than the last STORE_KEEP_GENERATIONS, and the segments,
+    dead lists and blobs none of the kept generations use.
+
+    Readers that already opened an old generation keep their mappings. Files
+    that can't be removed yet (mapped on Windows) are retried on the next commit.
+    """
+    oldest = current - max(1, STORE_KEEP_GENERATIONS) + 1
+    dirs, dead, blobs = set(), set(), set()
+    if oldest <= 0:
+        dirs.add("")
+        blobs.add("docs.bin")
+    for g in range(max(1, oldest), current + 1):
+        try:
+            manifest = _read_generation(tenant_id, g)
+        except (OSError, ValueError):
+            return                      # don't guess what an unreadable generation still uses
+        blobs.add(manifest.get("blob", "docs.bin"))
+        for e in _segments_of(manifest):
+            dirs.add(e["dir"])
+            if e.get("dead"):
+                dead.add(os.path.join(e["dir"], e["dead"]))
+    root = tenant_dir(tenant_id)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        m = _GEN.match(name)
+        try:
+            if m and m.group(2):
+                if int(m.group(1)) < oldest:
+                    os.remove(path)                     # gen-<n>.json
+            elif (m or _SEG_DIR.match(name)) and os.path.isdir(path):
+                if name not in dirs:
+                    shutil.rmtree(path)
+                else:
+                    for f in os.listdir(path):
+                        if f.startswith("dead-") and os.path.join(name, f) not in dead:
+                            os.remove(os.path.join(path, f))
+            elif name.startswith("dead-") and "" in dirs and name not in dead:
+                os.remove(path)                         # generation 0's dead lists
+            elif name.startswith("docs") and name.endswith(".bin") and name not in blobs:
+                os.remove(path)
+            elif "" not in dirs and name in _ARTIFACTS:
+                os.remove(path)                         # generation 0, from before generations
+        except OSError:
+            pass
+
+
+# -------- Migration from the JSON layout --------
+def migrate(tenant_id: str) -> None:
+    """Convert index.faiss + id_map.json + docs.json (+ embeddings.npy/hashes.json) to the current format."""
+    index_path, idmap_path, docs_path, emb_path, hashes_path = (_path(tenant_id, n) for n in LEGACY_FILES)
+    with open(idmap_path, "r", encoding="utf-8") as f:
+        id_map: Dict[str, int] = json.load(f)
+    with open(docs_path, "r", encoding="utf-8") as f:
+        docs_store = json.load(f)
+    if isinstance(docs_store, list):     # written by the old /delete route
+        docs_store = {d["id"]: d for d in docs_store}
+    model, hashes = None, {}
+    if os.path.exists(hashes_path):
+        with open(hashes_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        model, hashes = data.get("model"), data.get("hashes", {})
+
+    index = faiss.read_index(index_path)
+    if os.path.exists(emb_path):
+        vecs = np.load(emb_path)
+    else:
+        vecs = np.zeros((max(id_map.values(), default=-1) + 1, index.d), dtype="float32")
+        if isinstance(index, faiss.IndexIDMap2):
+            inner = faiss.downcast_index(index.index)
+            vecs[faiss.vector_to_array(index.id_map)] = inner.reconstruct_n(0, inner.ntotal)
+        elif index.ntotal:
+            vecs[:index.ntotal] = index.reconstruct_n(0, index.ntotal)
+
+    docs = [docs_store[doc_id] for doc_id in id_map if doc_id in docs_store]
+    rows = np.array([id_map[d["id"]] for d in docs], dtype="int64")
+    draft = Draft(tenant_id, index.d, model)
+    draft.put_many(docs, [hashes.get(d["id"], "") for d in docs],
+                   vecs[rows] if len(rows) else np.zeros((0, index.d), dtype="float32"), [False] * len(docs))
+    commit(draft)
+
+    # the JSON-layout files are now redundant
+    for p in (index_path, idmap_path, docs_path, emb_path, hashes_path):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def migrate_all() -> List[str]:
+    """Migrate every JSON-layout tenant under VEC_DIR. Returns the migrated tenant ids."""
+    done = []
+    if not os.path.isdir(VEC_DIR):
+        return done
+    for tenant_id in sorted(os.listdir(VEC_DIR)):
+        if os.path.exists(_path(tenant_id, "id_map.json")) and not os.path.exists(_path(tenant_id, "manifest.json")):
+            migrate(tenant_id)
+            done.append(tenant_id)
+    return done
+
+
+# -------- Resident registry --------
+# LRU of tenant_id -> TenantStore. Stores are never mutated once registered;
+# writers build a new TenantStore and publish() it, so readers holding the
+# previous one keep a consistent view.
+# The registry is per process. Several worker processes may serve one VEC_DIR:
+# writers also take a file lock, and get() notices commits made by other
+# processes by the manifest.json they replace.
+_stores: "OrderedDict[str, TenantStore]" = OrderedDict()
+_versions: Dict[str, int] = {}
+_writers: Dict[str, "_Writer"] = {}
+_listeners: List[Callable[[str], None]] = []
+_bytes = 0
+_lock = threading.Lock()
+
+
+def on_change(fn: Callable[[str], None]) -> None:
+    """Call fn(tenant_id) after a tenant's docs change (a commit is published, or the store is dropped)."""
+    _listeners.append(fn)
+
+
+def _changed(tenant_id: str) -> None:
+    for fn in _listeners:
+        fn(tenant_id)
+
+
+def _lock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:             # LK_LOCK gives up after ~10 s; keep waiting like flock
+            pass
+
+
+def _unlock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _Writer:
+    """Re-entrant lock that excludes a tenant's other writers, in this process and in others.
+
+    Threads queue on an RLock; the outermost holder also takes an exclusive lock
+    on VEC_DIR/.locks/<tenant>.lock. The lock file lives outside the tenant dir
+    so that delete() removing the dir doesn't hand waiters a different file.
+    """
+
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self) -> "_Writer":
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                path = os.path.join(VEC_DIR, ".locks", f"{self.tenant_id}.lock")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(path, "a+b")
+                try:
+                    _lock_file(f)
+                except BaseException:
+                    f.close()
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+            self._file = f
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            f, self._file = self._file, None
+            try:
+                _unlock_file(f)
+            finally:
+                f.close()
+        self._lock.release()
+
+
+def writer(tenant_id: str) -> _Writer:
+    """The tenant's write lock. Hold it from taking a Draft until its commit is published.
+
+    Writers for one tenant run one at a time, across worker processes too;
+    readers never take it.
+    """
+    with _lock:
+        w = _writers.get(tenant_id)
+        if w is None:
+            w = _writers[tenant_id] = _Writer(tenant_id)
+        return w
+
+
+def _drop(tenant_id: str) -> None:
+    global _bytes
+    st = _stores.pop(tenant_id, None)
+    if st is not None:
+        _bytes -= st.nbytes
+
+
+def _insert(tenant_id: str, store: TenantStore) -> None:
+    global _bytes
+    _drop(tenant_id)
+    _stores[tenant_id] = store
+    _bytes += store.nbytes
+    budget = STORE_MAX_MB * 1024 * 1024
+    # evict least recently used, but always keep the store just inserted
+    while len(_stores) > 1 and (len(_stores) > STORE_MAX_TENANTS or _bytes > budget):
+        _drop(next(iter(_stores)))
+
+
+def get(tenant_id: str) -> TenantStore:
+    """Return the resident store for a tenant, loading it from disk on a miss, or
+    when another process has committed (or deleted it) since it was read."""
+    with _lock:
+        cur = _stores.get(tenant_id)
+        if cur is not None:
+            _stores.move_to_end(tenant_id)
+        version = _versions.get(tenant_id, 0)
+    if cur is not None and _stamp(tenant_id) == cur.stamp:
+        return cur
+
+    try:
+        st = load(tenant_id, reuse=cur)
+    except FileNotFoundError:
+        if cur is not None:
+            invalidate(tenant_id)
+        raise
+
+    with _lock:
+        resident = _stores.get(tenant_id)
+        if resident is not None and resident is not cur and resident.stamp == st.stamp:
+            return resident             # another thread read the same manifest first
+        # a publish/invalidate raced with our disk read: serve, but don't keep
+        if _versions.get(tenant_id, 0) == version:
+            _insert(tenant_id, st)
+    if cur is not None:
+        # the manifest was replaced since cur was read: a commit, or a delete and
+        # re-ingest, which can restart the generation numbers
+        _changed(tenant_id)
+    return st
+
+
+def publish(tenant_id: str, store: TenantStore) -> None:
+    """Atomically replace the resident store after new artifacts were written."""
+    with _lock:
+        cur = _stores.get(tenant_id)
+        if cur is not None and cur.generation > store.generation:
+            return                      # a newer generation is already being served
+        _versions[tenant_id] = _versions.get(tenant_id, 0) + 1
+        _insert(tenant_id, store)
+    _changed(tenant_id)
+
+
+def invalidate(tenant_id: str) -> None:
+    """Forget the resident store; the next get() reloads from disk."""
+    with _lock:
+        _versions[tenant_id] = _versions.get(tenant_id, 0) + 1
+        _drop(tenant_id)
+    _changed(tenant_id)
+
+
+def delete(tenant_id: str) -> None:
+    """Remove a tenant's store from disk and from the registry."""
+    with writer(tenant_id):
+        path = tenant_dir(tenant_id)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        invalidate(tenant_id)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "tenants": list(_stores.keys()),
+            "generations": {t: st.generation for t, st in _stores.items()},
+            "segments": {t: len(st.segments) for t, st in _stores.items()},
+            "bytes": _bytes,
+            "max_tenants": STORE_MAX_TENANTS,
+            "max_bytes": int(STORE_MAX_MB * 1024 * 1024),
+        }
+
+
+if __name__ == "__main__":
+    # python stores.py migrate  -> convert every JSON-layout tenant under vectorstores/
+    if sys.argv[1:2] == ["migrate"]:
+        for t in migrate_all():
+            print(f"migrated {t}")
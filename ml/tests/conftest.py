@@ -0,0 +1,30 @@
+import hashlib, os, sys
+import numpy as np
+import pytest
+
+# the sidecar modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sidecar"))
+
+import embedder  # noqa: E402
+import stores  # noqa: E402
+
+DIM = 16
+
+
+def fake_encode(texts, batch_size=None):
+    """Deterministic unit vectors, so tests need no model weights."""
+    out = np.zeros((len(texts), DIM), dtype="float32")
+    for i, text in enumerate(texts):
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "little")
+        out[i] = np.random.default_rng(seed).standard_normal(DIM)
+    return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(stores, "VEC_DIR", str(tmp_path))
+    monkeypatch.setattr(embedder, "encode", fake_encode)
+    monkeypatch.setattr(embedder, "dim", lambda: DIM)
+    yield tmp_path
+    for tenant_id in list(stores.stats()["tenants"]):
+        stores.invalidate(tenant_id)
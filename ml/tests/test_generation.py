@@ -0,0 +1,37 @@
+import pytest
+
+import generation
+import packing
+
+
+class CharTokenizer:
+    """One token per character, so counts are exact and trimming round-trips."""
+
+    def __call__(self, text, add_special_tokens=False, **kwargs):
+        return {"input_ids": [ord(c) for c in text]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids)
+
+
+@pytest.fixture
+def char_tokenizer(monkeypatch):
+    tok = CharTokenizer()
+    monkeypatch.setattr(generation, "_tok", tok)
+    monkeypatch.setattr(generation, "load_tokenizer", lambda: tok)
+    monkeypatch.setattr(generation, "_token_counts", packing.TokenCounter(generation._count_tokens))
+    return tok
+
+
+@pytest.mark.parametrize("ctx", [[], [{"title": "Helmet sizing", "question": "Size?", "answer": "Measure.", "score": 0.9}]])
+def test_maximal_question_keeps_assistant_marker(char_tokenizer, ctx):
+    prompt = generation.build_prompt("why " * generation.MAX_PROMPT_TOKENS, ctx)
+    assert len(prompt) <= generation.MAX_PROMPT_TOKENS
+    assert prompt.endswith("<|end|>\n<|assistant|>\n")
+    assert "Context:\n" in prompt
+
+
+def test_short_question_is_kept_whole(char_tokenizer):
+    prompt = generation.build_prompt("Which helmet fits a 57 cm head?", [])
+    assert "Question: Which helmet fits a 57 cm head?\n" in prompt
+    assert generation.NO_CONTEXT in prompt
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+
+import embedder
+import ingestion
+import stores
+from conftest import fake_encode
+
+
+def docs(n, price="10.00"):
+    return [{"id": f"p{i}", "title": f"Product {i}", "attributes": {"price": price, "category": "Tack"}}
+            for i in range(n)]
+
+
+def blob_bytes(tenant_id):
+    d = stores.tenant_dir(tenant_id)
+    return sum(os.path.getsize(os.path.join(d, n)) for n in os.listdir(d) if n.startswith("docs"))
+
+
+def test_reingesting_the_same_docs_keeps_the_blob_size(store_dir):
+    ingestion.upsert_documents("t", "products", docs(200))
+    first = blob_bytes("t")
+    for _ in range(5):
+        out = ingestion.upsert_documents("t", "products", docs(200))
+        assert out["computed"] == 0
+    st = stores.get("t")
+    assert blob_bytes("t") == st.blob_size == first
+    assert st.dead_bytes == 0
+    assert st.live == 200
+
+
+def test_replaced_bodies_are_compacted_away(store_dir):
+    ingestion.upsert_documents("t", "products", docs(200))
+    first = blob_bytes("t")
+    for price in ("11.00", "12.00", "13.00", "14.00"):
+        ingestion.upsert_documents("t", "products", docs(200, price))
+        st = stores.get("t")
+        assert st.dead_bytes <= ingestion.BLOB_COMPACT_RATIO * st.blob_size
+    assert st.blob_size <= 2 * first          # the previous generation may still hold the old blob
+    assert st.doc(st.row_of("p7"))["attributes"]["price"] == "14.00"
+
+
+def test_checkpoints_write_only_their_own_rows(store_dir, monkeypatch):
+    written = []
+    write_segment = stores._write_segment
+
+    def counting(*args, **kwargs):
+        seg, entry, blob = write_segment(*args, **kwargs)
+        written.append(entry["rows"])
+        return seg, entry, blob
+
+    monkeypatch.setattr(stores, "_write_segment", counting)
+    batches = ([{"id": f"p{i}", "title": f"Product {i}"} for i in range(b, b + 50)] for b in range(0, 2000, 50))
+    out = ingestion.upsert_batches("t", batches, checkpoint_docs=100)
+    assert out["checkpoints"] == 20
+    assert stores.get("t").live == 2000
+    # rewriting the whole store at each checkpoint would write 100 + 200 + ... + 2000 = 21000 rows
+    assert sum(written) <= 6 * 2000, written
+
+
+def test_a_backend_switch_reembeds_the_whole_store(store_dir, monkeypatch):
+    ingestion.upsert_documents("t", "products", docs(50))
+    assert stores.get("t").model == embedder.EMB_MODEL
+    # int8 vectors stand in as torch vectors plus a little noise
+    monkeypatch.setattr(embedder, "EMBED_BACKEND", "onnx-int8")
+    monkeypatch.setattr(embedder, "encode", lambda texts, batch_size=None: fake_encode(texts) + 0.01)
+
+    out = ingestion.upsert_documents("t", "products", docs(51)[50:])
+    st = stores.get("t")
+    assert out["computed"] == 1 and st.live == 51
+    assert st.model == embedder.model_id() != embedder.EMB_MODEL
+    rows = [st.row_of(f"p{i}") for i in range(50)]
+    want = fake_encode([ingestion._make_text_for_embedding(d) for d in docs(50)]) + 0.01
+    assert np.allclose(st.vectors_of(np.array(rows)), want)
+
+    # back on the same backend, stored vectors are reused again
+    assert ingestion.upsert_documents("t", "products", docs(50))["computed"] == 0
@@ -0,0 +1,31 @@
+import asyncio, threading
+
+import pipeline
+
+
+def test_a_cancelled_run_keeps_its_slot_until_the_task_ends():
+    stage = pipeline.Stage("test", workers=1, max_queue=0)
+    started, finish = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        finish.wait(5)
+        return "done"
+
+    async def scenario():
+        task = asyncio.ensure_future(stage.run(work))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert stage.stats()["in_flight"] == 1          # work() is still running
+        try:
+            await stage.run(work)
+            raise AssertionError("admitted past the stage's bound")
+        except pipeline.Overloaded:
+            pass
+        finish.set()
+        while stage.stats()["in_flight"]:
+            await asyncio.sleep(0.01)
+        assert await stage.run(lambda: 42) == 42
+
+    asyncio.run(scenario())
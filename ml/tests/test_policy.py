@@ -0,0 +1,48 @@
+import pytest
+
+import policy
+
+
+@pytest.fixture(autouse=True)
+def policy_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(policy, "POLICY_FILE", str(tmp_path / "tenant_policies.json"))
+    monkeypatch.setattr(policy, "_overrides", None)
+    monkeypatch.setattr(policy, "DEFAULTS", {"direct_answer": True, "direct_min_score": 0.8, "direct_min_margin": 0.1})
+
+
+def faq(i, score, question="How do I clean a saddle?"):
+    return {"id": f"f{i}", "question": question, "answer": f"answer {i}", "score": score}
+
+
+def product(i, score):
+    return {"id": f"p{i}", "title": f"Product {i}", "score": score}
+
+
+def test_a_confident_faq_hit_is_answered_directly():
+    hits = [faq(1, 0.9), product(2, 0.75)]
+    assert policy.direct_answer("t", "saddle care", hits) is hits[0]
+
+
+def test_threshold_and_margin_are_both_required():
+    assert policy.direct_answer("t", "saddle care", [faq(1, 0.79), product(2, 0.5)]) is None
+    assert policy.direct_answer("t", "saddle care", [faq(1, 0.9), product(2, 0.85)]) is None
+    policy.update("t", {"direct_min_margin": 0.01})
+    assert policy.direct_answer("t", "saddle care", [faq(1, 0.9), product(2, 0.85)])["id"] == "f1"
+
+
+def test_a_single_hit_needs_a_verbatim_question():
+    assert policy.direct_answer("t", "saddle care", [faq(1, 0.99)]) is None
+    assert policy.direct_answer("t", "how do I clean a saddle", [faq(1, 0.5)])["id"] == "f1"
+
+
+def test_the_candidate_is_the_best_dense_hit_not_the_fused_top():
+    # BM25 put the FAQ entry first, but a product is the closer dense match
+    assert policy.direct_answer("t", "saddle care", [faq(1, 0.85), product(2, 0.95), product(3, 0.6)]) is None
+    hits = [product(2, 0.7), faq(1, 0.92), product(3, 0.6)]
+    assert policy.direct_answer("t", "saddle care", hits) is hits[1]
+
+
+def test_direct_answers_can_be_turned_off():
+    policy.update("t", {"direct_answer": False})
+    assert policy.direct_answer("t", "how do I clean a saddle", [faq(1, 0.99), product(2, 0.1)]) is None
+    assert policy.direct_answer("u", "saddle care", [faq(1, 0.99), product(2, 0.1)])["id"] == "f1"
@@ -0,0 +1,163 @@
+import contextlib, multiprocessing, os, random, shutil, subprocess, sys
+from collections import OrderedDict
+import numpy as np
+import pytest
+
+import filters
+import ingestion
+import stores
+from conftest import fake_encode
+
+
+def doc(i, v=0):
+    return {"id": f"d{i}", "title": f"Item {i} word{v % 7}", "tags": [f"t{v % 3}"],
+            "attributes": {"price": str(v % 50)}}
+
+
+def files(tenant_id):
+    """(path, inode, mtime) of every file in the tenant's segment directories."""
+    root = stores.tenant_dir(tenant_id)
+    out = set()
+    for name in os.listdir(root):
+        if name.startswith("seg-"):
+            for f in os.listdir(os.path.join(root, name)):
+                st = os.stat(os.path.join(root, name, f))
+                out.add((os.path.join(name, f), st.st_ino, st.st_mtime_ns))
+    return out
+
+
+def test_a_commit_writes_only_its_own_rows(store_dir):
+    ingestion.upsert_documents("t", "products", [doc(i) for i in range(500)])
+    before = files("t")
+    ingestion.upsert_documents("t", "products", [doc(7, 1)])
+    ingestion.delete_documents("t", ["d8"])
+    st = stores.get("t")
+    assert before <= files("t")             # the first segment's files were left alone
+    assert [seg.rows for seg in st.segments] == [500, 1]
+    assert st.live == 499
+    assert st.doc(st.row_of("d7"))["tags"] == ["t1"]
+    assert st.row_of("d8") is None
+    s, rows = st.search(fake_encode([ingestion._make_text_for_embedding(doc(8))]), 3)
+    assert all(st.doc_id(int(r)) not in (None, "d8") for r in rows[0])
+
+
+def test_segments_match_a_reference(store_dir, monkeypatch):
+    monkeypatch.setattr(stores, "STORE_MERGE_FACTOR", 2.0)
+    rng = random.Random(0)
+    ingestion.upsert_documents("t", "products", [doc(0)])
+    ref = {"d0": doc(0)}
+    for step in range(60):
+        if rng.random() < 0.75:
+            batch = [doc(rng.randrange(200), rng.randrange(1000)) for _ in range(rng.choice([1, 5, 20]))]
+            ingestion.upsert_documents("t", "products", batch)
+            ref.update((d["id"], d) for d in batch)
+        else:
+            ids = [f"d{rng.randrange(200)}" for _ in range(rng.choice([1, 10]))]
+            ingestion.delete_documents("t", ids)
+            for i in ids:
+                ref.pop(i, None)
+
+        for st in (stores.get("t"), stores.load("t")):
+            assert st.live == len(ref)
+            assert {st.doc_id(r): st.doc(r) for r in st.live_rows().tolist()} == ref
+            ids = list(ref)
+            vecs = fake_encode([ingestion._make_text_for_embedding(ref[i]) for i in ids])
+            q = fake_encode([f"probe {step}"])
+            _, rows = st.search(q, 5)
+            assert {st.doc_id(int(r)) for r in rows[0] if r >= 0} == {ids[j] for j in np.argsort(-(vecs @ q[0]))[:5]}
+            mask = st.filter_mask(filters.parse({"tags": ["t1"], "attributes": {"price": {"lt": 20}}}))
+            want = {i for i, d in ref.items() if d["tags"] == ["t1"] and float(d["attributes"]["price"]) < 20}
+            assert {st.doc_id(int(r)) for r in np.flatnonzero(mask)} == want
+            lex_rows, _ = st.lexical.search("word3", 200)
+            assert {st.doc_id(int(r)) for r in lex_rows} == {i for i, d in ref.items() if "word3" in d["title"]}
+
+
+@contextlib.contextmanager
+def other_worker():
+    """Run the block against an empty registry, as a second worker process would."""
+    saved = stores._stores, stores._versions, stores._bytes
+    stores._stores, stores._versions, stores._bytes = OrderedDict(), {}, 0
+    try:
+        yield
+    finally:
+        stores._stores, stores._versions, stores._bytes = saved
+
+
+def test_get_sees_another_workers_commits(store_dir, monkeypatch):
+    ingestion.upsert_documents("t", "products", [doc(i) for i in range(10)])
+    seen = stores.get("t")
+    with other_worker():
+        ingestion.delete_documents("t", ["d4"])
+    changed = []
+    monkeypatch.setattr(stores, "_listeners", [changed.append])
+
+    st = stores.get("t")
+    assert st.generation == seen.generation + 1
+    assert st.row_of("d4") is None and st.live == 9
+    assert st.segments[0] is seen.segments[0]       # unchanged segments aren't read again
+    assert changed == ["t"]
+    assert stores.get("t") is st
+
+    shutil.rmtree(stores.tenant_dir("t"))
+    with pytest.raises(FileNotFoundError):
+        stores.get("t")
+    assert "t" not in stores.stats()["tenants"]
+
+
+def test_get_does_not_reuse_segments_of_a_deleted_store(store_dir, monkeypatch):
+    ingestion.upsert_documents("t", "products", [doc(i) for i in range(10)])
+    seen = stores.get("t")
+    with other_worker():
+        stores.delete("t")
+        ingestion.upsert_documents("t", "products", [doc(i, 1) for i in range(20, 25)])
+    changed = []
+    monkeypatch.setattr(stores, "_listeners", [changed.append])
+
+    # the re-ingested store restarts at the same generation and segment names
+    st = stores.get("t")
+    assert st.generation == seen.generation
+    assert [e["dir"] for e in st.entries] == [e["dir"] for e in seen.entries]
+    assert st.segments[0] is not seen.segments[0]
+    assert changed == ["t"]
+    assert {st.doc_id(r): st.doc(r) for r in st.live_rows().tolist()} == {f"d{i}": doc(i, 1) for i in range(20, 25)}
+    s, rows = st.search(fake_encode([ingestion._make_text_for_embedding(doc(3))]), 5)
+    assert sorted(st.doc_id(int(r)) for r in rows[0] if r >= 0) == [f"d{i}" for i in range(20, 25)]
+
+
+def _ingest_in_child(worker, batches):
+    for b in range(batches):
+        ingestion.upsert_documents("t", "products", [doc(worker * 1000 + b * 10 + i) for i in range(5)])
+        ingestion.delete_documents("t", [f"d{worker * 1000 + b * 10}"])
+
+
+def test_worker_processes_share_a_store(store_dir):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs fork, so the children inherit the test's fake embedder")
+    ingestion.upsert_documents("t", "products", [doc(0)])
+    seen = stores.get("t")
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_ingest_in_child, args=(w, 8)) for w in (1, 2, 3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0, 0, 0]
+
+    st = stores.get("t")                        # this worker's resident store is stale
+    assert st is not seen
+    want = {"d0"} | {f"d{w * 1000 + b * 10 + i}" for w in (1, 2, 3) for b in range(8) for i in range(1, 5)}
+    assert st.live == len(want)
+    assert {st.doc_id(r) for r in st.live_rows().tolist()} == want
+
+
+def test_writer_excludes_other_processes(store_dir):
+    pytest.importorskip("fcntl")
+    probe = ("import fcntl, sys\n"
+             "f = open(sys.argv[1], 'a+b')\n"
+             "fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)\n")
+    path = os.path.join(str(store_dir), ".locks", "t.lock")
+    with stores.writer("t"):
+        with stores.writer("t"):            # re-entrant within a process
+            pass
+        assert subprocess.run([sys.executable, "-c", probe, path], capture_output=True).returncode != 0
+    assert subprocess.run([sys.executable, "-c", probe, path], capture_output=True).returncode == 0